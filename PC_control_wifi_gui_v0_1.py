@@ -1,46 +1,167 @@
+import time
+LAUNCHED_AT = time.perf_counter()   # 启动计时起点，放在其余 import 之前
+
 import tkinter as tk
-from tkinter import ttk, messagebox
-import socket
+from tkinter import ttk, messagebox, filedialog
+import asyncio
+import concurrent.futures
+import os
 import threading
-import time
-from pywinauto import Application
+
+import app_state
+import control_server
+import device_link
+import device_scanner
+import discovery
+import log_pipeline
+import output_state
+import protocol
+import sequence_player
+import session_recorder
+from batch_runner import BatchRunner, Target, panel_targets
+from control_server import CommandError, ControlServer
+from device_manager import DeviceManager
+from io_loop import IoLoop
+from output_matrix import OutputMatrix
+from programmer_automation import AutomationSession, PywinautoBackend
+from send_scheduler import SendScheduler
+from ui_bridge import UiBridge
 
 # ================= 配置 =================
 DEFAULT_IP = "172.19.181.231"
 DEFAULT_PORT = 8080
-NUM_CHIPS = 6
-BITS_PER_CHIP = 8
+DEVICE_NAME = "main"            # 界面控制的设备在 DeviceManager 中的名字
+DEFAULT_SEND_WINDOW_MS = 10     # 合并发送窗口
+DEFAULT_MAX_FRAME_RATE = 50     # 每秒最多发送帧数
+DEFAULT_NUM_CHIPS = protocol.NUM_CHIPS   # 菊花链上的 595 数量，可在界面上按设备修改
+MAX_NUM_CHIPS = 4096
+MAX_HEX_LOG_CHIPS = 16          # 超过该芯片数时发送日志只记录长度，不再输出十六进制数据
+BITS_PER_CHIP = protocol.BITS_PER_CHIP
+LOG_MAX_LINES = 1000            # 通讯日志最多显示的行数，完整记录写入日志文件
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "wifi_control.log")
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wifi_control_state.json")
+HOST_HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "device_history.json")
+RUNTIME_REPORT_INTERVAL = 10.0  # 每隔多少秒在调试日志中输出线程数与界面延迟
 
 class WifiControlGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("WiFi控制器")
         self.root.geometry("1000x800")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
-        self.sock = None
-        self.is_connected = False
-        self.is_programming = False
+        # 日志可在任意线程写入，由主线程定时批量刷新到界面，完整记录写入轮转的日志文件
+        file_sink = None
+        try:
+            file_sink = log_pipeline.RotatingFileSink(LOG_FILE).start()
+        except OSError as e:
+            print(f"无法打开日志文件 {LOG_FILE}: {e}")
+        self.logger = log_pipeline.LogPipeline(max_lines=LOG_MAX_LINES, file_sink=file_sink)
+        
+        # 上次会话保存的设备地址、输出状态与各项开关
+        self.saved_state = app_state.load_state(STATE_FILE, dict(
+            app_state.DEFAULTS, ip=DEFAULT_IP, port=DEFAULT_PORT, num_chips=DEFAULT_NUM_CHIPS,
+            send_window_ms=float(DEFAULT_SEND_WINDOW_MS), max_frame_rate=float(DEFAULT_MAX_FRAME_RATE)))
+        self.startup_timing = {}
+        # 以前应答过的设备地址，扫描时优先探测 (只在主线程中读写)
+        self.host_history = device_scanner.HostHistory(HOST_HISTORY_FILE)
+        self._launch_connect = False    # 本次连接是否为启动时的自动连接 (用于统计启动到连接的耗时)
         
-        # 存储 48 个变量 (0 或 1)
-        self.bit_vars = [] 
+        self.is_connected = False       # 界面上的连接状态，只在主线程中修改
+        self.recorder = None            # 勾选“录制通讯”时的 session_recorder.SessionRecorder
         
+        # 链长 (芯片数) 在运行时设置，输出状态只保存在位掩码中
+        self.num_chips = min(max(1, self.saved_state["num_chips"]), MAX_NUM_CHIPS)
+        self.num_bits = self.num_chips * BITS_PER_CHIP
+        # 输出状态的唯一来源：带版本号的位掩码，修改后通知订阅方；界面矩阵只负责显示。
+        # 后台线程通过 output_mask / state.snapshot() 读取，不经过 Tk
+        self.state = output_state.OutputState(
+            self.num_bits, app_state.text_to_mask(self.saved_state["output_mask"]))
+        self.encoder = protocol.ChainEncoder(self.num_chips)
+        # 主线程 (手动发送、重连后重发)、I/O 事件循环线程 (合并发送调度器、控制接口)、
+        # 序列回放线程与烧录任务线程都会发送，共用编码缓冲区需要加锁
+        self._send_lock = threading.Lock()
+        # 后台线程不直接操作 Tk：结果放进队列，由主线程上唯一的周期性 after 取出执行
+        self.ui = UiBridge(self.root, log=lambda message: self.log(message, log_pipeline.ERROR))
+        # 所有 socket 与定时器 (接收、心跳、掉线重连、扫描) 都在这一个后台 I/O 事件循环上
+        self.io = IoLoop("wifi-io").start()
+        # 设备连接：所有帧都经过发送流水线 (限制在途帧数，按顺序对应 ACK，超时自动重传)；
+        # 链路空闲时才发保活帧；掉线后按带抖动的指数退避自动重连。
+        # 连接由共用上面事件循环的 DeviceManager 管理，界面目前只控制其中一台设备
+        self.devices = DeviceManager(
+            self.io,
+            on_event=lambda name, event, detail: self._on_link_event(event, detail),
+            on_result=lambda name, result: self._on_frame_result(result),
+        )
+        self.link = self.devices.add_device(DEVICE_NAME, auto_reconnect=self.saved_state["auto_reconnect"])
+        self.pipeline = self.link.pipeline
+        self.liveness = self.link.liveness
+        self.reconnector = self.link.reconnector
+        self._resync_mask = None        # 掉线前设备最后确认的输出状态
+        # 连续的勾选变化合并后再发送
+        self.scheduler = SendScheduler(
+            self._scheduled_send,
+            window=DEFAULT_SEND_WINDOW_MS / 1000.0,
+            max_rate=DEFAULT_MAX_FRAME_RATE,
+            io_loop=self.io,
+        ).start()
+        
+        # 定时序列回放，在自己的线程中按单调时钟调度，不依赖 Tk 事件循环
+        self.sequence = []
+        self._sequence_future = None    # 经控制接口启动的回放，结束时给出结果
+        self.player = sequence_player.SequencePlayer(self._play_step, on_done=self._on_player_done)
+        
+        # 外部烧录程序的自动化会话 (缓存窗口与按钮句柄)；pywinauto 推迟到窗口显示后在后台导入
+        self.programmer = AutomationSession(
+            PywinautoBackend(),
+            log=lambda message: self.log(message),
+        )
+        
+        # 烧录任务队列：切换继电器 -> 等待吸合 -> 触发烧录，触发不会被丢弃；
+        # 常驻的任务线程同时负责预加载烧录自动化
+        self.runner = BatchRunner(
+            self._switch_target,
+            self._program_target,
+            on_result=self._on_runner_result,
+            on_idle=self._on_runner_done,
+        ).start()
+
+        # 本机控制接口 (JSON over TCP)：与界面操作同一个状态存储，运行在 I/O 事件循环上
+        self.api = ControlServer(self.io, self._api_commands(), port=self.saved_state["control_port"],
+                                 log=lambda message: self.log(message, log_pipeline.DEBUG))
+
         self._init_ui()
+        self.state.subscribe(self._on_state_change)
+        self.ui.every(self.logger.flush_interval, self.logger.flush)
+        self.ui.every(RUNTIME_REPORT_INTERVAL, lambda: self._report_runtime(log_pipeline.DEBUG))
+        self.ui.start()
+        if self.saved_state["control_api"]:
+            self._start_control_api()
+        self.root.after_idle(self._on_window_shown)
         
     def _init_ui(self):
+        state = self.saved_state
         # 1. 连接设置区域
         conn_frame = ttk.LabelFrame(self.root, text="连接设置", padding="10")
         conn_frame.pack(fill="x", padx=10, pady=5)
         
         ttk.Label(conn_frame, text="从机设备 IP地址:").pack(side="left", padx=5)
         self.ip_entry = ttk.Entry(conn_frame, width=15)
-        self.ip_entry.insert(0, DEFAULT_IP)
+        self.ip_entry.insert(0, state["ip"])
         self.ip_entry.pack(side="left", padx=5)
         
         ttk.Label(conn_frame, text="端口:").pack(side="left", padx=5)
         self.port_entry = ttk.Entry(conn_frame, width=6)
-        self.port_entry.insert(0, str(DEFAULT_PORT))
+        self.port_entry.insert(0, str(state["port"]))
         self.port_entry.pack(side="left", padx=5)
         
+        # 扫描网段 (留空则自动扫描本机所在 /24 网段)
+        ttk.Label(conn_frame, text="网段:").pack(side="left", padx=5)
+        self.cidr_entry = ttk.Entry(conn_frame, width=16)
+        self.cidr_entry.insert(0, state["cidr"])
+        self.cidr_entry.pack(side="left", padx=5)
+
         # 自动搜索按钮
         self.btn_scan = ttk.Button(conn_frame, text="自动搜索", command=self.start_scan)
         self.btn_scan.pack(side="left", padx=5)
@@ -51,78 +172,241 @@ class WifiControlGUI:
         self.status_lbl = ttk.Label(conn_frame, text="状态: 未连接", foreground="red")
         self.status_lbl.pack(side="left", padx=10)
 
-        # 2. 控制矩阵区域 (6行 x 8列)
-        matrix_frame = ttk.LabelFrame(self.root, text="输出控制矩阵 (48路)", padding="10")
-        matrix_frame.pack(fill="both", expand=True, padx=10, pady=5)
-        
-        # 滚动条支持 (防止屏幕太小)
-        # highlightthickness=0 去除画布获取焦点时的黑色边框
-        canvas = tk.Canvas(matrix_frame, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(matrix_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # 生成 48 个复选框
-        for chip in range(NUM_CHIPS):
-            chip_frame = ttk.LabelFrame(scrollable_frame, text=f"芯片 #{chip + 1}", padding="5")
-            chip_frame.pack(fill="x", pady=5, padx=5)
-            
-            for bit in range(BITS_PER_CHIP):
-                global_index = chip * BITS_PER_CHIP + bit
-                var = tk.IntVar()
-                self.bit_vars.append(var)
-                
-                # 按钮样式: 选中为 "On", 未选中为 "Off"
-                btn = tk.Checkbutton(
-                    chip_frame, 
-                    text=f"Bit {bit}", 
-                    variable=var,
-                    command=lambda c=chip, b=bit: self.on_bit_change(c, b)
-                )
-                btn.pack(side="left", padx=5)
-
-            # 添加全开/全关控制
-            ttk.Separator(chip_frame, orient="vertical").pack(side="left", padx=10, fill="y")
-            ttk.Button(chip_frame, text="全开", width=4, 
-                      command=lambda c=chip: self.set_chip_bits(c, 1)).pack(side="left", padx=2)
-            ttk.Button(chip_frame, text="全关", width=4, 
-                      command=lambda c=chip: self.set_chip_bits(c, 0)).pack(side="left", padx=2)
+        # 录制本次连接的全部收发数据 (连接时生效)
+        self.record_var = tk.IntVar(value=int(state["record"]))
+        ttk.Checkbutton(conn_frame, text="录制通讯", variable=self.record_var).pack(side="left", padx=5)
+
+        self.auto_connect_var = tk.IntVar(value=int(state["auto_connect"]))
+        ttk.Checkbutton(conn_frame, text="启动时自动连接", variable=self.auto_connect_var).pack(side="left", padx=5)
+
+        self.auto_reconnect_var = tk.IntVar(value=int(state["auto_reconnect"]))
+        ttk.Checkbutton(conn_frame, text="掉线自动重连", variable=self.auto_reconnect_var,
+                        command=self._apply_auto_reconnect).pack(side="left", padx=5)
+
+        # 菊花链长度 (连接时生效，未连接时修改立即重建矩阵)
+        ttk.Label(conn_frame, text="芯片数:").pack(side="left", padx=(10, 2))
+        self.chips_var = tk.StringVar(value=str(self.num_chips))
+        chips_box = ttk.Spinbox(conn_frame, from_=1, to=MAX_NUM_CHIPS, width=5,
+                                textvariable=self.chips_var, command=self._apply_num_chips)
+        chips_box.pack(side="left", padx=2)
+        chips_box.bind("<Return>", lambda e: self._apply_num_chips())
+
+        # 2. 控制矩阵区域 (每片一行 x 8列，单个 Canvas 绘制，只渲染可见的行)
+        self.matrix_frame = ttk.LabelFrame(self.root, padding="10")
+        self.matrix_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.matrix = OutputMatrix(self.matrix_frame, self.num_chips, BITS_PER_CHIP,
+                                   on_toggle=self.on_bit_change, on_chip=self.set_chip_bits)
+        self.matrix.pack(fill="both", expand=True)
+        self.matrix.set_mask(self.output_mask)
+        self._update_matrix_title()
 
         # 3. 操作区域
         action_frame = ttk.Frame(self.root, padding="10")
         action_frame.pack(fill="x", padx=10, pady=5)
         
-        self.auto_send_var = tk.BooleanVar(value=True)
+        self.auto_send_var = tk.BooleanVar(value=state["auto_send"])
         ttk.Checkbutton(action_frame, text="自动发送", variable=self.auto_send_var).pack(side="left", padx=10)
         
-        self.auto_program_var = tk.BooleanVar(value=True)
+        self.auto_program_var = tk.BooleanVar(value=state["auto_program"])
         ttk.Checkbutton(action_frame, text="自动烧录", variable=self.auto_program_var).pack(side="left", padx=10)
         
         ttk.Button(action_frame, text="立即发送数据", command=self.send_data).pack(side="left", padx=10)
         ttk.Button(action_frame, text="全选", command=self.select_all).pack(side="left", padx=5)
         ttk.Button(action_frame, text="全清", command=self.clear_all).pack(side="left", padx=5)
+        ttk.Button(action_frame, text="撤销", command=self.undo).pack(side="left", padx=5)
+        ttk.Button(action_frame, text="重做", command=self.redo).pack(side="left", padx=5)
+        self.root.bind("<Control-z>", lambda e: self.undo())
+        self.root.bind("<Control-y>", lambda e: self.redo())
+
+        # 合并发送设置
+        ttk.Label(action_frame, text="合并窗口(ms):").pack(side="left", padx=(20, 2))
+        self.send_window_var = tk.StringVar(value=f"{state['send_window_ms']:g}")
+        window_box = ttk.Spinbox(action_frame, from_=0, to=200, increment=5, width=5,
+                                 textvariable=self.send_window_var, command=self._apply_send_settings)
+        window_box.pack(side="left", padx=2)
+        ttk.Label(action_frame, text="最大帧率:").pack(side="left", padx=(10, 2))
+        self.max_rate_var = tk.StringVar(value=f"{state['max_frame_rate']:g}")
+        rate_box = ttk.Spinbox(action_frame, from_=1, to=500, increment=10, width=5,
+                               textvariable=self.max_rate_var, command=self._apply_send_settings)
+        rate_box.pack(side="left", padx=2)
+        for box in (window_box, rate_box):
+            box.bind("<Return>", lambda e: self._apply_send_settings())
+            box.bind("<FocusOut>", lambda e: self._apply_send_settings())
         
-        # 4. 日志区域
+        # 4. 序列回放区域
+        seq_frame = ttk.LabelFrame(self.root, text="序列回放", padding="5")
+        seq_frame.pack(fill="x", padx=10, pady=5)
+
+        ttk.Button(seq_frame, text="加载序列...", command=self.load_sequence).pack(side="left", padx=5)
+        self.btn_play = ttk.Button(seq_frame, text="播放", command=self.play_sequence, state="disabled")
+        self.btn_play.pack(side="left", padx=5)
+        self.btn_stop_seq = ttk.Button(seq_frame, text="停止", command=self.stop_sequence, state="disabled")
+        self.btn_stop_seq.pack(side="left", padx=5)
+        self.seq_lbl = ttk.Label(seq_frame, text="未加载序列")
+        self.seq_lbl.pack(side="left", padx=10)
+
+        # 5. 批量烧录区域
+        batch_frame = ttk.LabelFrame(self.root, text="批量烧录", padding="5")
+        batch_frame.pack(fill="x", padx=10, pady=5)
+
+        ttk.Button(batch_frame, text="整板烧录", command=self.program_panel).pack(side="left", padx=5)
+        ttk.Button(batch_frame, text="取消烧录", command=self.cancel_programming).pack(side="left", padx=5)
+        self.batch_lbl = ttk.Label(batch_frame, text="烧录队列: 空闲")
+        self.batch_lbl.pack(side="left", padx=10)
+
+        # 6. 日志区域
         log_frame = ttk.LabelFrame(self.root, text="通讯日志", padding="5")
         log_frame.pack(fill="x", padx=10, pady=5)
         
+        self.debug_log_var = tk.IntVar(value=int(state["show_debug"]))
+        ttk.Checkbutton(log_frame, text="显示调试信息 (ACK/心跳)", variable=self.debug_log_var,
+                        command=self._apply_log_level).pack(anchor="w")
         self.log_text = tk.Text(log_frame, height=6, state="disabled")
         self.log_text.pack(fill="x")
+        # 日志刷新挂在 UiBridge 的定时器上，不再单独 after
+        self.logger.attach(self.root, self.log_text, schedule=False)
+        self._apply_send_settings()
+        self._apply_log_level()
+
+    def _apply_send_settings(self):
+        try:
+            window_ms = float(self.send_window_var.get())
+            max_rate = float(self.max_rate_var.get())
+        except ValueError:
+            self.log("提示: 合并窗口和最大帧率必须是数字")
+            return
+        self.scheduler.configure(window=window_ms / 1000.0, max_rate=max_rate)
+
+    def _update_matrix_title(self):
+        self.matrix_frame.config(text=f"输出控制矩阵 ({self.num_bits}路)")
+
+    def _apply_num_chips(self):
+        """读取芯片数输入框；连接期间不允许修改链长，返回是否有效"""
+        try:
+            num_chips = int(self.chips_var.get())
+        except ValueError:
+            num_chips = 0
+        if not 1 <= num_chips <= MAX_NUM_CHIPS:
+            self.log(f"提示: 芯片数必须是 1–{MAX_NUM_CHIPS} 之间的整数")
+            self.chips_var.set(str(self.num_chips))
+            return False
+        if num_chips == self.num_chips:
+            return True
+        if self.is_connected:
+            self.log("提示: 请先断开连接再修改芯片数")
+            self.chips_var.set(str(self.num_chips))
+            return False
+        with self._send_lock:
+            self.encoder = protocol.ChainEncoder(num_chips)
+            self.num_chips = num_chips
+            self.num_bits = num_chips * BITS_PER_CHIP
+            self.state.resize(self.num_bits)
+        self.matrix.set_num_chips(num_chips)
+        self.matrix.set_mask(self.output_mask)
+        self._update_matrix_title()
+        frames = len(self.encoder.frames)
+        fmt = f"CMD 0x03, 每次更新 {frames} 帧 {self.encoder.frame_bytes} 字节" if self.encoder.extended else "CMD 0x01"
+        self.log(f"芯片数已设置为 {num_chips} ({self.num_bits} 路, {fmt})")
+        return True
+
+    @property
+    def output_mask(self):
+        """当前输出状态 (只读，修改经由 self.state)"""
+        return self.state.mask
+
+    def _on_state_change(self, change):
+        """输出状态变化 (任意线程)：刷新矩阵并推送给控制接口的订阅方；回放期间不逐步刷新，结束后一次同步"""
+        if change.source != output_state.SOURCE_SEQUENCE:
+            self.ui.call(self._refresh_matrix)
+        self.api.publish("state", {
+            "version": change.version,
+            "mask": control_server.format_mask(change.mask),
+            "changed": control_server.format_mask(change.changed),
+            "source": change.source,
+        })
 
-    def log(self, message):
-        self.log_text.config(state="normal")
-        self.log_text.insert("end", f"{time.strftime('%H:%M:%S')} - {message}\n")
-        self.log_text.see("end")
-        self.log_text.config(state="disabled")
+    def _post(self, callback, *args):
+        """在 Tk 主线程中执行 callback (后台线程经 UiBridge 的队列转交)"""
+        self.ui.call(callback, *args)
+
+    def _report_runtime(self, level=log_pipeline.INFO):
+        """输出线程数与界面事件循环延迟"""
+        stats = self.ui.stats()
+        names = sorted(t.name for t in threading.enumerate())
+        self.log(f"运行状态: 线程 {len(names)} 个 ({', '.join(names)}), "
+                 f"界面延迟 平均 {stats['lag_avg_ms']:.1f} ms / P99 {stats['lag_p99_ms']:.1f} ms / "
+                 f"最大 {stats['lag_max_ms']:.1f} ms, 回调排队 平均 {stats['delay_avg_ms']:.1f} ms / "
+                 f"最大 {stats['delay_max_ms']:.1f} ms, 最多积压 {stats['max_backlog']} 个", level)
+
+    def log(self, message, level=log_pipeline.INFO):
+        """写一条日志 (任意线程均可直接调用)"""
+        self.logger.log(message, level)
+
+    def _apply_log_level(self):
+        self.logger.set_level(log_pipeline.DEBUG if self.debug_log_var.get() else log_pipeline.INFO)
+
+    def _on_window_shown(self):
+        """窗口第一次显示后：报告启动耗时，后台预加载烧录自动化，自动连接上次的设备"""
+        self.startup_timing["window"] = time.perf_counter() - LAUNCHED_AT
+        self.log(f"启动耗时: 窗口显示 {self.startup_timing['window'] * 1000:.0f} ms")
+        if self.auto_program_var.get():
+            self.runner.call(self._warm_up_programmer)
+        if self.auto_connect_var.get() and self.ip_entry.get().strip():
+            self.log("自动连接上次使用的设备...")
+            self._launch_connect = True
+            self.connect()
+
+    def _warm_up_programmer(self):
+        elapsed = self.programmer.warm_up()
+        self.log(f"烧录自动化已在后台加载 ({elapsed * 1000:.0f} ms)", log_pipeline.DEBUG)
+
+    def _save_state(self):
+        """保存当前设备地址、输出状态与各项开关，下次启动时恢复 (主线程调用)"""
+        try:
+            port = int(self.port_entry.get().strip())
+        except ValueError:
+            port = self.saved_state["port"]
+        try:
+            send_window_ms = float(self.send_window_var.get())
+            max_frame_rate = float(self.max_rate_var.get())
+        except ValueError:
+            send_window_ms = self.saved_state["send_window_ms"]
+            max_frame_rate = self.saved_state["max_frame_rate"]
+        self.saved_state.update(
+            ip=self.ip_entry.get().strip(),
+            port=port,
+            cidr=self.cidr_entry.get().strip(),
+            num_chips=self.num_chips,
+            output_mask=app_state.mask_to_text(self.output_mask),
+            auto_send=bool(self.auto_send_var.get()),
+            auto_program=bool(self.auto_program_var.get()),
+            record=bool(self.record_var.get()),
+            show_debug=bool(self.debug_log_var.get()),
+            send_window_ms=send_window_ms,
+            max_frame_rate=max_frame_rate,
+            auto_connect=bool(self.auto_connect_var.get()),
+            auto_reconnect=bool(self.auto_reconnect_var.get()),
+        )
+        try:
+            app_state.save_state(STATE_FILE, self.saved_state)
+        except OSError as e:
+            self.log(f"无法保存会话状态: {e}", log_pipeline.WARNING)
+
+    def on_close(self):
+        self._save_state()
+        if self.is_connected or self.reconnector.active:
+            self.disconnect()
+        self._report_runtime()
+        self.api.stop()
+        self.player.cancel()
+        self.runner.stop()
+        self.devices.close()
+        self.scheduler.stop()
+        self.io.stop()
+        self.ui.stop()
+        self.logger.flush()
+        self.logger.close()
+        self.root.destroy()
 
     def start_scan(self):
         """启动设备扫描"""
@@ -132,100 +416,119 @@ class WifiControlGUI:
             messagebox.showerror("错误", "端口必须是数字")
             return
             
+        cidr = self.cidr_entry.get().strip()
+
         self.btn_scan.config(state="disabled")
-        self.log(f"开始扫描局域网内开放端口 {port} 的设备...")
-        threading.Thread(target=self._scan_thread, args=(port,), daemon=True).start()
-
-    def _scan_thread(self, port):
-        # 1. 获取本机 IP 所在的网段
-        local_ip = self._get_local_ip()
-        if not local_ip:
-            self.root.after(0, lambda: self.log("无法获取本机IP，扫描失败"))
-            self.root.after(0, lambda: self.btn_scan.config(state="normal"))
+        self.log("开始搜索设备 (UDP 广播发现)...")
+        known = self.host_history.recent(port)
+        future = self.io.submit(self._scan(port, cidr, known))
+        future.add_done_callback(lambda f: self.ui.post(self._on_scan_done, f))
+
+    async def _scan(self, port, cidr, known=()):
+        """在 I/O 事件循环中运行：先广播发现，无应答时再扫描网段；发现的设备立即交给界面"""
+        # 枚举本地接口在线程池中进行 (可能要解析主机名)，不阻塞事件循环
+        interfaces = await device_scanner.local_interfaces_async()
+
+        # 1. 每个本地接口广播一个探测包，从机直接报告身份、端口与芯片数
+        discovered = []
+
+        def on_discovered(device):
+            discovered.append(device)
+            self.ui.post(self._on_device_discovered, device, len(discovered) == 1)
+
+        start = time.perf_counter()
+        devices = await discovery.discover_async(targets=discovery.default_targets(interfaces),
+                                                 default_port=port, on_found=on_discovered)
+        if devices:
+            self.log(f"广播发现完成: 共找到 {len(devices)} 台设备，"
+                     f"首个应答 {devices[0].latency * 1000:.1f} ms，总耗时 {time.perf_counter() - start:.2f}s")
             return
-        
-        base_ip = ".".join(local_ip.split(".")[:-1])
-        self.root.after(0, lambda: self.log(f"本机IP: {local_ip}, 扫描网段: {base_ip}.1-254"))
-        
-        found_ip = None
-        lock = threading.Lock()
-        threads = []
-        
-        # 扫描函数
-        def check_ip(ip):
-            nonlocal found_ip
-            if found_ip: return
-            
-            # 尝试连接，增加重试机制和更合理的超时
-            for timeout in [0.2, 0.4]: # 第一次 0.2s，失败重试 0.4s
-                if found_ip: return
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(timeout) 
-                try:
-                    result = s.connect_ex((ip, port))
-                    if result == 0:
-                        with lock:
-                            if not found_ip:
-                                found_ip = ip
-                        s.close()
-                        return # 成功找到
-                except:
-                    pass
-                finally:
-                    s.close()
-
-        # 启动 254 个线程
-        # 优化启动策略：分批启动，避免瞬间拥塞
-        active_threads = []
-        for i in range(1, 255):
-            if found_ip: break
-            
-            target_ip = f"{base_ip}.{i}"
-            if target_ip == local_ip: continue 
-            
-            t = threading.Thread(target=check_ip, args=(target_ip,))
-            t.start()
-            active_threads.append(t)
-            
-            # 每启动 20 个线程等待一下，给网络喘息机会
-            if len(active_threads) % 20 == 0:
-                time.sleep(0.1)
-            
-        # 等待结果
-        # 最多等待 10 秒
-        for _ in range(100): 
-            if found_ip: break
-            if not any(t.is_alive() for t in active_threads): break
-            time.sleep(0.1)
-            
-        if found_ip:
-            self.root.after(0, lambda: self.log(f"找到设备: {found_ip}"))
-            self.root.after(0, lambda: self.ip_entry.delete(0, "end"))
-            self.root.after(0, lambda: self.ip_entry.insert(0, found_ip))
-            # 自动连接
-            # self.root.after(0, self.connect) 
+        self.log(f"广播发现无应答，改为扫描局域网内开放端口 {port} 的设备...")
+
+        # 2. 未指定网段时，扫描每个本地接口所在的网段 (最大 /24)
+        local_ips = tuple(i.ip for i in interfaces)
+        if cidr:
+            networks = [cidr]
         else:
-            self.root.after(0, lambda: self.log("未找到设备 (请检查从机设备是否在同一网段且端口正确)"))
-            
-        self.root.after(0, lambda: self.btn_scan.config(state="normal"))
+            networks = device_scanner.local_networks(interfaces=interfaces)
+            if not networks:
+                self.log("无法获取本机IP，扫描失败")
+                return
+        self.log(f"本机IP: {', '.join(local_ips) or '未知'}, 扫描网段: {', '.join(networks)}")
+
+        neighbors = await device_scanner.read_neighbors_async()
+        found = []
+
+        def on_found(result):
+            found.append((result, time.perf_counter() - start))
+            self.ui.post(self._on_device_found, result, len(found) == 1)
+
+        start = time.perf_counter()
+        results = []
+        for network in networks:
+            # 邻居表 (ARP 缓存) 中的地址与以前应答过的地址最先探测，已知设备通常第一轮就能找到
+            try:
+                priority = device_scanner.rank_hosts(network, exclude=local_ips, neighbors=neighbors,
+                                                     known=known)
+            except ValueError as e:
+                self.log(f"网段格式错误: {e}")
+                return
+            if priority:
+                self.log(f"{network}: 优先探测 {len(priority)} 个地址 "
+                         f"(邻居表 {len(neighbors)} 个, 历史记录 {len(known)} 个)")
+
+            # 3. 在同一个事件循环中并发扫描，每发现一台设备立即回报界面
+            results += await device_scanner.scan_async(network, port, on_found=on_found, exclude=local_ips,
+                                                       priority=priority)
+        elapsed = time.perf_counter() - start
+
+        if results:
+            self.log(f"扫描完成: 共找到 {len(results)} 台设备，首台 {found[0][1] * 1000:.0f} ms，"
+                     f"总耗时 {elapsed:.2f}s")
+        else:
+            self.log("未找到设备 (请检查从机设备是否在同一网段且端口正确)")
 
-    def _get_local_ip(self):
+    def _on_scan_done(self, future):
+        self.btn_scan.config(state="normal")
+        error = future.exception()
+        if error is not None:
+            self.log(f"扫描失败: {error}", log_pipeline.ERROR)
+        self._save_host_history()
+
+    def _save_host_history(self):
         try:
-            # 创建一个 UDP socket 连接到外网 IP 来获取本机 IP
-            # 不需要实际发送数据
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return socket.gethostbyname(socket.gethostname())
+            self.host_history.save()
+        except OSError as e:
+            self.log(f"无法保存设备历史记录: {e}", log_pipeline.WARNING)
+
+    def _on_device_found(self, result, first):
+        self.log(f"找到设备: {result.ip} (响应 {result.latency * 1000:.1f} ms)")
+        self.host_history.record(result.ip, result.port)
+        # 第一个应答的设备自动填入 IP 输入框
+        if first:
+            self.ip_entry.delete(0, "end")
+            self.ip_entry.insert(0, result.ip)
+
+    def _on_device_discovered(self, device, first):
+        chips = f"{device.chips} 片" if device.chips else "芯片数未知"
+        self.log(f"找到设备: {device.ip}:{device.port} [{device.device_id or '未命名'}, {chips}, "
+                 f"固件 {device.firmware or '未知'}] (响应 {device.latency * 1000:.1f} ms)")
+        self.host_history.record(device.ip, device.port)
+        # 第一个应答的设备自动填入地址，并按设备报告的芯片数设置链长
+        if first:
+            self.ip_entry.delete(0, "end")
+            self.ip_entry.insert(0, device.ip)
+            self.port_entry.delete(0, "end")
+            self.port_entry.insert(0, str(device.port))
+            if device.chips and not self.is_connected:
+                self.chips_var.set(str(device.chips))
+                self._apply_num_chips()
 
     def toggle_connection(self):
-        if not self.is_connected:
-            self.connect()
-        else:
+        if self.is_connected or self.reconnector.active:
             self.disconnect()
+        else:
+            self.connect()
 
     def connect(self):
         ip = self.ip_entry.get().strip()
@@ -234,381 +537,614 @@ class WifiControlGUI:
         except ValueError:
             messagebox.showerror("错误", "端口必须是数字")
             return
-            
+        if not self._apply_num_chips():
+            return
+
         self.btn_connect.config(state="disabled")
         self.log(f"正在连接到 {ip}:{port}...")
-        
-        # 使用线程避免界面卡顿
-        threading.Thread(target=self._connect_thread, args=(ip, port), daemon=True).start()
+        if self.record_var.get():
+            self._start_recording(ip, port)
+        self._apply_auto_reconnect()
 
-    def _connect_thread(self, ip, port):
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            
-            # 恢复默认的超时设置，不依赖底层 TCP KeepAlive
-            self.sock.settimeout(2.0) 
-            self.sock.connect((ip, port))
-            
-            self.is_connected = True
-            # 初始化最后活跃时间
-            self.last_active_time = time.time()
-            
-            self.root.after(0, self._update_ui_connected)
-            
-            # 启动接收/监控线程
-            threading.Thread(target=self._receive_thread, daemon=True).start()
-            
-            # 启动应用层看门狗线程
-            threading.Thread(target=self._watchdog_thread, daemon=True).start()
-            
-        except Exception as e:
-            self.root.after(0, lambda: self.log(f"连接失败: {e}"))
-            self.root.after(0, lambda: self.btn_connect.config(state="normal"))
-
-    def _receive_thread(self):
-        """后台接收线程，用于监控连接状态和接收数据"""
-        self.root.after(0, lambda: self.log("系统提示: 接收监控线程已启动"))
-        while self.is_connected and self.sock:
-            try:
-                # 阻塞读取，如果对方断开，recv 会返回空字节
-                try:
-                    data = self.sock.recv(1024)
-                except socket.timeout:
-                    continue # 超时没数据，继续循环检测状态
-                except (OSError, ConnectionResetError, ConnectionAbortedError) as e:
-                     # 捕获各种连接异常
-                     if self.is_connected:
-                         self.root.after(0, lambda e=e: self.log(f"连接异常中断: {e}"))
-                         self.root.after(0, lambda: messagebox.showwarning("掉线警告", "连接异常断开！\n(检测到 从机设备 或网络中断)"))
-                         self.root.after(0, self.disconnect)
-                     break
-                
-                if not data:
-                    # 返回空数据，说明对方关闭了连接
-                    if self.is_connected:
-                        self.root.after(0, lambda: self.log("检测到服务器已断开连接 (从机设备掉线)"))
-                        self.root.after(0, lambda: messagebox.showwarning("掉线警告", "连接已断开！\n(检测到 从机设备 或网络中断)"))
-                        self.root.after(0, self.disconnect)
-                    break
-                
-                # 处理接收到的数据 (例如 ACK)
-                self.last_active_time = time.time() # 更新最后活跃时间
-                
-                if b'\x06' in data:
-                     self.root.after(0, lambda: self.log("收到 ACK (成功)"))
-                else:
-                     hex_str = " ".join([f"{b:02X}" for b in data])
-                     self.root.after(0, lambda: self.log(f"收到数据: {hex_str}"))
-                     
-            except Exception as e:
-                # 其他未预期的错误
-                if self.is_connected: # 只有在认为连接时才报错
-                    self.root.after(0, lambda: self.log(f"连接监控错误: {e}"))
-                    self.root.after(0, lambda: messagebox.showwarning("掉线警告", f"连接监控错误！\n{e}"))
-                    self.root.after(0, self.disconnect)
-                break
-
-    def _watchdog_thread(self):
-        """应用层看门狗：监控最后一次收到数据的时间"""
-        self.root.after(0, lambda: self.log("系统提示: 连接看门狗已启动 (超时阈值: 6秒)"))
-        while self.is_connected:
-            time.sleep(1.0)
-            if not self.is_connected: break
-            
-            now = time.time()
-            diff = now - self.last_active_time
-            
-            # 策略：
-            # 1. 如果超过 2 秒没收到数据，主动发一个包探测一下
-            # 2. 如果超过 6 秒没收到数据，判定为掉线
-            
-            if diff > 6.0:
-                self.root.after(0, lambda: self.log(f"系统提示: 心跳超时 ({int(diff)}s > 6s)"))
-                self.root.after(0, lambda: messagebox.showwarning("掉线警告", "连接超时！\n(超过6秒未收到设备响应)"))
-                self.root.after(0, self.disconnect)
-                break
-                
-            if diff > 2.0:
-                # 尝试静默发送当前状态，触发 从机设备 回复 ACK
-                self.send_data(silent=True)
+        # 连接在 I/O 事件循环中进行，界面不等待
+        future = self.devices.connect(DEVICE_NAME, (ip, port))
+        future.add_done_callback(lambda f: self.ui.post(self._on_connect_done, f))
+
+    def _on_connect_done(self, future):
+        error = future.exception()
+        if error is not None:
+            self.log(f"连接失败: {error}")
+            self._launch_connect = False
+            self.btn_connect.config(state="normal")
+            self._stop_recording()
+            return
+        self.is_connected = True
+        self.log("系统提示: 自适应心跳已启动")
+        self._update_ui_connected()
+
+    def _apply_auto_reconnect(self):
+        self.link.auto_reconnect = bool(self.auto_reconnect_var.get())
+
+    def _on_link_event(self, event, detail):
+        """DeviceLink 的事件 (I/O 事件循环线程)：日志直接写，状态变化交给主线程"""
+        if event not in (device_link.ACK, device_link.NAK, device_link.RX):
+            self.api.publish("link", {"event": event, "detail": detail})
+        if event == device_link.ACK:
+            # ACK (包括保活帧的 ACK) 数量很多，只在调试级别记录
+            if detail == 1:
+                self.log("收到 ACK (成功)", log_pipeline.DEBUG)
+            else:
+                self.log(f"收到 ACK x{detail} (成功)", log_pipeline.DEBUG)
+        elif event == device_link.NAK:
+            self.log(f"收到 NAK x{detail} (从机拒绝了数据帧)", log_pipeline.WARNING)
+        elif event == device_link.RX:
+            self._log_rx_events(detail)
+        elif event == device_link.LOST:
+            self.ui.post(self._on_link_lost, detail)
+        elif event == device_link.RETRY:
+            self.ui.post(self._on_reconnect_attempt, *detail)
+        elif event == device_link.RECOVERED:
+            self.ui.post(self._on_reconnected, *detail)
+
+    def _log_rx_events(self, events):
+        for event in events:
+            if event.kind == protocol.EVT_STATUS:
+                self.log(f"收到状态帧: CMD {event.cmd:02X}, 数据 {event.data.hex(' ').upper()}")
+            else:
+                self.log(f"收到数据: {event.data.hex(' ').upper()}")
+
+    def _on_link_lost(self, reason):
+        """链路中断 (主线程)：不再弹窗；勾选了掉线自动重连时 DeviceLink 已在后台按退避重试"""
+        if not self.is_connected:
+            return
+        self.log(f"连接中断: {reason}", log_pipeline.WARNING)
+        if not self.link.auto_reconnect:
+            self.disconnect()
+            self.status_lbl.config(text=f"状态: 已掉线 ({reason})", foreground="red")
+            return
+        # 记下设备最后确认的状态，重连后先恢复它
+        self._resync_mask = self.scheduler.acked_mask
+        self.is_connected = False
+        self.scheduler.reset()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.mark(f"掉线: {reason}")
+        self.btn_connect.config(text="停止重连", state="normal")
+        self.status_lbl.config(text="状态: 掉线，正在重连...", foreground="orange")
+        self.log("开始自动重连")
+
+    def _on_reconnect_attempt(self, attempt, delay, error):
+        if not self.reconnector.active:
+            return
+        detail = f": {error}" if error else ""
+        self.log(f"第 {attempt} 次重连失败{detail}，{delay:.1f}s 后重试")
+        self.status_lbl.config(text=f"状态: 重连中 (已掉线 {self.reconnector.outage() or 0:.0f}s, 已重试 {attempt} 次)",
+                               foreground="orange")
+
+    def _on_reconnected(self, outage, attempts):
+        if not self.link.connected:
+            return # 恢复后又已掉线或已主动断开
+        self.is_connected = True
+        self.btn_connect.config(text="断开连接", state="normal")
+        self.status_lbl.config(text="状态: 已连接", foreground="green")
+        self.log(f"连接已恢复: 中断 {outage * 1000:.0f} ms, 重连 {attempts} 次")
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.mark(f"重新连接 (中断 {outage:.2f}s)")
+        self._resync_outputs()
+
+    def _resync_outputs(self):
+        """重连后恢复输出：先重发掉线前设备最后确认的状态，再补发掉线期间的改动"""
+        confirmed, self._resync_mask = self._resync_mask, None
+        if confirmed is None:
+            # 掉线前没有任何状态被确认，按新连接处理
+            self.send_data()
+            return
+        if self._send_frame(confirmed, silent=True):
+            self.scheduler.mark_sent(confirmed)
+            self.log("已重发掉线前最后确认的输出状态")
+        if confirmed != self.output_mask:
+            if self.auto_send_var.get():
+                self.scheduler.request(self.output_mask)
+            else:
+                self.log("掉线期间修改的输出尚未发送 (未勾选自动发送)")
 
     def _update_ui_connected(self):
         self.btn_connect.config(text="断开连接", state="normal")
         self.status_lbl.config(text="状态: 已连接", foreground="green")
         self.log("连接成功！")
+        if self._launch_connect:
+            self._launch_connect = False
+            self.startup_timing["connected"] = time.perf_counter() - LAUNCHED_AT
+            self.log(f"启动耗时: 窗口显示 {self.startup_timing['window'] * 1000:.0f} ms, "
+                     f"启动到连接 {self.startup_timing['connected'] * 1000:.0f} ms")
+        self._save_state()
+        try:
+            self.host_history.record(self.ip_entry.get().strip(), int(self.port_entry.get().strip()))
+        except ValueError:
+            pass
+        self._save_host_history()
         # 连接后立即发送当前状态
         self.send_data()
 
     def disconnect(self):
-        if self.sock:
-            try:
-                self.sock.close()
-            except:
-                pass
-        self.sock = None
+        if self.reconnector.active:
+            self.log("已停止自动重连")
+        self.link.close()
         self.is_connected = False
         self.btn_connect.config(text="连接", state="normal")
         self.status_lbl.config(text="状态: 未连接", foreground="red")
         self.log("已断开连接")
+        stats = self.scheduler.stats()
+        self.log(f"发送统计: 请求 {stats['requests']} 次, 实际发送 {stats['frames_sent']} 帧, "
+                 f"合并 {stats['coalesced']} 次, 丢弃重复 {stats['deduped']} 帧, 限速 {stats['rate_limited']} 次")
+        stats = self.pipeline.stats()
+        srtt = "-" if stats["srtt_ms"] is None else f"{stats['srtt_ms']:.1f} ms"
+        self.log(f"确认统计: 已确认 {stats['delivered']} 帧, 失败 {stats['failed']} 帧, "
+                 f"重传 {stats['retransmits']} 次, NAK {stats['naks']} 次, 平滑 RTT {srtt}")
+        stats = self.liveness.stats()
+        detect = "-" if stats["detection_time_ms"] is None else f"{stats['detection_time_ms']:.0f} ms"
+        self.log(f"心跳统计: 探测 {stats['probes_sent']} 次, 保活流量 {stats['keepalive_bps']:.1f} B/s, "
+                 f"探测间隔 {stats['probe_interval_ms']:.0f} ms, 掉线阈值 {stats['dead_timeout_ms']:.0f} ms, "
+                 f"掉线发现耗时 {detect}")
+        stats = self.reconnector.stats()
+        if stats["outages"]:
+            self.log(f"重连统计: 掉线 {stats['outages']} 次, 恢复 {stats['recovered']} 次, "
+                     f"重试 {stats['attempts']} 次, 平均中断 {stats['avg_outage_ms']:.0f} ms, "
+                     f"最长中断 {stats['max_outage_ms']:.0f} ms")
+        self._report_runtime()
+        self.scheduler.reset()
+        self._stop_recording()
+
+    def _start_recording(self, ip, port):
+        """勾选了“录制通讯”时新建录制文件"""
+        path = os.path.join(RECORD_DIR, time.strftime("session_%Y%m%d_%H%M%S.wfr"))
+        try:
+            recorder = session_recorder.SessionRecorder(path)
+        except OSError as e:
+            self.log(f"无法创建录制文件: {e}", log_pipeline.WARNING)
+            return
+        recorder.mark(f"连接 {ip}:{port}")
+        self.recorder = self.link.recorder = recorder
+        self.log(f"开始录制通讯: {path}")
+
+    def _stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        self.link.recorder = None
+        if recorder is None:
+            return
+        recorder.mark("断开连接")
+        recorder.close()
+        self.log(f"录制已保存: {recorder.path} ({recorder.records} 条记录, "
+                 f"发送 {recorder.tx_bytes} 字节, 接收 {recorder.rx_bytes} 字节)")
 
     def on_bit_change(self, chip_index=None, bit_index=None):
+        if chip_index is not None and bit_index is not None:
+            idx = chip_index * BITS_PER_CHIP + bit_index
+            self.state.toggle(idx)
+
         if self.is_connected and self.auto_send_var.get():
-            self.send_data()
+            self.scheduler.request(self.output_mask)
         
         # 自动化控制逻辑：任意芯片的任意 Bit 被选中时，触发烧录
         if chip_index is not None and bit_index is not None:
             # 获取该位的状态
-            idx = chip_index * BITS_PER_CHIP + bit_index
-            if self.bit_vars[idx].get() == 1:
+            if self.output_mask >> idx & 1:
                 # 检查是否开启了自动烧录
                 if not self.auto_program_var.get():
                     return
 
-                # --- 防并发与强制发送逻辑 ---
-                if getattr(self, 'is_programming', False):
-                    self.log("提示: 上一次烧录任务尚未完成，忽略本次触发")
-                    return
-
                 # 必须已连接才能烧录
                 if not self.is_connected:
                     messagebox.showwarning("操作失败", "设备未连接，无法触发烧录！")
                     return
 
-                # 无论是否勾选自动发送，触发烧录前都强制发送一次数据
-                # 确保继电器状态绝对正确，并在日志中留下记录
-                self.log("提示: 准备烧录，强制同步设备状态...")
-                self.send_data()
-                
-                self.is_programming = True
-                self.trigger_programmer()
+                # 上一次烧录尚未完成时排队等待，不再丢弃本次触发
+                pending = self.runner.submit(Target(chip_index, bit_index))
+                if self.runner.current is not None or pending > 1:
+                    self.log(f"提示: 烧录任务进行中，芯片 #{chip_index + 1} Bit {bit_index} 已加入队列")
+                self._update_batch_label()
+
+    def program_panel(self):
+        """整板烧录：依次只接通每一路并烧录"""
+        if not self.is_connected:
+            messagebox.showwarning("操作失败", "设备未连接，无法触发烧录！")
+            return
+        self.runner.reset_stats()
+        targets = panel_targets(self.num_chips, BITS_PER_CHIP)
+        self.runner.submit(targets)
+        self.log(f"开始整板烧录，共 {len(targets)} 个目标")
+        self._update_batch_label()
+
+    def cancel_programming(self):
+        dropped = self.runner.cancel()
+        self.programmer.cancel() # 不再等待当前这次烧录的结果
+        self.log(f"已取消烧录任务 (丢弃排队 {dropped} 个)")
+        self._update_batch_label()
+
+    def _switch_target(self, target):
+        """烧录任务线程中调用：切换继电器并等待设备确认"""
+        if not self.is_connected:
+            return False
+        if target.mask is not None:
+            self.state.set_mask(target.mask, source=output_state.SOURCE_PROGRAM, record=False)
+        # 无论是否勾选自动发送，触发烧录前都强制发送一次数据
+        # 确保继电器状态绝对正确，并在日志中留下记录
+        self.log(f"提示: 准备烧录芯片 #{target.chip + 1} Bit {target.bit}，强制同步设备状态...")
+        mask = self.output_mask
+        future = self._send_frame(mask)
+        if not future:
+            return False
+        self.scheduler.mark_sent(mask)
+        try:
+            return future.result(timeout=5.0).delivered
+        except Exception:
+            return False
+
+    def _program_target(self, target):
+        self.ui.post(self._update_batch_label)
+        return self.trigger_programmer()
+
+    def _on_runner_result(self, result):
+        """烧录任务线程中调用"""
+        t = result.target
+        self.api.publish("program", {"chip": t.chip, "bit": t.bit, "passed": result.passed,
+                                     "attempts": result.attempts, "detail": result.detail,
+                                     "duration_s": result.duration})
+        self.ui.post(self._on_program_result, result)
+
+    def _on_runner_done(self):
+        self.api.publish("program", {"idle": True, "stats": self.runner.stats()})
+        self.ui.post(self._on_runner_idle)
+
+    def _on_program_result(self, result):
+        t = result.target
+        state = "成功" if result.passed else "失败"
+        timing = ", ".join(f"{k} {v:.2f}s" for k, v in result.timings.items())
+        self.log(f"烧录{state}: 芯片 #{t.chip + 1} Bit {t.bit} (尝试 {result.attempts} 次, 用时 {result.duration:.2f}s: {timing})")
+        if not result.passed and result.detail:
+            self.log(f"失败原因: {result.detail}")
+        self._update_batch_label()
+
+    def _on_runner_idle(self):
+        stats = self.runner.stats()
+        avg = ", ".join(f"{k} {v:.2f}s" for k, v in stats["stage_avg_s"].items())
+        self.log(f"烧录队列已完成: 共 {stats['units']} 个, 成功 {stats['passed']}, 失败 {stats['failed']}, "
+                 f"UPH {stats['uph']:.0f}, 平均节拍 {stats['cycle_s']:.2f}s ({avg})")
+        self._update_batch_label()
+
+    def _update_batch_label(self):
+        current = self.runner.current
+        if current is None and not self.runner.pending():
+            self.batch_lbl.config(text="烧录队列: 空闲")
+            return
+        text = f"烧录队列: 排队 {self.runner.pending()}"
+        if current is not None:
+            text += f", 正在烧录 芯片 #{current.chip + 1} Bit {current.bit}"
+        self.batch_lbl.config(text=text)
 
     def trigger_programmer(self):
-        """查找外部 APT ISP2 程序并点击 '自动编程至芯片'"""
-        def _run():
-            self.log("正在尝试触发外部烧录程序...")
-            try:
-                # 1. 连接到应用程序 (5秒超时重试)
-                app = None
-                start_time = time.time()
-                while time.time() - start_time < 5.0:
-                    try:
-                        # 优先尝试 uia
-                        app = Application(backend="uia").connect(title_re=".*APT ISP2.*", timeout=0.5)
-                        break
-                    except:
-                        try:
-                            # 回退到 win32
-                            app = Application(backend="win32").connect(title_re=".*APT ISP2.*", timeout=0.5)
-                            break
-                        except:
-                            pass
-                    time.sleep(0.5)
-                
-                if app is None:
-                    self.root.after(0, lambda: self.log("提示: 触发不成功 (5秒内未找到烧录程序)"))
-                    return
+        """触发外部 APT ISP2 程序的 '自动编程至芯片'
 
-                # 2. 找到窗口
-                dlg = app.window(title_re=".*APT ISP2.*")
-                
-                # 3. 查找并点击按钮
-                # 按钮文本可能是 "自动编程至芯片"
-                try:
-                    btn = dlg.child_window(title="自动编程至芯片", control_type="Button")
-                    if not btn.exists():
-                         # 尝试模糊匹配
-                         btn = dlg.child_window(title_re=".*自动编程.*", control_type="Button")
-                    
-                    if btn.exists():
-                        btn.click()
-                        self.root.after(0, lambda: self.log("成功点击 '自动编程至芯片'"))
-                        
-                        # --- 弹窗检测逻辑 ---
-                        # 点击后，立即检查是否有模态弹窗出现
-                        # 尝试多次检测，因为弹窗可能有一点延迟
-                        popup_found = False
-                        for _ in range(5): # 尝试 3 次，每次间隔 0.5s
-                            time.sleep(0.5)
-                            try:
-                                # 查找属于该应用程序的子窗口/弹窗
-                                # 注意：模态弹窗通常没有特定的标题，或者是 "提示"、"错误" 等
-                                # 我们可以查找所有子窗口，看是否有文本包含 "未检测到烧录器"
-                                
-                                # 获取当前活动窗口或查找特定弹窗
-                                # 这里的逻辑是：如果有一个新的顶层窗口或对话框出现
-                                dialogs = app.windows()
-                                for d in dialogs:
-                                    # 排除主窗口自己
-                                    if d.handle == dlg.handle:
-                                        continue
-                                    
-                                    # 检查弹窗内容
-                                    # 通常弹窗里有一个 Static 文本控件
-                                    try:
-                                        # 获取弹窗内的所有文本
-                                        texts = [c.window_text() for c in d.descendants(control_type="Text")]
-                                        full_text = " ".join(texts)
-                                        
-                                        if "未检测到烧录器" in full_text or "连接后重试" in full_text:
-                                            self.root.after(0, lambda t=full_text: self.log(f"!!! 警告: 检测到弹窗 !!!\n{t}"))
-                                            
-                                            # 可选：自动点击 "确定" 关闭它
-                                            ok_btn = d.child_window(title="确定", control_type="Button")
-                                            if ok_btn.exists():
-                                                ok_btn.click()
-                                                self.root.after(0, lambda: self.log("已自动关闭警告弹窗"))
-                                            
-                                            popup_found = True
-                                            break
-                                    except:
-                                        pass
-                                
-                                if popup_found:
-                                    break
-                                    
-                            except Exception:
-                                pass
-                        
-                        if popup_found:
-                            return # 如果有弹窗，说明失败了，不再抓取日志
-                        
-                        # 4. 抓取日志 (新增功能)
-                        # 延时等待烧录完成或日志刷新 (根据实际情况调整时间)
-                        time.sleep(2) 
-                        
-                        try:
-                            # 尝试获取日志内容
-                            # 策略：直接定位到 TabControl 下面的内容
-                            # "消息记录" 通常是一个 TabItem，下面的内容可能是一个 RichEdit 或 Edit
-                            log_found = False
-                            
-                            # 尝试找到 "消息记录" 这个 Tab
-                            # 注意：如果 Tab 没有被选中，有时候内容是不可见的。
-                            # 这里假设 "消息记录" 是默认选中的，或者我们尝试去点击它
-                            try:
-                                tab_item = dlg.child_window(title="消息记录", control_type="TabItem")
-                                if tab_item.exists():
-                                    tab_item.select()
-                                    time.sleep(0.5) # 等待切换
-                            except:
-                                pass # 可能没有 TabItem 结构，直接找 Edit
-
-                            # 获取主窗口下的所有 Edit 控件
-                            # 通常日志框是最大的那个文本框，或者位置靠下的
-                            edits = dlg.descendants(control_type="Edit") + dlg.descendants(control_type="Document") + dlg.descendants(control_type="Pane")
-                            
-                            # 过滤出可能是日志的控件
-                            # 我们可以通过查找父级是否包含 "消息记录" 或者通过文本特征
-                            candidate_logs = []
-                            for ctrl in edits:
-                                try:
-                                    text = ctrl.window_text()
-                                    if text and len(text.strip()) > 0:
-                                        candidate_logs.append(text)
-                                except:
-                                    pass
-                            
-                            # 如果找到多个，我们假设包含 "烧录"、"成功"、"失败" 等关键字的是目标
-                            # 或者直接取最长的那一段
-                            if candidate_logs:
-                                # 按长度排序，取最长的
-                                best_log = max(candidate_logs, key=len)
-                                self.root.after(0, lambda t=best_log: self.log(f"--- APT ISP2 消息记录 ---\n{t}\n-----------------------"))
-                                log_found = True
-                            
-                            if not log_found:
-                                self.root.after(0, lambda: self.log("未抓取到消息记录 (可能为空或未找到控件)"))
-                                
-                        except Exception as e:
-                            self.root.after(0, lambda: self.log(f"抓取日志出错: {e}"))
-
-                    else:
-                        self.root.after(0, lambda: self.log("错误: 未找到 '自动编程' 按钮"))
-                            
-                except Exception as e:
-                     self.root.after(0, lambda: self.log(f"按钮操作错误: {e}"))
-
-            except Exception as e:
-                self.root.after(0, lambda: self.log(f"自动化错误: {e}"))
-
-        # 包装器：处理延时和标志位重置
-        def _wrapper():
-            try:
-                # 延时 0.5s 等待硬件继电器吸合
-                time.sleep(0.5)
-                _run()
-            finally:
-                self.is_programming = False
+        同步执行 (由烧录任务线程调用)，返回 (是否成功, 详情)。
+        程序窗口与控件只在首次或失效时查找，之后复用缓存的句柄；
+        点击后一旦出现弹窗或日志给出结论就返回，详情为解析出的 ProgramResult。
+        """
+        self.log("正在尝试触发外部烧录程序...")
+        passed, detail = self.programmer.trigger()
+        timing = ", ".join(f"{k} {v:.2f}s" for k, v in self.programmer.last_timing.items())
+        self.log(f"烧录程序触发耗时: {timing}")
+        return passed, detail
+
+    def load_sequence(self):
+        path = filedialog.askopenfilename(
+            title="加载输出序列",
+            filetypes=[("序列文件", "*.csv *.json"), ("所有文件", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            steps = sequence_player.load(path, num_bits=self.num_bits)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            messagebox.showerror("错误", f"序列文件格式错误:\n{e}")
+            return
+        if not steps:
+            messagebox.showwarning("提示", "序列文件中没有任何步骤")
+            return
+        self.sequence = steps
+        self.seq_lbl.config(text=f"{os.path.basename(path)}: {len(steps)} 步, 时长 {steps[-1].offset:.3f}s")
+        self.btn_play.config(state="normal")
+        self.log(f"已加载序列: {path} ({len(steps)} 步)")
+
+    def play_sequence(self):
+        if not self.is_connected:
+            messagebox.showwarning("操作失败", "设备未连接，无法回放序列！")
+            return
+        if self.player.running or not self.sequence:
+            return
+        self.player.play(self.sequence)
+        self._on_sequence_started(len(self.sequence))
+
+    def _on_sequence_started(self, steps):
+        self.btn_play.config(state="disabled")
+        self.btn_stop_seq.config(state="normal")
+        self.log(f"开始回放序列 ({steps} 步)")
+
+    def stop_sequence(self):
+        self.player.cancel()
+
+    def _play_step(self, mask):
+        """回放线程中调用：直接发送，不经过合并调度 (每一步都要按时到达)"""
+        self.state.set_mask(mask, source=output_state.SOURCE_SEQUENCE, record=False)
+        if self._send_frame(mask, silent=True):
+            self.scheduler.mark_sent(mask)
+
+    def _on_player_done(self, report):
+        """回放线程中调用"""
+        summary = report.summary()
+        future, self._sequence_future = self._sequence_future, None
+        if future is not None:
+            if report.error is not None:
+                future.set_exception(CommandError(f"序列回放出错: {report.error}"))
+            else:
+                future.set_result(summary)
+        self.api.publish("sequence", summary)
+        self.ui.post(self._on_sequence_done, report)
+
+    def _on_sequence_done(self, report):
+        self.btn_play.config(state="normal" if self.sequence else "disabled")
+        self.btn_stop_seq.config(state="disabled")
+        # 回放期间不逐步刷新矩阵，结束后一次同步到最终状态
+        self._refresh_matrix()
+        s = report.summary()
+        if report.error is not None:
+            self.log(f"序列回放出错，已停止: {report.error}", log_pipeline.ERROR)
+        if not s["steps"]:
+            self.log("序列回放结束: 没有发送任何步骤")
+            return
+        state = "已取消" if s["cancelled"] else "完成"
+        self.log(f"序列回放{state}: 发送 {s['sent']} 步, 跳过 {s['skipped']} 步, 迟到 {s['late']} 步, "
+                 f"平均误差 {s['mean_error_ms']:.3f} ms, P99 {s['p99_error_ms']:.3f} ms, "
+                 f"最大 {s['max_error_ms']:.3f} ms, 抖动 {s['jitter_ms']:.3f} ms")
 
-        # 在独立线程中运行，避免卡住 GUI
-        threading.Thread(target=_wrapper, daemon=True).start()
+    def _refresh_matrix(self):
+        """按 output_mask 刷新矩阵显示 (合并为一次重绘)"""
+        self.matrix.set_mask(self.output_mask)
 
     def set_chip_bits(self, chip_index, value):
-        start_index = chip_index * BITS_PER_CHIP
-        end_index = start_index + BITS_PER_CHIP
-        for i in range(start_index, end_index):
-            self.bit_vars[i].set(value)
+        chip_mask = 0xFF << chip_index * BITS_PER_CHIP
+        if value:
+            self.state.update(set_bits=chip_mask)
+        else:
+            self.state.update(clear_bits=chip_mask)
         self.on_bit_change()
 
     def select_all(self):
-        for var in self.bit_vars:
-            var.set(1)
+        self.state.set_mask((1 << self.num_bits) - 1)
         self.on_bit_change()
 
     def clear_all(self):
-        for var in self.bit_vars:
-            var.set(0)
+        self.state.set_mask(0)
+        self.on_bit_change()
+
+    def undo(self):
+        if self.state.undo() is None:
+            self.log("提示: 没有可撤销的操作")
+            return
+        self.on_bit_change()
+
+    def redo(self):
+        if self.state.redo() is None:
+            self.log("提示: 没有可重做的操作")
+            return
         self.on_bit_change()
 
     def calculate_checksum(self, cmd, data):
-        total = cmd
-        for b in data:
-            total += b
-        return total & 0xFF
+        return protocol.calculate_checksum(cmd, data)
 
     def send_data(self, silent=False):
-        if not self.is_connected or not self.sock:
+        mask = self.output_mask
+        if self._send_frame(mask, silent):
+            self.scheduler.mark_sent(mask)
+
+    def _scheduled_send(self, mask):
+        """由合并发送调度器在 I/O 事件循环线程中调用"""
+        return self._send_frame(mask)
+
+    def _send_frame(self, mask, silent=False):
+        """编码并提交一帧，返回该帧的 Future (未连接时返回 None)；可在任意线程调用"""
+        if not self.link.connected:
             # self.log("未连接，无法发送")
-            return
+            return None
 
-        try:
-            # 1. 将 48 个位打包成 6 个字节
-            data_bytes = bytearray(NUM_CHIPS)
-            
-            for chip in range(NUM_CHIPS):
-                byte_val = 0
-                for bit in range(BITS_PER_CHIP):
-                    # 获取对应的全局索引
-                    idx = chip * BITS_PER_CHIP + bit
-                    if self.bit_vars[idx].get():
-                        # 注意：这里假设 Bit 0 是最低位 (LSB)
-                        byte_val |= (1 << bit)
-                data_bytes[chip] = byte_val
-
-            # 2. 构建数据包
-            # 协议: AA 55 01 [DATA x 6] CS
-            head1 = 0xAA
-            head2 = 0x55
-            cmd = 0x01
-            
-            packet = bytearray([head1, head2, cmd])
-            packet.extend(data_bytes)
-            cs = self.calculate_checksum(cmd, data_bytes)
-            packet.append(cs)
-            
-            # 3. 发送
-            self.sock.sendall(packet)
-            
+        # 协议: AA 55 01 [DATA x 6] CS，长链为一个或多个 AA 55 03 分块帧，直接编码进预分配的缓冲区
+        # 编码与入队在同一把锁内完成，保证线路上的帧序与状态变化顺序一致
+        with self._send_lock:
+            frames = self.encoder.encode_mask(mask)
+            # 多块时全部分块作为一次更新提交，全部 ACK 才算确认，超时时整体重发；
+            # 经 DeviceLink 提交，设备不回复保活帧时它重发最近的这次更新作为保活
+            future = self.link.submit(frames, context=mask)
             if not silent:
-                hex_str = " ".join([f"{b:02X}" for b in data_bytes])
-                self.log(f"发送数据: {hex_str}")
-            
-            # 4. 接收 ACK 由后台线程处理，这里不再阻塞读取
+                if self.num_chips <= MAX_HEX_LOG_CHIPS:
+                    detail = self.encoder.data().hex(" ").upper()
+                else:
+                    detail = f"{self.num_chips} 片, {len(frames)} 帧, {self.encoder.frame_bytes} 字节"
+
+        if not silent:
+            self.log(f"发送数据: {detail}")
+        
+        # 接收 ACK 由后台线程处理，这里不再阻塞读取
+        return future
+
+    def _on_frame_result(self, result):
+        """发送流水线回报每帧的结果 (在后台线程中调用)"""
+        if result.context is None:
+            return # 保活帧
+        self.scheduler.on_result(result.context, result.delivered)
+        if not result.delivered and self.is_connected:
+            self.log(f"警告: 第 {result.seq} 帧发送 {result.attempts} 次仍未收到 ACK")
+
+    # ---------- 本机控制接口 (以下命令在 I/O 事件循环线程中执行，不能阻塞) ----------
+
+    def _start_control_api(self):
+        try:
+            port = self.api.start()
+        except OSError as e:
+            self.log(f"控制接口启动失败: {e}", log_pipeline.WARNING)
+            return
+        self.log(f"控制接口已启动: {self.api.host}:{port}")
+
+    def _api_commands(self):
+        return {
+            "get_state": self._api_get_state,
+            "set_mask": self._api_set_mask,
+            "set_bits": self._api_set_bits,
+            "run_sequence": self._api_run_sequence,
+            "stop_sequence": self._api_stop_sequence,
+            "program": self._api_program,
+            "cancel_program": self._api_cancel_program,
+            "health": self._api_health,
+        }
+
+    def _api_get_state(self, request):
+        snapshot = self.state.snapshot()
+        return {
+            "version": snapshot.version,
+            "mask": control_server.format_mask(snapshot.mask),
+            "num_chips": self.num_chips,
+            "num_bits": snapshot.num_bits,
+            "connected": self.link.connected,
+        }
+
+    def _api_bits(self, request, key):
+        bits = 0
+        for index in request.get(key, ()):
+            index = int(index)
+            if not 0 <= index < self.num_bits:
+                raise CommandError(f"位序号超出范围 (0–{self.num_bits - 1}): {index}")
+            bits |= 1 << index
+        return bits
+
+    def _api_set_mask(self, request):
+        """{"mask": "0x..."}：整体替换输出状态"""
+        mask = control_server.parse_mask(request["mask"])
+        if not 0 <= mask < 1 << self.num_bits:
+            raise CommandError(f"位掩码超出 {self.num_bits} 位")
+        change = self.state.set_mask(mask, source=output_state.SOURCE_API, record=False)
+        return self._api_send(change, request)
+
+    def _api_set_bits(self, request):
+        """{"on": [位序号], "off": [...], "toggle": [...]}：一次原子修改"""
+        change = self.state.update(set_bits=self._api_bits(request, "on"),
+                                   clear_bits=self._api_bits(request, "off"),
+                                   toggle_bits=self._api_bits(request, "toggle"),
+                                   source=output_state.SOURCE_API, record=False)
+        return self._api_send(change, request)
+
+    def _api_send(self, change, request):
+        """把接口修改的状态发给设备：默认经合并调度发送；wait_ack 为真时直接提交到流水线并等待设备确认"""
+        snapshot = self.state.snapshot()
+        result = {"version": snapshot.version, "mask": control_server.format_mask(snapshot.mask),
+                  "changed": change is not None, "sent": self.link.connected}
+        if not self.link.connected:
+            return result
+        if not request.get("wait_ack"):
+            if change is not None:
+                self.scheduler.request(snapshot.mask)
+            return result
+        future = self._send_frame(snapshot.mask, silent=True)
+        if not future:
+            result["sent"] = False
+            return result
+        self.scheduler.mark_sent(snapshot.mask)
+
+        async def wait_ack():
+            frame = await asyncio.wrap_future(future)
+            result.update(delivered=frame.delivered, attempts=frame.attempts,
+                          rtt_ms=None if frame.rtt is None else frame.rtt * 1000)
+            return result
+        return wait_ack()
+
+    def _api_run_sequence(self, request):
+        """{"steps": [[秒, 状态], ...]} 或 {"pattern": "chase" | "ramp" | "toggle", "interval_ms": 20}，
+        可加 "repeat": 次数；wait 为真 (默认) 时回放结束才返回误差统计"""
+        if not self.link.connected:
+            raise CommandError("设备未连接，无法回放序列")
+        if self.player.running:
+            raise CommandError("序列正在回放中")
+        if "steps" in request:
+            steps = sequence_player.parse_steps(request["steps"], self.num_bits)
+        else:
+            interval = float(request.get("interval_ms", 20)) / 1000.0
+            pattern = request.get("pattern")
+            if pattern == "chase":
+                steps = sequence_player.chase(interval, self.num_bits, int(request.get("width", 1)))
+            elif pattern == "ramp":
+                steps = sequence_player.ramp(interval, self.num_bits, down=bool(request.get("down")))
+            elif pattern == "toggle":
+                mask = control_server.parse_mask(request.get("mask", (1 << self.num_bits) - 1))
+                if not 0 <= mask < 1 << self.num_bits:
+                    raise CommandError(f"位掩码超出 {self.num_bits} 位")
+                steps = sequence_player.toggle(interval, mask, int(request.get("count", 2)))
+            else:
+                raise CommandError(f"未知的序列: {pattern}")
+        steps = sequence_player.repeat(steps, int(request.get("repeat", 1)))
+        if not steps:
+            raise CommandError("序列中没有任何步骤")
+        future = concurrent.futures.Future()
+        self._sequence_future = future
+        self.player.play(steps)
+        self.ui.post(self._on_sequence_started, len(steps))
+        if request.get("wait", True):
+            return future
+        return {"steps": len(steps)}
+
+    def _api_stop_sequence(self, request):
+        running = self.player.running
+        self.player.cancel()
+        return {"cancelled": running}
+
+    def _api_program(self, request):
+        """{"chip": 0, "bit": 3} 或 {"panel": true}：加入烧录队列，结果推送到 program 主题"""
+        if not self.link.connected:
+            raise CommandError("设备未连接，无法触发烧录")
+        if request.get("panel"):
+            targets = panel_targets(self.num_chips, BITS_PER_CHIP)
+        else:
+            chip, bit = int(request["chip"]), int(request["bit"])
+            if not (0 <= chip < self.num_chips and 0 <= bit < BITS_PER_CHIP):
+                raise CommandError(f"目标超出范围: 芯片 {chip}, Bit {bit}")
+            mask = request.get("mask")
+            if mask is not None:
+                mask = control_server.parse_mask(mask)
+                if not 0 <= mask < 1 << self.num_bits:
+                    raise CommandError(f"位掩码超出 {self.num_bits} 位")
+            targets = [Target(chip, bit, mask)]
+        pending = self.runner.submit(targets)
+        self.ui.post(self._update_batch_label)
+        self.log(f"控制接口: {len(targets)} 个烧录目标已加入队列")
+        return {"queued": len(targets), "pending": pending}
+
+    def _api_cancel_program(self, request):
+        dropped = self.runner.cancel()
+        self.programmer.cancel()
+        self.ui.post(self._update_batch_label)
+        return {"dropped": dropped}
+
+    def _api_health(self, request):
+        return {
+            "link": self.link.stats(),
+            "devices": self.devices.status(),
+            "pipeline": self.pipeline.stats(),
+            "liveness": self.liveness.stats(),
+            "reconnect": self.reconnector.stats(),
+            "scheduler": self.scheduler.stats(),
+            "runner": self.runner.stats(),
+            "state": self.state.stats(),
+            "ui": self.ui.stats(),
+            "api": self.api.stats(),
+        }
 
-        except Exception as e:
-            self.log(f"发送错误: {e}")
-            messagebox.showwarning("发送失败", f"数据发送失败，连接似乎已断开。\n错误: {e}")
-            self.disconnect()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,77 @@
+"""界面会话状态的保存与恢复
+
+把上次使用的设备地址、芯片数、输出状态和各项开关保存在一个小 JSON 文件里，下次启动时恢复
+并自动重新连接，不用每次重新扫描或输入 IP。写入先写临时文件再替换，程序中途退出也不会
+留下半个文件；文件缺失、损坏或字段类型不对时使用默认值。
+"""
+import json
+import os
+
+# ================= 配置 =================
+STATE_VERSION = 1
+
+DEFAULTS = {
+    "ip": "",
+    "port": 8080,
+    "cidr": "",
+    "num_chips": 6,
+    "output_mask": "0",             # 十六进制字符串 (长链的位掩码超过 JSON 数字的精度)
+    "auto_send": True,
+    "auto_program": True,
+    "record": False,
+    "show_debug": False,
+    "send_window_ms": 10.0,
+    "max_frame_rate": 50.0,
+    "auto_connect": True,           # 启动时自动连接上次的设备
+    "auto_reconnect": True,         # 掉线后自动重连
+    "control_api": True,            # 启动本机控制接口 (control_server，只监听 127.0.0.1)
+    "control_port": 8765,
+}
+
+
+def load_state(path, defaults=DEFAULTS):
+    """读取状态文件，返回完整的字典 (缺失或类型不符的字段用默认值)"""
+    state = dict(defaults)
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return state
+    if not isinstance(saved, dict):
+        return state
+    for key, default in defaults.items():
+        value = saved.get(key)
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            ok = isinstance(value, bool)
+        elif isinstance(default, float):
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            ok = type(value) is type(default)
+        if ok:
+            state[key] = value
+    return state
+
+
+def save_state(path, state):
+    """原子地写入状态文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = dict(state, version=STATE_VERSION)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def mask_to_text(mask):
+    return format(mask, "x")
+
+
+def text_to_mask(text):
+    try:
+        return int(text, 16)
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,210 @@
+"""批量烧录任务队列
+
+每个目标 (芯片, Bit) 依次执行: 切换继电器 -> 等待吸合 -> 触发烧录 -> 记录结果，失败可重试。
+所有触发都进入队列，任务运行期间的新触发不会被丢弃；可以随时取消剩余任务。
+统计每小时产量 (UPH) 与各阶段耗时。全部任务在一个常驻的任务线程中执行，
+不随每次烧录新建线程；call() 可以把其他烧录自动化相关的工作 (例如预加载) 放到同一线程。
+"""
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import protocol
+
+# ================= 配置 =================
+DEFAULT_SETTLE = 0.5        # 继电器吸合等待时间 (与旧版一致)
+DEFAULT_RETRIES = 1         # 烧录失败后的重试次数
+
+STAGES = ("switch", "settle", "program")
+
+# chip / bit: 目标位置; mask: 切换继电器时要设置的输出状态 (None 表示保持当前状态)
+Target = namedtuple("Target", ["chip", "bit", "mask"])
+Target.__new__.__defaults__ = (None,)
+
+# passed: 是否成功, attempts: 尝试次数, detail: 烧录程序返回的详情,
+# timings: {阶段: 累计耗时 (秒)}, duration: 该目标总耗时
+JobResult = namedtuple("JobResult", ["target", "passed", "attempts", "detail", "timings", "duration"])
+
+_CALL = object()                # 队列中代表一次 call() 的占位
+
+
+def panel_targets(num_chips=protocol.NUM_CHIPS, bits_per_chip=protocol.BITS_PER_CHIP, exclusive=True):
+    """整板目标列表；exclusive 为 True 时每个目标只接通自己那一路"""
+    targets = []
+    for chip in range(num_chips):
+        for bit in range(bits_per_chip):
+            mask = 1 << (chip * bits_per_chip + bit) if exclusive else None
+            targets.append(Target(chip, bit, mask))
+    return targets
+
+
+class BatchRunner:
+    """switch(target) 切换继电器，成功返回 True；program(target) 执行一次烧录，返回 (是否成功, 详情)
+
+    on_result(JobResult) 在每个目标完成后调用，on_idle() 在队列清空时调用，均在任务线程中。
+    任务线程在 start() 时创建 (未调用 start 时第一次 submit 会自动启动)，stop() 结束。
+    """
+
+    def __init__(self, switch, program, settle=DEFAULT_SETTLE, retries=DEFAULT_RETRIES,
+                 on_result=None, on_idle=None):
+        self.switch = switch
+        self.program = program
+        self.settle = settle
+        self.retries = retries
+        self.on_result = on_result
+        self.on_idle = on_idle
+
+        self._queue = queue.Queue()
+        self._calls = queue.Queue()     # call() 提交的函数，队列中以 _CALL 占位
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.current = None
+        self.results = []
+        self._busy_time = 0.0
+        self._stage_time = dict.fromkeys(STAGES, 0.0)
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-runner", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self.cancel()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            if thread is not threading.current_thread():
+                thread.join(1.0)
+
+    # ---------- 提交与控制 (任意线程) ----------
+
+    def submit(self, targets):
+        """把一个或多个目标加入队列，返回排队中的目标数"""
+        if isinstance(targets, Target):
+            targets = [targets]
+        self._cancel.clear()
+        for target in targets:
+            self._queue.put(target)
+        self.start()
+        return self.pending()
+
+    def call(self, func):
+        """在任务线程中执行 func()，排在已提交的目标之后；不计入统计，也不受 cancel 影响"""
+        self._calls.put(func)
+        self._queue.put(_CALL)
+        self.start()
+
+    def pending(self):
+        return max(0, self._queue.qsize() - self._calls.qsize())
+
+    @property
+    def busy(self):
+        return self.current is not None or self.pending() > 0
+
+    def cancel(self):
+        """取消当前与排队中的所有目标 (当前目标在下一个阶段边界处停止)"""
+        self._cancel.set()
+        dropped = 0
+        kept = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _CALL or item is None:
+                kept.append(item)
+            else:
+                dropped += 1
+        for item in kept:
+            self._queue.put(item)
+        return dropped
+
+    def reset_stats(self):
+        with self._lock:
+            self.results = []
+            self._busy_time = 0.0
+            self._stage_time = dict.fromkeys(STAGES, 0.0)
+
+    def stats(self):
+        with self._lock:
+            done = len(self.results)
+            passed = sum(1 for r in self.results if r.passed)
+            busy = self._busy_time
+            stage = dict(self._stage_time)
+        return {
+            "units": done,
+            "passed": passed,
+            "failed": done - passed,
+            "pending": self.pending(),
+            "uph": done * 3600.0 / busy if busy > 0 else 0.0,
+            "cycle_s": busy / done if done else 0.0,
+            "stage_avg_s": {k: (v / done if done else 0.0) for k, v in stage.items()},
+        }
+
+    # ---------- 任务线程 ----------
+
+    def _run(self):
+        while True:
+            target = self._queue.get()
+            if target is None:
+                return
+            if target is _CALL:
+                try:
+                    self._calls.get_nowait()()
+                except Exception:
+                    pass
+                continue
+            self.current = target
+            try:
+                result = self._run_target(target)
+            finally:
+                self.current = None
+            with self._lock:
+                self.results.append(result)
+                self._busy_time += result.duration
+                for k, v in result.timings.items():
+                    self._stage_time[k] += v
+            if self.on_result:
+                self.on_result(result)
+            if not self.pending() and self.on_idle:
+                self.on_idle()
+
+    def _run_target(self, target):
+        timings = dict.fromkeys(STAGES, 0.0)
+        start = time.perf_counter()
+        attempts = 0
+        passed = False
+        detail = ""
+        while attempts <= self.retries and not self._cancel.is_set():
+            attempts += 1
+            t = time.perf_counter()
+            ok = self.switch(target)
+            timings["switch"] += time.perf_counter() - t
+            if not ok:
+                detail = "继电器切换失败 (设备未确认)"
+                continue
+
+            t = time.perf_counter()
+            cancelled = self._cancel.wait(self.settle)
+            timings["settle"] += time.perf_counter() - t
+            if cancelled:
+                break
+
+            t = time.perf_counter()
+            try:
+                passed, detail = self.program(target)
+            except Exception as e:
+                passed, detail = False, f"烧录异常: {e}"
+            timings["program"] += time.perf_counter() - t
+            if passed:
+                break
+        if self._cancel.is_set() and not passed:
+            detail = detail or "已取消"
+        return JobResult(target, passed, attempts, detail, timings, time.perf_counter() - start)
@@ -0,0 +1,102 @@
+"""输出矩阵的启动与全选耗时: 旧版 (每位一个 Checkbutton + IntVar) vs OutputMatrix (单个 Canvas)
+
+每种芯片数分别测量:
+    构建    创建控件并完成首次绘制 (root.update) 的耗时，即矩阵对窗口启动时间的贡献
+    全选    全部置 1 并完成重绘的耗时 (旧版逐个 IntVar.set，新版一次 set_mask)
+需要图形界面 (Windows 桌面，或 Linux 上的 X / Xvfb)。
+
+用法: python benchmarks/bench_matrix.py [--chips 6,64,256,1024] [--legacy-max 256]
+"""
+import argparse
+import os
+import sys
+import time
+import tkinter as tk
+from tkinter import ttk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+from output_matrix import OutputMatrix
+
+BITS = protocol.BITS_PER_CHIP
+
+
+def build_legacy(parent, num_chips):
+    """旧版 _init_ui 的矩阵: 可滚动 Frame 中每片一个 LabelFrame，每位一个 Checkbutton"""
+    canvas = tk.Canvas(parent, highlightthickness=0)
+    scrollbar = ttk.Scrollbar(parent, orient="vertical", command=canvas.yview)
+    inner = ttk.Frame(canvas)
+    inner.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+    canvas.create_window((0, 0), window=inner, anchor="nw")
+    canvas.configure(yscrollcommand=scrollbar.set)
+    canvas.pack(side="left", fill="both", expand=True)
+    scrollbar.pack(side="right", fill="y")
+    bit_vars = []
+    for chip in range(num_chips):
+        chip_frame = ttk.LabelFrame(inner, text=f"芯片 #{chip + 1}", padding="5")
+        chip_frame.pack(fill="x", pady=5, padx=5)
+        for bit in range(BITS):
+            var = tk.IntVar()
+            bit_vars.append(var)
+            tk.Checkbutton(chip_frame, text=f"Bit {bit}", variable=var,
+                           command=lambda c=chip, b=bit: None).pack(side="left", padx=5)
+        ttk.Separator(chip_frame, orient="vertical").pack(side="left", padx=10, fill="y")
+        ttk.Button(chip_frame, text="全开", width=4).pack(side="left", padx=2)
+        ttk.Button(chip_frame, text="全关", width=4).pack(side="left", padx=2)
+    return bit_vars
+
+
+def measure(num_chips, legacy):
+    root = tk.Tk()
+    root.geometry("1000x600")
+    frame = ttk.Frame(root)
+    frame.pack(fill="both", expand=True)
+    try:
+        t = time.perf_counter()
+        if legacy:
+            bit_vars = build_legacy(frame, num_chips)
+        else:
+            matrix = OutputMatrix(frame, num_chips, BITS)
+            matrix.pack(fill="both", expand=True)
+        root.update()
+        build = time.perf_counter() - t
+
+        t = time.perf_counter()
+        if legacy:
+            for var in bit_vars:
+                var.set(1)
+        else:
+            matrix.set_mask((1 << num_chips * BITS) - 1)
+        root.update()
+        select_all = time.perf_counter() - t
+        items = None if legacy else matrix.stats()["items"]
+    finally:
+        root.destroy()
+    return build, select_all, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chips", default="6,64,256,1024", help="芯片数列表，逗号分隔")
+    parser.add_argument("--legacy-max", type=int, default=256, help="旧版只测到该芯片数 (太多时要等很久)")
+    args = parser.parse_args()
+
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        raise SystemExit(f"需要图形界面: {e}")
+
+    print(f"{'芯片数':>6} {'方式':<8} {'构建 (ms)':>10} {'全选 (ms)':>10} {'画布元素':>8}")
+    for num_chips in (int(n) for n in args.chips.split(",")):
+        for legacy in (True, False):
+            if legacy and num_chips > args.legacy_max:
+                continue
+            build, select_all, items = measure(num_chips, legacy)
+            name = "旧版" if legacy else "Canvas"
+            print(f"{num_chips:>6} {name:<8} {build * 1000:>10.1f} {select_all * 1000:>10.1f} "
+                  f"{'' if items is None else items:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""多板负载测试: 用一个 DeviceManager 在共享 IoLoop 上管理 slave_simulator 模拟的 N 块从机
+
+依次测量: 全部连接耗时、把若干帧广播给每块板直到全部 ACK 的吞吐 (经各自的发送流水线)、
+模拟板全部断开后自动重连恢复的耗时，并输出线程数 (不随板数增加)。不需要硬件，适合在 CI 上运行。
+
+用法: python benchmarks/bench_multiboard.py [--boards 200] [--frames 50] [--latency 2] [--jitter 1]
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import device_link
+import protocol
+from device_manager import DeviceManager
+from io_loop import IoLoop
+from slave_simulator import SimConfig, SimulatorFarm
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=50, help="每块板发送的帧数")
+    parser.add_argument("--latency", type=float, default=2.0, help="模拟应答延迟 (ms)")
+    parser.add_argument("--jitter", type=float, default=1.0, help="模拟应答抖动 (ms)")
+    args = parser.parse_args()
+
+    config = SimConfig(latency=args.latency / 1000.0, jitter=args.jitter / 1000.0, seed=1)
+    farm = SimulatorFarm.on_ports(args.boards, config=config).start_background()
+    io = IoLoop("multiboard-io").start()
+    recovered = set()
+
+    def on_event(name, event, detail):
+        if event == device_link.RECOVERED:
+            recovered.add(name)
+
+    manager = DeviceManager(io, on_event=on_event)
+    for i, address in enumerate(farm.addresses):
+        manager.add_device(i, address)
+    encoder = protocol.FrameEncoder()
+    try:
+        t = time.perf_counter()
+        results = manager.connect_all().result(30)
+        connect_time = time.perf_counter() - t
+        ok = sum(results.values())
+        print(f"{args.boards} 块板: 连接成功 {ok}, 耗时 {connect_time * 1000:.1f} ms, "
+              f"线程数 {threading.active_count()}")
+
+        # 每块板依次收到 1..frames，每帧都经流水线等待 ACK
+        t = time.perf_counter()
+        pending = []
+        for n in range(args.frames):
+            pending.extend(manager.broadcast(encoder.encode_mask(n + 1)).values())
+        done, not_done = concurrent.futures.wait(pending, 60)
+        elapsed = time.perf_counter() - t
+        delivered = sum(1 for f in done if f.result().delivered)
+        print(f"发送 {args.frames} 帧 x {args.boards} 块板: 确认 {delivered}/{len(pending)}, "
+              f"耗时 {elapsed * 1000:.1f} ms, {len(pending) / elapsed:.0f} 帧/秒")
+        wrong = [b for b in farm.boards if b.state != args.frames]
+        print(f"最终输出状态不一致的板: {len(wrong)}")
+
+        # 模拟所有板同时掉线，DeviceLink 按退避自动重连
+        t = time.perf_counter()
+        farm.call(lambda: [b.disconnect_all() for b in farm.boards])
+        done = wait_for(lambda: len(recovered) == args.boards, 30)
+        print(f"自动重连: {'全部恢复' if done else '超时'} ({len(recovered)}/{args.boards}), "
+              f"耗时 {(time.perf_counter() - t) * 1000:.1f} ms")
+        print(f"设备状态: {manager.summary()}, 线程数 {threading.active_count()}")
+    finally:
+        manager.close()
+        io.stop()
+        farm.stop_background()
+    print(f"模拟板统计: {farm.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""烧录程序触发延迟: 旧版 (每次重新查找窗口 + 固定等待) vs 缓存句柄 vs 条件检测结果
+
+使用 programmer_automation.FakeProgrammerBackend 模拟 APT ISP2，不需要 Windows 或 pywinauto。
+旧版在点击后固定检测弹窗 5 次 (每次间隔 0.5 s)，再固定等待 2 s 读取整个日志控件。
+
+用法: python benchmarks/bench_programmer.py [--units 5] [--connect-delay 0.8] [--program-time 0.3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from programmer_automation import AutomationSession, FakeProgrammerBackend, ProgramResult, ResultDetector
+
+
+class FixedWaitDetector(ResultDetector):
+    """旧版 trigger_programmer 的固定等待"""
+
+    def wait(self, mark):
+        start = time.monotonic()
+        for _ in range(5):
+            time.sleep(0.5)
+            popup = self.backend.find_error_popup()
+            if popup:
+                return ProgramResult(False, None, None, time.monotonic() - start, popup, "")
+        time.sleep(2)
+        text, _ = self.backend.read_log_since(0)
+        return ProgramResult(True, None, None, time.monotonic() - start, "烧录已执行", text)
+
+
+def run(cache, fixed_wait, args):
+    backend = FakeProgrammerBackend(connect_delay=args.connect_delay,
+                                    validate_delay=args.validate_delay,
+                                    program_time=args.program_time, seed=1)
+    session = AutomationSession(backend, cache=cache)
+    if fixed_wait:
+        session.detector = FixedWaitDetector(backend)
+    latencies = []
+    for n in range(args.units):
+        if args.stale_every and n and n % args.stale_every == 0:
+            # 模拟烧录程序被重启：旧句柄失效
+            backend.connected = False
+        passed, detail = session.trigger()
+        if not passed:
+            raise SystemExit(f"第 {n + 1} 次触发失败: {detail}")
+        latencies.append(session.last_timing["total"])
+    return latencies, session.stats()
+
+
+def report(name, latencies, stats):
+    ordered = sorted(latencies)
+    print(f"{name:<12} 平均 {statistics.mean(ordered) * 1000:8.1f} ms  "
+          f"中位 {statistics.median(ordered) * 1000:8.1f} ms  "
+          f"最大 {ordered[-1] * 1000:8.1f} ms  "
+          f"重新查找 {stats['rediscoveries']} 次")
+    return statistics.mean(ordered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--units", type=int, default=5)
+    parser.add_argument("--connect-delay", type=float, default=0.8, help="查找程序与控件的耗时 (秒)")
+    parser.add_argument("--validate-delay", type=float, default=0.002, help="句柄有效性检查耗时 (秒)")
+    parser.add_argument("--program-time", type=float, default=0.3, help="点击按钮到日志给出结果 (秒)")
+    parser.add_argument("--stale-every", type=int, default=0, help="每 N 次触发让句柄失效一次")
+    parser.add_argument("--skip-fixed-wait", action="store_true", help="跳过固定等待的两组 (较慢)")
+    args = parser.parse_args()
+
+    print(f"{args.units} 次触发, 查找耗时 {args.connect_delay * 1000:.0f} ms, "
+          f"烧录耗时 {args.program_time * 1000:.0f} ms")
+    results = []
+    if not args.skip_fixed_wait:
+        results.append(("旧版", run(False, True, args)))
+        results.append(("缓存句柄", run(True, True, args)))
+    results.append(("缓存+条件检测", run(True, False, args)))
+    means = [report(name, *r) for name, r in results]
+    if len(means) > 1:
+        print(f"每次触发平均节省 {(means[0] - means[-1]) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
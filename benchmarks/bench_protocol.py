@@ -0,0 +1,95 @@
+"""帧编码微基准: 旧版 send_data 打包路径 vs protocol.FrameEncoder
+
+旧版路径使用真实的 tk.IntVar (通过 tk.Tcl() 创建，不需要显示器)。
+
+用法: python benchmarks/bench_protocol.py [--number 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+
+NUM_CHIPS = protocol.NUM_CHIPS
+BITS_PER_CHIP = protocol.BITS_PER_CHIP
+
+
+def legacy_checksum(cmd, data):
+    total = cmd
+    for b in data:
+        total += b
+    return total & 0xFF
+
+
+def legacy_build(bit_vars):
+    """旧版 send_data 中的打包与校验 (不含发送)"""
+    data_bytes = bytearray(NUM_CHIPS)
+    for chip in range(NUM_CHIPS):
+        byte_val = 0
+        for bit in range(BITS_PER_CHIP):
+            idx = chip * BITS_PER_CHIP + bit
+            if bit_vars[idx].get():
+                byte_val |= (1 << bit)
+        data_bytes[chip] = byte_val
+    packet = bytearray([0xAA, 0x55, 0x01])
+    packet.extend(data_bytes)
+    packet.append(legacy_checksum(0x01, data_bytes))
+    return packet
+
+
+def make_bit_vars(mask):
+    try:
+        import tkinter as tk
+        root = tk.Tcl()
+        bit_vars = [tk.IntVar(master=root, value=mask >> i & 1) for i in range(protocol.NUM_BITS)]
+        return bit_vars, "tk.IntVar"
+    except Exception:
+        # 没有 Tcl/Tk 时退化为普通对象，只能反映纯 Python 部分的开销
+        class _Var:
+            def __init__(self, v):
+                self.v = v
+
+            def get(self):
+                return self.v
+        return [_Var(mask >> i & 1) for i in range(protocol.NUM_BITS)], "普通对象 (无 Tcl)"
+
+
+def report(name, seconds, number, per=1):
+    print(f"{name:<34}{seconds / number / per * 1e6:9.3f} us/帧")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(595)
+    mask = rng.getrandbits(protocol.NUM_BITS)
+    bit_vars, var_kind = make_bit_vars(mask)
+    encoder = protocol.FrameEncoder()
+    data = protocol.mask_to_bytes(mask)
+
+    # 先确认两条路径编码结果一致
+    assert bytes(legacy_build(bit_vars)) == bytes(encoder.encode_mask(mask)) == protocol.build_frame(mask)
+
+    n = args.number
+    report(f"旧版 send_data ({var_kind})", timeit.timeit(lambda: legacy_build(bit_vars), number=n), n)
+    report("protocol.build_frame", timeit.timeit(lambda: protocol.build_frame(mask), number=n), n)
+    report("FrameEncoder.encode_mask", timeit.timeit(lambda: encoder.encode_mask(mask), number=n), n)
+    report("FrameEncoder.encode_bytes", timeit.timeit(lambda: encoder.encode_bytes(data), number=n), n)
+    report("旧版校验和 (Python 循环)", timeit.timeit(lambda: legacy_checksum(0x01, data), number=n), n)
+    report("protocol.calculate_checksum", timeit.timeit(lambda: protocol.calculate_checksum(0x01, data), number=n), n)
+
+    states = [rng.getrandbits(protocol.NUM_BITS) for _ in range(args.batch)]
+    reps = max(1, n // args.batch)
+    report(f"FrameEncoder.encode_batch ({args.batch})",
+           timeit.timeit(lambda: encoder.encode_batch(states), number=reps), reps, args.batch)
+
+
+if __name__ == "__main__":
+    main()
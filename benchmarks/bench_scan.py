@@ -0,0 +1,124 @@
+"""扫描性能对比: asyncio 扫描 vs 旧版每主机一个线程的扫描
+
+在 127.0.0.0/8 的若干地址上启动本地监听端口充当从机，分别用两种方式扫描 127.0.0.0/24，
+打印耗时、找到的设备数和峰值线程数。仅支持 Linux (其他系统默认只有 127.0.0.1 可绑定)。
+
+用法: python benchmarks/bench_scan.py [--hosts 10,50,200] [--port 18080]
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import device_scanner
+
+
+def start_listeners(ips, port):
+    socks = []
+    for ip in ips:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((ip, port))
+        s.listen(64)
+        socks.append(s)
+    return socks
+
+
+class ThreadPeak:
+    """后台采样进程内线程数峰值"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(0.001)
+
+    def __enter__(self):
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+
+
+def legacy_scan(base_ip, port):
+    """旧版 _scan_thread 的扫描逻辑 (去掉界面部分)，找到第一台即停止"""
+    found_ip = None
+    lock = threading.Lock()
+
+    def check_ip(ip):
+        nonlocal found_ip
+        for timeout in [0.2, 0.4]:
+            if found_ip:
+                return
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(timeout)
+            try:
+                if s.connect_ex((ip, port)) == 0:
+                    with lock:
+                        if not found_ip:
+                            found_ip = ip
+                    return
+            except OSError:
+                pass
+            finally:
+                s.close()
+
+    active_threads = []
+    for i in range(1, 255):
+        if found_ip:
+            break
+        t = threading.Thread(target=check_ip, args=(f"{base_ip}.{i}",))
+        t.start()
+        active_threads.append(t)
+        if len(active_threads) % 20 == 0:
+            time.sleep(0.1)
+
+    for _ in range(100):
+        if found_ip:
+            break
+        if not any(t.is_alive() for t in active_threads):
+            break
+        time.sleep(0.1)
+    return [found_ip] if found_ip else []
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", default="10,50,200", help="监听地址的最后一段，逗号分隔")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--concurrency", type=int, default=device_scanner.DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    ips = [f"127.0.0.{h}" for h in args.hosts.split(",")]
+    socks = start_listeners(ips, args.port)
+    try:
+        with ThreadPeak() as peak:
+            start = time.perf_counter()
+            results = device_scanner.scan("127.0.0.0/24", args.port, concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+        print(f"asyncio 扫描: {elapsed * 1000:8.1f} ms, 找到 {len(results)}/{len(ips)} 台, 峰值线程数 {peak.peak}")
+        for r in results:
+            print(f"    {r.ip}:{r.port}  {r.latency * 1000:.2f} ms")
+
+        with ThreadPeak() as peak:
+            start = time.perf_counter()
+            found = legacy_scan("127.0.0", args.port)
+            elapsed = time.perf_counter() - start
+        print(f"旧版线程扫描: {elapsed * 1000:8.1f} ms, 找到 {len(found)}/{len(ips)} 台, 峰值线程数 {peak.peak}")
+    finally:
+        for s in socks:
+            s.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""性能基准套件与回归检查
+
+覆盖:
+    encode    send_data 的编码与校验路径 (FrameEncoder.encode_mask)
+    parse     _receive_thread 的 ACK 解析 (FrameParser，ACK 流与混合流)
+    scan      网段扫描 (device_scanner.scan，对 127.0.1.0/24 上的模拟从机)、按历史记录优先探测时
+              找到已知设备的时间，以及 UDP 广播发现的首个应答时间
+    roundtrip 发送到 ACK 的往返 (SendPipeline 对接本地 slave_simulator)
+    chain     256 片长链: ChainEncoder 编码耗时与流水线更新速率 (目标 >= 100 次/秒)
+    reconnect 注入掉线后的恢复时间 (DeviceLink 对接本地 slave_simulator): 连接被复位、
+              模拟板掉电后重新上电，两种情况都计到重发的最后确认状态被 ACK 且模拟板输出一致为止
+    ioloop    一个 IoLoop 同时承担满速流水线发送、网段扫描与注入的掉线重连时的事件循环延迟，
+              以及全过程中进程线程数的最大值 (应与空闲时相同)
+    state     输出状态存储 (OutputState): 单个位与整块 (256 片) 批量修改的耗时 (含一个订阅方)、
+              快照耗时、撤销 + 重做一步的耗时
+    api       本机控制接口 (ControlServer): 多个客户端同时发送 set_bits (每条等待设备 ACK) 时
+              每秒完成的状态修改数与单条命令的往返时间，命令、状态推送与设备连接共用一个 IoLoop
+
+结果写入 JSON (默认 benchmarks/results/latest.json)。指定基线文件时与基线逐项比较，
+任何指标变差超过阈值 (默认 20%) 时以退出码 1 结束，可直接用于 CI。基线与机器相关，不随代码提交，
+需要在 CI 机器上用 --save-baseline 生成；CI 模式 (--ci，或设置了环境变量 CI) 下没有基线文件
+也以退出码 1 结束，不会悄悄跳过回归检查。
+
+用法:
+    python benchmarks/run_benchmarks.py                          # 运行并与 baseline.json 比较 (存在时)
+    python benchmarks/run_benchmarks.py --save-baseline          # 把本次结果保存为基线
+    python benchmarks/run_benchmarks.py --only encode,parse --threshold 10
+    python benchmarks/run_benchmarks.py --ci --baseline /ci/cache/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import device_scanner
+import discovery
+import device_link
+import output_state
+import protocol
+from control_server import ControlServer
+from device_link import DeviceLink
+from io_loop import IoLoop
+from send_pipeline import SendPipeline
+from slave_simulator import SimConfig, SimulatorFarm
+
+# ================= 配置 =================
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_THRESHOLD = 20.0        # 允许变差的百分比
+CHAIN_CHIPS = 256
+POWER_OFF_TIME = 0.3            # reconnect 基准中模拟板掉电的时长 (秒)
+REPEATS = 5                     # 微基准重复次数，取最好的一次
+
+LOWER = "lower"                 # 越小越好
+HIGHER = "higher"               # 越大越好
+
+
+def metric(value, unit, better=LOWER):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def best_of(func, ops, repeats=REPEATS):
+    """重复调用 func (每次完成 ops 次操作) repeats 次，返回最快一次的单次操作耗时 (秒)
+
+    取最小值而不是平均值：后台负载只会让结果变慢，最小值最接近代码本身的开销。
+    """
+    best = None
+    for _ in range(repeats):
+        t = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - t) / ops
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# ---------- 各项基准 ----------
+
+def bench_encode(quick):
+    rounds = 20 if quick else 100
+    rng = random.Random(1)
+    masks = [rng.getrandbits(protocol.NUM_BITS) for _ in range(1000)]
+    encoder = protocol.FrameEncoder()
+    encode = encoder.encode_mask
+
+    def encode_all():
+        for _ in range(rounds):
+            for mask in masks:
+                encode(mask)
+    per_frame = best_of(encode_all, rounds * len(masks))
+
+    batch = masks[:64]
+
+    def encode_batches():
+        for _ in range(rounds * 10):
+            encoder.encode_batch(batch)
+    per_batch_frame = best_of(encode_batches, rounds * 10 * len(batch))
+    return {
+        "encode_frame_ns": metric(per_frame * 1e9, "ns"),
+        "encode_batch64_ns_per_frame": metric(per_batch_frame * 1e9, "ns"),
+    }
+
+
+def bench_parse(quick):
+    rounds = 50 if quick else 200
+    acks = bytes([protocol.ACK]) * 4096
+    # 混合流: ACK、NAK、状态帧与少量噪声，按 TCP 可能的方式拆成小块
+    rng = random.Random(2)
+    parts = []
+    for i in range(400):
+        r = rng.random()
+        if r < 0.7:
+            parts.append(bytes([protocol.ACK]))
+        elif r < 0.8:
+            parts.append(bytes([protocol.NAK]))
+        elif r < 0.95:
+            parts.append(protocol.build_frame(rng.getrandbits(protocol.NUM_BITS)))
+        else:
+            parts.append(bytes([0x00, 0x13]))
+    mixed = b"".join(parts)
+    chunks = [mixed[i:i + 7] for i in range(0, len(mixed), 7)]
+    parser = protocol.FrameParser()
+
+    def feed_acks():
+        for _ in range(rounds):
+            parser.feed(acks)
+    ack_time = best_of(feed_acks, rounds * len(acks))
+
+    def feed_mixed():
+        for _ in range(rounds):
+            for chunk in chunks:
+                parser.feed(chunk)
+    mixed_time = best_of(feed_mixed, rounds * len(mixed))
+    return {
+        "parse_ack_ns_per_byte": metric(ack_time * 1e9, "ns"),
+        "parse_mixed_ns_per_byte": metric(mixed_time * 1e9, "ns"),
+    }
+
+
+def bench_scan(quick):
+    hosts = 20 if quick else 50
+    port = 18090
+    farm = SimulatorFarm.on_hosts(hosts, "127.0.1.1", port, discovery_port=0).start_background()
+    try:
+        times = []
+        found = 0
+        for _ in range(1 if quick else 3):
+            t = time.perf_counter()
+            results = device_scanner.scan("127.0.1.0/24", port)
+            times.append(time.perf_counter() - t)
+            found = len(results)
+        if found != hosts:
+            raise RuntimeError(f"扫描只找到 {found} / {hosts} 台模拟从机")
+
+        # 已知设备在网段末尾: 按历史记录优先探测，找到即停止
+        known = farm.boards[-1].host
+        priority = device_scanner.rank_hosts("127.0.1.0/24", known=[known])
+        ranked = []
+        for _ in range(1 if quick else 3):
+            t = time.perf_counter()
+            results = device_scanner.scan("127.0.1.0/24", port, concurrency=16, priority=priority, max_results=1)
+            ranked.append(time.perf_counter() - t)
+            if [r.ip for r in results] != [known]:
+                raise RuntimeError("优先探测没有先找到已知设备")
+
+        # 广播到回环网段，不依赖本机网卡配置
+        first_reply = []
+        for _ in range(1 if quick else 3):
+            devices = discovery.discover(window=0.2, port=farm.discovery_port,
+                                         targets=[("127.0.0.1", "127.255.255.255")])
+            if len(devices) != hosts:
+                raise RuntimeError(f"广播发现只找到 {len(devices)} / {hosts} 台模拟从机")
+            first_reply.append(devices[0].latency)
+    finally:
+        farm.stop_background()
+    return {
+        "scan_24_ms": metric(min(times) * 1000, "ms"),
+        "scan_known_first_ms": metric(min(ranked) * 1000, "ms"),
+        "discover_first_reply_ms": metric(min(first_reply) * 1000, "ms"),
+    }
+
+
+class _Link:
+    """连接一块模拟板的 SendPipeline，后台线程解析 ACK"""
+
+    def __init__(self, num_chips=protocol.NUM_CHIPS):
+        self.farm = SimulatorFarm.on_ports(1, config=SimConfig(), num_chips=num_chips).start_background()
+        self.sock = socket.create_connection(self.farm.addresses[0], timeout=2.0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pipeline = SendPipeline(self.sock.sendall).start()
+        self._stop = threading.Event()
+        self._rx = threading.Thread(target=self._receive, daemon=True)
+        self._rx.start()
+
+    def _receive(self):
+        sock = self.sock
+        parser = protocol.FrameParser()
+        sock.settimeout(0.2)
+        while not self._stop.is_set():
+            try:
+                if not parser.recv_from(sock):
+                    return
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            acks = sum(1 for e in parser.parse() if e.kind == protocol.EVT_ACK)
+            if acks:
+                self.pipeline.on_ack(acks)
+
+    def close(self):
+        self._stop.set()
+        self.pipeline.stop()
+        self.sock.close()
+        self._rx.join(1.0)
+        self.farm.stop_background()
+
+
+def bench_roundtrip(quick):
+    count = 200 if quick else 1000
+    link = _Link()
+    pipeline = link.pipeline
+    encoder = protocol.FrameEncoder()
+    try:
+        # 逐帧等待 ACK: 单帧往返时间
+        rtts = []
+        for i in range(count):
+            t = time.perf_counter()
+            result = pipeline.submit(encoder.encode_mask(i), context=i).result(2.0)
+            rtts.append(time.perf_counter() - t)
+            if not result.delivered:
+                raise RuntimeError("往返测试中有帧未被确认")
+        rtts.sort()
+
+        # 窗口内流水线发送: 吞吐
+        t = time.perf_counter()
+        futures = [pipeline.submit(encoder.encode_mask(i), context=i) for i in range(count * 5)]
+        delivered = sum(1 for f in futures if f.result(10.0).delivered)
+        elapsed = time.perf_counter() - t
+        if delivered != len(futures):
+            raise RuntimeError("吞吐测试中有帧未被确认")
+    finally:
+        link.close()
+    return {
+        "roundtrip_median_us": metric(statistics.median(rtts) * 1e6, "us"),
+        "roundtrip_p99_us": metric(rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))] * 1e6, "us"),
+        "pipelined_frames_per_s": metric(len(futures) / elapsed, "frames/s", HIGHER),
+    }
+
+
+def bench_chain(quick):
+    rounds = 2000 if quick else 10000
+    rng = random.Random(3)
+    masks = [rng.getrandbits(CHAIN_CHIPS * protocol.BITS_PER_CHIP) for _ in range(64)]
+    encoder = protocol.ChainEncoder(CHAIN_CHIPS)
+
+    def encode_all():
+        for i in range(rounds):
+            encoder.encode_mask(masks[i & 63])
+    per_update = best_of(encode_all, rounds)
+
+    # 每次更新的全部分块作为一个整体提交，全部收到 ACK 才算完成
+    count = 300 if quick else 1500
+    link = _Link(CHAIN_CHIPS)
+    try:
+        t = time.perf_counter()
+        futures = []
+        for i in range(count):
+            futures.append(link.pipeline.submit(encoder.encode_mask(masks[i & 63]), context=i))
+        delivered = sum(1 for f in futures if f.result(10.0).delivered)
+        elapsed = time.perf_counter() - t
+        if delivered != count:
+            raise RuntimeError("长链测试中有帧未被确认")
+        if link.farm.boards[0].state != masks[(count - 1) & 63]:
+            raise RuntimeError("模拟板锁存的状态与最后一次更新不一致")
+    finally:
+        link.close()
+    return {
+        "chain256_encode_us": metric(per_update * 1e6, "us"),
+        "chain256_updates_per_s": metric(count / elapsed, "updates/s", HIGHER),
+    }
+
+
+class _ReconnectingLink:
+    """与界面相同的掉线处理: DeviceLink 在 IoLoop 上退避重连，恢复后重发最后确认的状态"""
+
+    def __init__(self, address):
+        self.encoder = protocol.FrameEncoder()
+        self.confirmed = None
+        self.recovered = threading.Event()
+        self.resynced = None            # 重连后重发的帧的 Future
+        self.io = IoLoop("bench-link").start()
+        self.link = DeviceLink(self.io, on_event=self._on_event, on_result=self._on_result)
+        self.manager = self.link.reconnector
+        self.link.connect(*address).result(5.0)
+
+    def _on_result(self, result):
+        if result.delivered and result.context is not None:
+            self.confirmed = result.context
+
+    def _on_event(self, event, detail):
+        if event == device_link.RECOVERED:
+            if self.confirmed is not None:
+                self.resynced = self.send(self.confirmed)
+            self.recovered.set()
+
+    def send(self, mask):
+        return self.link.submit(self.encoder.encode_mask(mask), context=mask)
+
+    def close(self):
+        self.link.stop()
+        self.io.stop()
+
+
+def bench_reconnect(quick):
+    rounds = 3 if quick else 10
+    farm = SimulatorFarm.on_ports(1, config=SimConfig()).start_background()
+    board = farm.boards[0]
+    link = _ReconnectingLink(farm.addresses[0])
+
+    def power_off():
+        board.state = 0             # 掉电后输出复位，端口停止监听 (重连被拒绝)
+        farm.io.run(board.stop(), timeout=5.0)
+
+    def recover(expected):
+        if not link.recovered.wait(10.0) or not link.resynced.result(5.0).delivered:
+            raise RuntimeError("重连后未能恢复输出状态")
+        if board.state != expected:
+            raise RuntimeError("重连后模拟板的输出与最后确认的状态不一致")
+
+    reset_times = []
+    power_times = []
+    try:
+        for i in range(rounds):
+            mask = (i + 1) * 0x0101_0101_0101 & (1 << 48) - 1
+            if not link.send(mask).result(2.0).delivered:
+                raise RuntimeError("掉线前的状态未被确认")
+
+            # 每次注入前等链路稳定，使每次掉线都是一次独立的中断 (退避从最短间隔开始)
+            time.sleep(link.manager.stable_time)
+
+            # 连接被复位: 从注入到重发的状态被确认
+            link.recovered.clear()
+            t = time.perf_counter()
+            farm.call(board.disconnect_all)
+            recover(mask)
+            reset_times.append(time.perf_counter() - t)
+
+            # 掉电 POWER_OFF_TIME 秒后上电: 从上电到输出恢复
+            time.sleep(link.manager.stable_time)
+            link.recovered.clear()
+            power_off()
+            time.sleep(POWER_OFF_TIME)
+            t = time.perf_counter()
+            farm.io.run(board.start(), timeout=5.0)
+            recover(mask)
+            power_times.append(time.perf_counter() - t)
+        stats = link.manager.stats()
+    finally:
+        link.close()
+        farm.stop_background()
+    return {
+        "reconnect_reset_recover_ms": metric(statistics.median(reset_times) * 1000, "ms"),
+        "reconnect_power_recover_ms": metric(statistics.median(power_times) * 1000, "ms"),
+        "reconnect_attempts_per_outage": metric(stats["attempts"] / stats["outages"], "attempts"),
+    }
+
+
+def bench_ioloop(quick):
+    duration = 1.0 if quick else 3.0
+    hosts = 20
+    port = 18091
+    farm = SimulatorFarm.on_hosts(hosts, "127.0.1.1", port).start_background()
+    io = IoLoop("bench-io").start()
+    link = DeviceLink(io)
+    encoder = protocol.FrameEncoder()
+    lags = []
+    threads = []
+
+    async def measure_lag(stop_at):
+        # 每 5 ms 醒来一次，记录比预定时刻晚了多少
+        loop = asyncio.get_running_loop()
+        while loop.time() < stop_at:
+            expected = loop.time() + 0.005
+            await asyncio.sleep(0.005)
+            lags.append(loop.time() - expected)
+
+    try:
+        link.connect(*farm.boards[0].address).result(5.0)
+        idle_threads = threading.active_count()
+        stop_at = io.loop.time() + duration
+        lag_done = io.submit(measure_lag(stop_at))
+        sent = 0
+        deadline = time.perf_counter() + duration
+        next_scan = next_drop = time.perf_counter()
+        scans = []
+        while time.perf_counter() < deadline:
+            futures = [link.submit(encoder.encode_mask(sent + i), context=i) for i in range(64)]
+            sent += len(futures)
+            for f in futures:
+                f.result(5.0)
+            now = time.perf_counter()
+            if now >= next_scan:
+                scans.append(io.submit(device_scanner.scan_async("127.0.1.0/24", port)))
+                next_scan = now + 0.5
+            if now >= next_drop:
+                farm.call(farm.boards[0].disconnect_all)
+                next_drop = now + 0.7
+            threads.append(threading.active_count())
+        lag_done.result(duration + 5.0)
+        for scan in scans:
+            if len(scan.result(10.0)) != hosts:
+                raise RuntimeError("并发扫描没有找到全部模拟从机")
+    finally:
+        link.stop()
+        io.stop()
+        farm.stop_background()
+    lags.sort()
+    return {
+        "ioloop_lag_p99_ms": metric(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, "ms"),
+        "ioloop_lag_max_ms": metric(lags[-1] * 1000, "ms"),
+        "ioloop_extra_threads": metric(max(threads) - idle_threads, "threads"),
+    }
+
+
+def bench_api(quick):
+    clients = 4
+    count = 300 if quick else 1500     # 每个客户端的命令数
+    depth = 16                          # 每个客户端不等响应连续发出的命令数
+    farm = SimulatorFarm.on_ports(1, 18095).start_background()
+    io = IoLoop("bench-io").start()
+    link = DeviceLink(io)
+    encoder = protocol.FrameEncoder()
+    state = output_state.OutputState(protocol.NUM_BITS)
+
+    def set_bits(request):
+        # 与界面的 set_bits + wait_ack 相同: 原子修改状态，编码后直接提交到流水线，ACK 后返回
+        change = state.update(toggle_bits=1 << int(request["toggle"]), source=output_state.SOURCE_API)
+        future = link.submit(encoder.encode_mask(change.mask), context=change.version)
+
+        async def wait_ack():
+            frame = await asyncio.wrap_future(future)
+            return {"version": change.version, "delivered": frame.delivered}
+        return wait_ack()
+
+    server = ControlServer(io, {"set_bits": set_bits}, port=0)
+    server.start()
+    state.subscribe(lambda change: server.publish("state", {"version": change.version}))
+    latencies = []
+    failures = []
+
+    def client(n):
+        sock = socket.create_connection(("127.0.0.1", server.port))
+        f = sock.makefile("rwb")
+        f.write(b'{"cmd": "subscribe", "topics": ["state"]}\n')
+        f.flush()
+        f.readline()
+        sent_at = {}
+        received = 0
+        for i in range(count + depth):
+            if i < count:
+                sent_at[i] = time.perf_counter()
+                f.write(json.dumps({"id": i, "cmd": "set_bits", "toggle": (n * 7 + i) % protocol.NUM_BITS})
+                        .encode() + b"\n")
+                f.flush()
+            if i < depth:
+                continue
+            while received < i - depth + 1:
+                reply = json.loads(f.readline())
+                if "event" in reply:
+                    continue
+                if not reply["ok"] or not reply["result"]["delivered"]:
+                    failures.append(reply)
+                latencies.append(time.perf_counter() - sent_at.pop(reply["id"]))
+                received += 1
+        sock.close()
+
+    try:
+        link.connect(*farm.boards[0].address).result(5.0)
+        workers = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        t = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60.0)
+        elapsed = time.perf_counter() - t
+        if failures or len(latencies) != clients * count:
+            raise RuntimeError(f"控制接口命令失败: {failures[:3]}")
+        if farm.boards[0].state != state.mask:
+            raise RuntimeError("模拟板的输出与状态存储不一致")
+    finally:
+        server.stop()
+        link.stop()
+        io.stop()
+        farm.stop_background()
+    latencies.sort()
+    return {
+        "api_changes_per_s": metric(clients * count / elapsed, "changes/s", HIGHER),
+        "api_command_p99_ms": metric(latencies[int(len(latencies) * 0.99)] * 1000, "ms"),
+    }
+
+
+def bench_state(quick):
+    rounds = 20000 if quick else 100000
+    num_bits = CHAIN_CHIPS * protocol.BITS_PER_CHIP
+    full = (1 << num_bits) - 1
+    state = output_state.OutputState(num_bits)
+    seen = []
+    state.subscribe(lambda change: seen.append(change.version))
+
+    def toggle_bits():
+        for i in range(rounds):
+            state.toggle(i % num_bits)
+    per_toggle = best_of(toggle_bits, rounds)
+
+    def bulk():
+        for i in range(rounds):
+            state.set_mask(full if i & 1 else 0)
+    per_bulk = best_of(bulk, rounds)
+
+    def snapshots():
+        for _ in range(rounds):
+            state.snapshot()
+    per_snapshot = best_of(snapshots, rounds)
+
+    def undo_redo():
+        for _ in range(rounds):
+            state.undo()
+            state.redo()
+    per_undo = best_of(undo_redo, rounds)
+
+    if seen[-1] != state.version or len(seen) != state.version:
+        raise RuntimeError("订阅方收到的版本与状态不一致")
+    return {
+        "state_toggle_us": metric(per_toggle * 1e6, "us"),
+        "state_bulk256_us": metric(per_bulk * 1e6, "us"),
+        "state_snapshot_us": metric(per_snapshot * 1e6, "us"),
+        "state_undo_redo_us": metric(per_undo * 1e6, "us"),
+    }
+
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "parse": bench_parse,
+    "scan": bench_scan,
+    "roundtrip": bench_roundtrip,
+    "chain": bench_chain,
+    "reconnect": bench_reconnect,
+    "ioloop": bench_ioloop,
+    "state": bench_state,
+    "api": bench_api,
+}
+
+
+# ---------- 结果与比较 ----------
+
+def compare(results, baseline, threshold):
+    """返回 [(指标, 基线值, 本次值, 变差百分比, 是否超出阈值)]"""
+    rows = []
+    base_metrics = baseline.get("metrics", {})
+    for name, m in results["metrics"].items():
+        base = base_metrics.get(name)
+        if base is None or not base["value"]:
+            continue
+        if m["better"] == HIGHER:
+            change = (base["value"] - m["value"]) / base["value"] * 100
+        else:
+            change = (m["value"] - base["value"]) / base["value"] * 100
+        rows.append((name, base["value"], m["value"], change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准套件")
+    parser.add_argument("--only", help="只运行指定的基准，逗号分隔: " + ",".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="减少迭代次数 (结果噪声更大)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许变差的百分比")
+    parser.add_argument("--ci", action="store_true", default=os.environ.get("CI", "").lower() not in ("", "0", "false"),
+                        help="CI 模式: 没有基线文件时失败 (设置了环境变量 CI 时默认开启)")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(unknown)}")
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "metrics": {},
+    }
+    for name in names:
+        t = time.perf_counter()
+        metrics = BENCHMARKS[name](args.quick)
+        results["metrics"].update(metrics)
+        print(f"[{name}] ({time.perf_counter() - t:.1f}s)")
+        for key, m in metrics.items():
+            print(f"    {key:<32} {m['value']:>12.2f} {m['unit']}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"已保存为基线 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        if args.ci:
+            print(f"CI 模式下没有基线文件 {args.baseline}，无法进行回归检查 (在 CI 机器上用 --save-baseline 创建)")
+            return 1
+        print("没有基线文件，跳过回归检查 (使用 --save-baseline 创建)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    rows = compare(results, baseline, args.threshold)
+    regressions = [r for r in rows if r[4]]
+    print(f"与基线比较 (阈值 {args.threshold:g}%):")
+    for name, base, value, change, bad in rows:
+        flag = "  <-- 退化" if bad else ""
+        print(f"    {name:<32} {base:>12.2f} -> {value:>12.2f}  {change:+6.1f}%{flag}")
+    if regressions:
+        print(f"{len(regressions)} 项指标退化超过 {args.threshold:g}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""本机控制接口 (每行一个 JSON，基于 TCP)
+
+供 MES 与测试脚本控制输出、回放序列、触发烧录和查询设备状态，不必点击界面。
+服务器运行在共享的 IoLoop 上 (不额外占用线程)，只监听 127.0.0.1；每个客户端一个协程，
+一个客户端发出的请求按顺序执行，多个客户端互不等待。
+
+请求 (一行一个 JSON 对象，id 可选，原样带回):
+    {"id": 1, "cmd": "set_mask", "mask": "0xff"}
+    {"id": 2, "batch": [{"cmd": "set_bits", "on": [3]}, {"cmd": "wait", "ms": 50}, {"cmd": "get_state"}]}
+响应 (每条命令一完成就写回一行，不等整批结束):
+    {"id": 1, "ok": true, "result": {...}}
+    {"id": 2, "index": 0, "ok": true, "result": {...}}      批量中的每一条
+    {"id": 2, "done": true, "ok": true, "count": 3}         批量结束 (出错时在出错的那条停止)
+    {"id": 3, "ok": false, "error": "..."}
+订阅 ({"cmd": "subscribe", "topics": ["state", "program"]}) 之后，服务器随时推送事件:
+    {"event": "state", "data": {...}}
+客户端来不及读取时推送的事件被丢弃 (计入统计)，不会拖慢其他客户端与界面。
+
+内置命令: ping、wait (ms)、subscribe / unsubscribe (topics)、commands；其余命令由调用方注册。
+命令处理函数 handler(request) 在事件循环线程中调用，不能阻塞；可以直接返回结果，也可以返回
+协程或 concurrent.futures.Future，等它完成后再写回。参数错误时抛出 CommandError / ValueError。
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import json
+import time
+
+# ================= 配置 =================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_LINE = 1 << 20              # 一行请求的最大长度 (字节)
+MAX_CLIENTS = 64
+EVENT_BUFFER_LIMIT = 1 << 20    # 客户端写缓冲超过这么多字节时不再推送事件
+MAX_WAIT_MS = 60000
+
+
+class CommandError(Exception):
+    """命令或参数错误，错误信息直接返回给客户端"""
+
+
+class _Client:
+    __slots__ = ("writer", "topics", "peer")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.topics = set()
+        self.peer = writer.get_extra_info("peername")
+
+
+class ControlServer:
+    """commands: {命令名: handler(request)}；start / stop / publish 可在任意线程调用 (事件循环线程除外)"""
+
+    def __init__(self, io_loop, commands=None, host=DEFAULT_HOST, port=DEFAULT_PORT, max_clients=MAX_CLIENTS,
+                 log=None):
+        self.io = io_loop
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.log = log
+        self.commands = {
+            "ping": self._cmd_ping,
+            "wait": self._cmd_wait,
+            "subscribe": None,          # 需要客户端上下文，在 _execute 中处理
+            "unsubscribe": None,
+            "commands": self._cmd_commands,
+        }
+        self.commands.update(commands or {})
+        self._server = None
+        self._clients = set()
+        self._topics = {}               # 主题 -> 订阅的客户端数，publish() 据此跳过无人订阅的事件
+
+        # 统计
+        self.connections = 0
+        self.rejected = 0
+        self.requests = 0
+        self.executed = 0
+        self.errors = 0
+        self.events_sent = 0
+        self.events_dropped = 0
+        self._busy_time = 0.0
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        """开始监听，返回实际端口 (port=0 时由系统分配)；端口被占用时抛出 OSError"""
+        return self.io.run(self._start(), timeout=5.0)
+
+    def stop(self):
+        if self.io.running and self._server is not None:
+            self.io.run(self._stop(), timeout=2.0)
+
+    async def _start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def _stop(self):
+        server, self._server = self._server, None
+        server.close()
+        for client in list(self._clients):
+            client.writer.close()
+        await server.wait_closed()
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    # ---------- 事件推送 ----------
+
+    def publish(self, topic, data):
+        """向订阅了 topic 的客户端推送一个事件 (任意线程)"""
+        if not self._topics.get(topic) or not self.io.running:
+            return
+        self.io.call_soon(self._publish, topic, data)
+
+    def _publish(self, topic, data):
+        line = None
+        for client in self._clients:
+            if topic not in client.topics:
+                continue
+            transport = client.writer.transport
+            if transport.is_closing() or transport.get_write_buffer_size() > EVENT_BUFFER_LIMIT:
+                self.events_dropped += 1
+                continue
+            if line is None:
+                line = _encode({"event": topic, "data": data})
+            client.writer.write(line)
+            self.events_sent += 1
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "clients": len(self._clients),
+            "connections": self.connections,
+            "rejected": self.rejected,
+            "requests": self.requests,
+            "commands": self.executed,
+            "errors": self.errors,
+            "events_sent": self.events_sent,
+            "events_dropped": self.events_dropped,
+            "avg_command_ms": self._busy_time / self.executed * 1000 if self.executed else 0.0,
+        }
+
+    # ---------- 客户端 ----------
+
+    async def _serve(self, reader, writer):
+        if len(self._clients) >= self.max_clients:
+            self.rejected += 1
+            writer.write(_encode({"ok": False, "error": "客户端过多"}))
+            writer.close()
+            return
+        client = _Client(writer)
+        self._clients.add(client)
+        self.connections += 1
+        if self.log:
+            self.log(f"控制接口: 客户端 {client.peer} 已连接")
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(_encode({"ok": False, "error": f"请求超过 {MAX_LINE} 字节"}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await self._handle_line(client, line)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._clients.discard(client)
+            self._set_topics(client, ())
+            writer.close()
+            if self.log:
+                self.log(f"控制接口: 客户端 {client.peer} 已断开")
+
+    async def _handle_line(self, client, line):
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是 JSON 对象")
+        except ValueError as e:
+            self.errors += 1
+            client.writer.write(_encode({"ok": False, "error": f"无法解析请求: {e}"}))
+            return
+        rid = request.get("id")
+        batch = request.get("batch")
+        if batch is None:
+            client.writer.write(_encode(await self._execute(client, request, rid)))
+            return
+        if not isinstance(batch, list):
+            self.errors += 1
+            client.writer.write(_encode({"id": rid, "ok": False, "error": "batch 必须是列表"}))
+            return
+        ok = True
+        count = 0
+        for index, item in enumerate(batch):
+            response = await self._execute(client, item, rid)
+            response["index"] = index
+            client.writer.write(_encode(response))
+            count += 1
+            if not response["ok"]:
+                ok = False
+                break
+            # 长批量中途让出写缓冲，客户端可以边发边收
+            if client.writer.transport.get_write_buffer_size() > EVENT_BUFFER_LIMIT:
+                await client.writer.drain()
+        client.writer.write(_encode({"id": rid, "done": True, "ok": ok, "count": count}))
+
+    async def _execute(self, client, request, rid):
+        start = time.perf_counter()
+        try:
+            if not isinstance(request, dict):
+                raise CommandError("命令必须是 JSON 对象")
+            name = request.get("cmd")
+            if name not in self.commands:
+                raise CommandError(f"未知命令: {name}")
+            if name in ("subscribe", "unsubscribe"):
+                result = self._cmd_subscribe(client, request, name == "subscribe")
+            else:
+                result = self.commands[name](request)
+                if isinstance(result, concurrent.futures.Future):
+                    result = await asyncio.wrap_future(result)
+                elif inspect.isawaitable(result):
+                    result = await result
+            response = {"id": rid, "ok": True, "result": result}
+        except (CommandError, ValueError, KeyError, TypeError, IndexError) as e:
+            self.errors += 1
+            response = {"id": rid, "ok": False, "error": str(e) or type(e).__name__}
+        except Exception as e:
+            self.errors += 1
+            response = {"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        self.executed += 1
+        self._busy_time += time.perf_counter() - start
+        return response
+
+    def _set_topics(self, client, topics):
+        for topic in client.topics - set(topics):
+            self._topics[topic] -= 1
+        for topic in set(topics) - client.topics:
+            self._topics[topic] = self._topics.get(topic, 0) + 1
+        client.topics = set(topics)
+
+    # ---------- 内置命令 ----------
+
+    def _cmd_subscribe(self, client, request, subscribe):
+        topics = request.get("topics", [])
+        if isinstance(topics, str):
+            topics = [topics]
+        if subscribe:
+            self._set_topics(client, client.topics | set(topics))
+        else:
+            self._set_topics(client, client.topics - set(topics))
+        return {"topics": sorted(client.topics)}
+
+    def _cmd_ping(self, request):
+        return {"time": time.time()}
+
+    async def _cmd_wait(self, request):
+        ms = float(request.get("ms", 0))
+        if not 0 <= ms <= MAX_WAIT_MS:
+            raise CommandError(f"ms 必须在 0–{MAX_WAIT_MS} 之间")
+        await asyncio.sleep(ms / 1000.0)
+        return {"waited_ms": ms}
+
+    def _cmd_commands(self, request):
+        return sorted(self.commands)
+
+
+def _encode(obj):
+    # 统计中的元组、异常等无法直接序列化的值转为字符串
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+def parse_mask(value):
+    """位掩码参数：整数或 "0x..." / "0b..." / 十进制字符串"""
+    if isinstance(value, bool):
+        raise CommandError("位掩码不能是布尔值")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return int(value.strip().replace("_", ""), 0)
+    raise CommandError(f"无法识别的位掩码: {value!r}")
+
+
+def format_mask(mask):
+    return f"{mask:#x}"
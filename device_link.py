@@ -0,0 +1,309 @@
+"""单台从机的控制连接 (在共享的 IoLoop 上)
+
+取代界面中的 连接线程 / 接收线程 / 心跳线程 / 重连线程：socket、接收、自适应心跳与掉线重连
+都在同一个后台事件循环中完成，连接多少次、断线重连多少次，线程数都不变。
+- 接收用 asyncio.BufferedProtocol，数据直接读入 FrameParser 的缓冲区 (与旧接收线程的
+  recv_into 一样不产生临时 bytes)，ACK / NAK 直接交给发送流水线；
+- 发送流水线的写出函数可在任意线程调用，写操作按调用顺序投递到事件循环；
+- 发送流水线的超时重传、心跳 (liveness.LivenessMonitor) 与重连 (reconnect.ReconnectManager)
+  的定时器都挂在同一个循环上；
+- 第一次连接某个地址时先发一个保活帧 (CMD 0x02) 探测固件是否回复 ACK，不回复的旧固件改为
+  重发最近一次提交的状态更新 (幂等) 作为保活，否则空闲的链路会被误判为掉线。
+
+on_event(event, detail) 在事件循环线程中回调，event 为:
+    CONNECTED  (ip, port)               connect() 成功
+    ACK / NAK  数量                      收到应答 (已交给发送流水线)
+    RX         [ParsedEvent]            状态帧或无法识别的数据
+    LOST       原因                      链路中断；auto_reconnect 为真时已开始自动重连
+    RETRY      (次数, 等待秒数, 异常)     一次重连失败
+    RECOVERED  (中断秒数, 重连次数)       重连成功
+    CLOSED     原因                      close() 主动断开
+界面层需自行转回主线程。
+"""
+import asyncio
+import time
+
+import protocol
+from liveness import LivenessMonitor
+from reconnect import ReconnectManager
+from send_pipeline import SendPipeline
+
+# ================= 配置 =================
+CONNECT_TIMEOUT = 2.0
+PING_PROBE_TIMEOUT = 0.5    # 连接时等待保活帧 ACK 的时间，超时视为固件不回复保活帧
+
+CONNECTED = "connected"
+ACK = "ack"
+NAK = "nak"
+RX = "rx"
+LOST = "lost"
+RETRY = "retry"
+RECOVERED = "recovered"
+CLOSED = "closed"
+
+
+class _LinkProtocol(asyncio.BufferedProtocol):
+    def __init__(self, link):
+        self.link = link
+        self.parser = protocol.FrameParser()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self.parser.free_space()
+
+    def buffer_updated(self, nbytes):
+        self.parser.commit(nbytes)
+        self.link._on_data(self, nbytes)
+
+    def eof_received(self):
+        return False # 对方关闭写端即视为断开
+
+    def connection_lost(self, exc):
+        self.link._on_connection_lost(self, exc)
+
+
+class DeviceLink:
+    """connect / close / submit 可在任意线程调用，其余状态只在事件循环线程中修改
+
+    on_result 传给 SendPipeline (每帧的确认结果)。recorder 为 session_recorder.SessionRecorder
+    时记录全部收发数据，可随时替换或置为 None。
+    """
+
+    def __init__(self, io_loop, on_event=None, on_result=None, auto_reconnect=True, window=None):
+        self.io = io_loop
+        self.on_event = on_event
+        self.auto_reconnect = auto_reconnect
+        self.recorder = None
+        self.address = None             # 最近一次连接的 (ip, port)，重连时使用
+        self.connected = False
+        self.connected_at = 0.0
+        self._protocol = None
+        self._transport = None
+        self.ping_acked = None          # 设备是否回复保活帧的 ACK，None 为尚未探测
+        self._ping_waiter = None
+        self._last_update = None        # 最近一次提交的状态更新，不回复保活帧时作为保活重发
+
+        pipeline_args = {} if window is None else {"window": window}
+        self.pipeline = SendPipeline(
+            self._transmit,
+            on_result=on_result,
+            # 出错时正持有流水线的锁，掉线处理转到事件循环中进行
+            on_error=lambda e: self.io.call_soon(self._lost, f"发送失败: {e}"),
+            io_loop=io_loop,
+            **pipeline_args,
+        ).start()
+        self.liveness = LivenessMonitor(self._send_keepalive, self._on_dead, rtt=self.pipeline.rtt,
+                                        io_loop=io_loop)
+        self.reconnector = ReconnectManager(
+            io_loop,
+            self._reconnect,
+            on_attempt=lambda n, delay, error: self._emit(RETRY, (n, delay, error)),
+            on_recovered=self._on_recovered,
+        ).start()
+
+        # 统计
+        self.tx_frames = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+
+    # ---------- 控制 (任意线程) ----------
+
+    def connect(self, ip, port):
+        """连接设备，返回 concurrent.futures.Future：成功时结果为 True，失败时为 OSError 等异常"""
+        return self.io.submit(self._connect(ip, port))
+
+    def close(self, reason="主动断开"):
+        """断开连接并停止自动重连，返回 Future"""
+        self.reconnector.cancel()
+        return self.io.submit(self._close(reason))
+
+    def stop(self):
+        """关闭连接并停止发送流水线 (程序退出时调用)"""
+        self.reconnector.stop()
+        if self.io.running:
+            self.io.run(self._close(None), timeout=2.0)
+        self.pipeline.stop()
+
+    def submit(self, payload, context=None):
+        if isinstance(payload, (list, tuple)):
+            payload = [bytes(frame) for frame in payload]
+        else:
+            payload = bytes(payload)
+        self._last_update = payload
+        return self.pipeline.submit(payload, context)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "address": self.address,
+            "ping_acked": self.ping_acked,
+            "uptime_s": time.monotonic() - self.connected_at if self.connected else 0.0,
+            "tx_frames": self.tx_frames,
+            "tx_bytes": self.tx_bytes,
+            "rx_bytes": self.rx_bytes,
+        }
+
+    # ---------- 发送 ----------
+
+    def _transmit(self, payload):
+        """发送流水线的写出函数 (任意线程)：按调用顺序投递到事件循环"""
+        if not self.connected:
+            raise OSError("连接已关闭")
+        self.liveness.on_tx()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record_tx(payload)
+        if self.io.in_loop_thread():
+            self._write(payload)
+        else:
+            self.io.loop.call_soon_threadsafe(self._write, payload)
+
+    def _write(self, payload):
+        transport = self._transport
+        if transport is None or transport.is_closing():
+            return # 已断开，帧在流水线中超时后报告失败
+        transport.write(payload)
+        self.tx_frames += 1
+        self.tx_bytes += len(payload)
+
+    def _send_keepalive(self):
+        """链路空闲时由心跳定时器调用：发送 4 字节保活帧 (AA 55 02 02)，而不是整帧状态
+
+        保活帧同样经过发送流水线，使它的 ACK 不会被错记到状态帧上。设备不回复保活帧时改为重发
+        最近一次提交的状态更新；还没有提交过状态时没有可以安全发送的帧，返回 None (本次不探测)。
+        """
+        if not self.connected:
+            return 0
+        if self.ping_acked:
+            self.pipeline.submit(protocol.PING_FRAME)
+            return len(protocol.PING_FRAME)
+        update = self._last_update
+        if update is None:
+            return None
+        self.pipeline.submit(update)
+        return sum(map(len, update)) if isinstance(update, list) else len(update)
+
+    # ---------- 以下在事件循环线程中执行 ----------
+
+    def _emit(self, event, detail=None):
+        if self.on_event:
+            try:
+                self.on_event(event, detail)
+            except Exception:
+                pass
+
+    async def _open(self, ip, port):
+        loop = asyncio.get_running_loop()
+        transport, proto = await asyncio.wait_for(
+            loop.create_connection(lambda: _LinkProtocol(self), ip, port), CONNECT_TIMEOUT)
+        self.pipeline.reset()
+        self._transport = transport
+        self._protocol = proto
+        if (ip, port) != self.address:
+            self.ping_acked = None
+        self.address = (ip, port)
+        if self.ping_acked is None:
+            self.ping_acked = await self._probe_ping(transport)
+            if self._protocol is not proto or transport.is_closing():
+                raise ConnectionError("探测保活帧时连接已断开")
+        self.connected = True
+        self.connected_at = time.monotonic()
+        self.liveness.start()
+
+    async def _probe_ping(self, transport):
+        """在流水线开始发送之前单独发一个保活帧，返回设备是否在 PING_PROBE_TIMEOUT 内回复 ACK"""
+        self._ping_waiter = asyncio.get_running_loop().create_future()
+        transport.write(protocol.PING_FRAME)
+        self.tx_frames += 1
+        self.tx_bytes += len(protocol.PING_FRAME)
+        try:
+            return await asyncio.wait_for(self._ping_waiter, PING_PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._ping_waiter = None
+
+    async def _connect(self, ip, port):
+        self.reconnector.cancel()
+        self._teardown()
+        try:
+            await self._open(ip, port)
+        except asyncio.TimeoutError:
+            raise OSError(f"连接 {ip}:{port} 超时") from None
+        self._emit(CONNECTED, self.address)
+        return True
+
+    async def _reconnect(self):
+        await self._open(*self.address)
+        return True
+
+    def _on_recovered(self, outage, attempts):
+        self._emit(RECOVERED, (outage, attempts))
+
+    async def _close(self, reason):
+        was_connected = self._teardown()
+        if reason is not None and was_connected:
+            self._emit(CLOSED, reason)
+
+    def _teardown(self):
+        """关闭 socket、停止心跳，在途帧全部报告失败；返回之前是否处于连接状态"""
+        was_connected = self.connected
+        self.connected = False
+        transport, self._transport, self._protocol = self._transport, None, None
+        if transport is not None:
+            transport.abort()
+        self.liveness.stop()
+        self.pipeline.reset()
+        return was_connected
+
+    def _lost(self, reason):
+        if not self.connected:
+            return # 已经处理过 (例如接收出错与发送出错同时发生)
+        self._teardown()
+        if self.auto_reconnect and self.address is not None:
+            self.reconnector.link_lost(reason)
+        self._emit(LOST, reason)
+
+    def _on_dead(self, silence):
+        self._lost(f"心跳超时 ({silence:.1f}s 未收到设备响应)")
+
+    def _on_connection_lost(self, proto, exc):
+        if proto is not self._protocol:
+            return # 旧连接 (主动断开或已被新连接取代)
+        self._lost(f"连接异常断开: {exc}" if exc else "从机设备断开了连接")
+
+    def _on_data(self, proto, nbytes):
+        if proto is not self._protocol:
+            return
+        self.rx_bytes += nbytes
+        self.liveness.on_rx()
+        parser = proto.parser
+        recorder = self.recorder
+        if recorder is not None:
+            # 刚读入的数据块位于解析缓冲区的末尾
+            recorder.record_rx(parser.view[parser.write_pos - nbytes:parser.write_pos])
+
+        acks = naks = 0
+        others = []
+        for event in parser.parse():
+            if event.kind == protocol.EVT_ACK:
+                acks += 1
+            elif event.kind == protocol.EVT_NAK:
+                naks += 1
+            else:
+                others.append(event)
+        waiter = self._ping_waiter
+        if acks and waiter is not None and not waiter.done():
+            waiter.set_result(True)         # 连接时探测保活帧的应答，不交给流水线
+            acks -= 1
+        if acks:
+            self.pipeline.on_ack(acks)
+            self._emit(ACK, acks)
+        if naks:
+            self.pipeline.on_nak(naks)
+            self._emit(NAK, naks)
+        if others:
+            self._emit(RX, others)
@@ -0,0 +1,182 @@
+"""多设备连接管理
+
+一个 DeviceManager 在共享的 IoLoop 上为 N 台从机各维护一个 device_link.DeviceLink：
+每台设备有自己的发送流水线 (按顺序对应 ACK、超时重传)、自适应心跳与掉线自动重连，
+但所有 socket 与定时器都挂在同一个事件循环上，无论管理多少台设备，后台只有 IoLoop 的一个线程。
+可以给不同设备发不同的更新，也可以把同一更新广播给所有设备，并汇报每台设备的状态。
+"""
+import asyncio
+import threading
+
+from device_link import DeviceLink
+from io_loop import IoLoop
+
+# 设备状态
+DISCONNECTED = "disconnected"
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+
+
+class DeviceManager:
+    """管理多台从机的连接；除 remove_device / close 外可在任意线程调用
+
+    on_event(name, event, detail) 转发各设备 DeviceLink 的事件 (event 见 device_link)，
+    on_result(name, FrameResult) 转发各设备发送流水线的确认结果，都在 IoLoop 线程中回调；
+    界面层需自行转回主线程。
+    """
+
+    def __init__(self, io_loop=None, on_event=None, on_result=None):
+        self._own_loop = io_loop is None
+        self.io = io_loop or IoLoop("device-manager")
+        self.on_event = on_event
+        self.on_result = on_result
+        self._lock = threading.Lock()
+        self._links = {}                # 设备名 -> DeviceLink
+        self._addresses = {}            # 设备名 -> 登记的 (ip, port)
+
+    def start(self):
+        self.io.start()
+        return self
+
+    def close(self):
+        """断开全部设备 (不要在 IoLoop 线程中调用)；管理器自己创建的 IoLoop 一并停止"""
+        for link in self.links().values():
+            link.stop()
+        if self._own_loop:
+            self.io.stop()
+
+    # ---------- 设备管理 ----------
+
+    def add_device(self, name, address=None, auto_reconnect=True, window=None):
+        """登记一台设备并返回它的 DeviceLink；address 为 (ip, port)，也可以在 connect 时再给出"""
+        with self._lock:
+            if name in self._links:
+                raise ValueError(f"设备 {name} 已存在")
+            link = DeviceLink(
+                self.io,
+                on_event=lambda event, detail: self._emit(name, event, detail),
+                on_result=lambda result: self._result(name, result),
+                auto_reconnect=auto_reconnect,
+                window=window,
+            )
+            self._links[name] = link
+            self._addresses[name] = address
+        return link
+
+    def remove_device(self, name):
+        """断开并移除一台设备 (不要在 IoLoop 线程中调用)"""
+        with self._lock:
+            link = self._links.pop(name)
+            self._addresses.pop(name, None)
+        link.stop()
+
+    def link(self, name):
+        with self._lock:
+            return self._links[name]
+
+    def links(self):
+        """返回 {设备名: DeviceLink} 的快照 (按登记顺序)"""
+        with self._lock:
+            return dict(self._links)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._links)
+
+    # ---------- 连接 ----------
+
+    def connect(self, name, address=None):
+        """连接一台设备，返回 concurrent.futures.Future (同 DeviceLink.connect)
+
+        给出 address 时替换登记的地址；否则使用登记的地址或该设备上一次连接的地址。
+        """
+        with self._lock:
+            link = self._links[name]
+            if address is not None:
+                self._addresses[name] = address
+            address = self._addresses[name] or link.address
+        if address is None:
+            raise ValueError(f"设备 {name} 没有地址")
+        return link.connect(*address)
+
+    def connect_all(self):
+        """并行连接全部设备，返回 Future，结果为 {设备名: 是否连接成功}"""
+        return self.io.submit(self._connect_all())
+
+    def disconnect(self, name, reason="主动断开"):
+        return self.link(name).close(reason)
+
+    # ---------- 发送 ----------
+
+    def send(self, name, payload, context=None):
+        """给指定设备提交一次更新，返回 Future，结果为 send_pipeline.FrameResult"""
+        return self.link(name).submit(payload, context)
+
+    def send_many(self, updates, context=None):
+        """updates: {设备名: 更新}，每台设备发各自的更新；返回 {设备名: Future}"""
+        links = self.links()
+        return {name: links[name].submit(payload, context) for name, payload in updates.items()}
+
+    def broadcast(self, payload, context=None):
+        """把同一次更新提交给全部设备，返回 {设备名: Future}；未连接的设备对应的结果为失败"""
+        if isinstance(payload, (list, tuple)):
+            payload = [bytes(frame) for frame in payload]
+        else:
+            payload = bytes(payload)
+        return {name: link.submit(payload, context) for name, link in self.links().items()}
+
+    # ---------- 状态 ----------
+
+    def status(self):
+        """返回 {设备名: 状态 dict} (普通 dict，可以安全地交给其他线程)"""
+        result = {}
+        for name, link in self.links().items():
+            pipeline = link.pipeline.stats()
+            if link.connected:
+                state = CONNECTED
+            elif link.reconnector.active:
+                state = RECONNECTING
+            else:
+                state = DISCONNECTED
+            status = link.stats()
+            status.update(
+                name=name,
+                state=state,
+                delivered=pipeline["delivered"],
+                failed=pipeline["failed"],
+                retransmits=pipeline["retransmits"],
+                in_flight=pipeline["in_flight"],
+                queued=pipeline["queued"],
+                srtt_ms=pipeline["srtt_ms"],
+                reconnects=link.reconnector.recovered,
+            )
+            result[name] = status
+        return result
+
+    def summary(self):
+        """返回各状态的设备数，例如 {"connected": 198, "reconnecting": 2, "disconnected": 0}"""
+        counts = dict.fromkeys((CONNECTED, RECONNECTING, DISCONNECTED), 0)
+        for status in self.status().values():
+            counts[status["state"]] += 1
+        return counts
+
+    # ---------- 以下在 IoLoop 线程中执行 ----------
+
+    def _emit(self, name, event, detail):
+        if self.on_event:
+            try:
+                self.on_event(name, event, detail)
+            except Exception:
+                pass
+
+    def _result(self, name, result):
+        if self.on_result:
+            self.on_result(name, result)
+
+    async def _connect_all(self):
+        names = list(self.links())
+        results = await asyncio.gather(*(self._connect_one(name) for name in names), return_exceptions=True)
+        return {name: result is True for name, result in zip(names, results)}
+
+    async def _connect_one(self, name):
+        return await asyncio.wrap_future(self.connect(name))
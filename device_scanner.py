@@ -0,0 +1,368 @@
+"""局域网设备扫描 (asyncio 版)
+
+用一个事件循环 + 固定数量的协程并发探测整个网段，取代旧版每个主机一个线程的扫描方式。
+可以扫描任意 CIDR 网段，返回所有应答的从机及其连接耗时，并在发现时立即回调。
+
+探测顺序按可能性排列 (rank_hosts)：系统邻居表 (ARP 缓存) 中的地址最先，其次是以前应答过的
+地址 (HostHistory，带有效期的本地缓存)，最后才是网段内其余地址。已知的从机通常在第一轮
+就能找到，不用等整段扫完。
+"""
+import asyncio
+import ipaddress
+import itertools
+import json
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，改用主机名解析出的地址
+    fcntl = None
+
+# ================= 配置 =================
+DEFAULT_CONCURRENCY = 256          # 同时进行中的连接数上限
+DEFAULT_TIMEOUTS = (0.2, 0.4)      # 第一次 0.2s，超时后重试 0.4s (与旧版一致)
+HISTORY_TTL = 7 * 24 * 3600        # 应答记录的有效期 (秒)
+HISTORY_MAX = 256                  # 最多保留的记录数
+ARP_TABLE = "/proc/net/arp"
+ROUTE_TABLE = "/proc/net/route"
+ARP_TIMEOUT = 2.0
+
+# Linux ioctl: 读取接口地址与掩码
+_SIOCGIFADDR = 0x8915
+_SIOCGIFNETMASK = 0x891B
+
+# ip: 设备地址, port: 端口, latency: TCP 建连耗时 (秒)
+ScanResult = namedtuple("ScanResult", ["ip", "port", "latency"])
+
+# name: 接口名 (Windows 上为空), ip: 接口地址, netmask: 子网掩码
+Interface = namedtuple("Interface", ["name", "ip", "netmask"])
+
+
+def local_interfaces():
+    """本机的 IPv4 接口列表 (不含回环)；拿不到掩码时按 /24 处理"""
+    interfaces = []
+    if fcntl is not None and sys.platform.startswith("linux"):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for _, name in socket.if_nameindex():
+                request = struct.pack("256s", name.encode()[:15])
+                try:
+                    ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), _SIOCGIFADDR, request)[20:24])
+                    netmask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), _SIOCGIFNETMASK, request)[20:24])
+                except OSError:
+                    continue # 接口没有 IPv4 地址
+                if not ip.startswith("127."):
+                    interfaces.append(Interface(name, ip, netmask))
+        finally:
+            s.close()
+    else:
+        try:
+            infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+        except OSError:
+            infos = []
+        for info in infos:
+            ip = info[4][0]
+            if not ip.startswith("127.") and all(i.ip != ip for i in interfaces):
+                interfaces.append(Interface("", ip, "255.255.255.0"))
+    return interfaces
+
+
+def broadcast_address(interface):
+    """接口所在子网的广播地址"""
+    network = ipaddress.ip_network(f"{interface.ip}/{interface.netmask}", strict=False)
+    return str(network.broadcast_address)
+
+
+def get_local_ip(interfaces=None):
+    """获取本机在局域网中的 IP
+
+    在接口列表中选择：默认路由所在的接口 (Linux 读路由表) 优先，其次是私有地址，
+    自动分配的链路本地地址 (169.254.x.x) 最后；没有可用接口时用主机名解析。
+    interfaces 默认为 local_interfaces()。
+    """
+    if interfaces is None:
+        interfaces = local_interfaces()
+    if interfaces:
+        return sorted(interfaces, key=_interface_ranker())[0].ip
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return None
+
+
+def default_route_interfaces():
+    """默认路由所在的接口名集合 (只在 Linux 上读 /proc/net/route，其他系统返回空集合)"""
+    names = set()
+    try:
+        with open(ROUTE_TABLE) as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return names
+    for line in lines:
+        fields = line.split()
+        # Iface | Destination | Gateway | ...；目的地址为 0 的是默认路由
+        if len(fields) >= 2 and fields[1] == "00000000":
+            names.add(fields[0])
+    return names
+
+
+def _interface_ranker():
+    default = default_route_interfaces()
+
+    def rank(interface):
+        address = ipaddress.ip_address(interface.ip)
+        if address.is_link_local:
+            return 3
+        if interface.name in default:
+            return 0
+        return 1 if address.is_private else 2
+    return rank
+
+
+def local_network(prefix=24, interfaces=None):
+    """返回本机所在网段 (默认 /24)，例如 '192.168.1.0/24'"""
+    local_ip = get_local_ip(interfaces)
+    if not local_ip:
+        return None
+    return str(ipaddress.ip_network(f"{local_ip}/{prefix}", strict=False))
+
+
+def local_networks(max_prefix=24, interfaces=None):
+    """每个本地接口所在的网段 (去重，按 get_local_ip 的优先顺序)
+
+    比 /max_prefix 更大的网段 (例如 /16) 只取接口地址所在的 /max_prefix，避免扫描数万个地址。
+    """
+    if interfaces is None:
+        interfaces = local_interfaces()
+    networks = []
+    for interface in sorted(interfaces, key=_interface_ranker()):
+        network = ipaddress.ip_network(f"{interface.ip}/{interface.netmask}", strict=False)
+        if network.prefixlen < max_prefix:
+            network = ipaddress.ip_network(f"{interface.ip}/{max_prefix}", strict=False)
+        if str(network) not in networks:
+            networks.append(str(network))
+    return networks
+
+
+async def local_interfaces_async():
+    """local_interfaces 的 asyncio 版：在线程池中执行 (Windows 上的主机名解析可能阻塞)，不阻塞事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, local_interfaces)
+
+
+_IPV4_RE = re.compile(r"\b(\d{1,3}(?:\.\d{1,3}){3})\b")
+_MAC_RE = re.compile(r"([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}")
+
+
+def read_neighbors():
+    """系统邻居表 (ARP 缓存) 中已解析出 MAC 的 IPv4 地址列表
+
+    Linux 直接读 /proc/net/arp；其他系统解析 `arp -a` 的输出。读取失败时返回空列表。
+    """
+    neighbors = []
+    if os.path.exists(ARP_TABLE):
+        try:
+            with open(ARP_TABLE) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            return neighbors
+        for line in lines:
+            fields = line.split()
+            # IP address | HW type | Flags | HW address | Mask | Device；Flags 为 0x0 表示未解析
+            if len(fields) >= 4 and fields[2] != "0x0" and fields[3] != "00:00:00:00:00:00":
+                neighbors.append(fields[0])
+        return neighbors
+    try:
+        output = subprocess.run(["arp", "-a"], capture_output=True, text=True, timeout=ARP_TIMEOUT,
+                                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)).stdout
+    except (OSError, subprocess.SubprocessError):
+        return neighbors
+    return _parse_arp_output(output)
+
+
+async def read_neighbors_async():
+    """read_neighbors 的 asyncio 版：`arp -a` 作为异步子进程运行，等待期间不阻塞事件循环"""
+    if os.path.exists(ARP_TABLE):
+        return read_neighbors()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "arp", "-a", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+    except (OSError, NotImplementedError):
+        return []
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(), ARP_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        return []
+    return _parse_arp_output(output.decode(errors="replace"))
+
+
+def _parse_arp_output(output):
+    neighbors = []
+    for line in output.splitlines():
+        ip = _IPV4_RE.search(line)
+        if ip and _MAC_RE.search(line):
+            neighbors.append(ip.group(1))
+    return neighbors
+
+
+class HostHistory:
+    """以前应答过的设备地址 (ip, port) 及最后一次应答时间，保存在本地 JSON 文件
+
+    超过 ttl 的记录不再参与排序，保存时丢弃。只在一个线程中使用。
+    """
+
+    def __init__(self, path, ttl=HISTORY_TTL, max_entries=HISTORY_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen = {}                 # "ip:port" -> 最后应答时间 (time.time())
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._seen = {k: float(v) for k, v in data.items() if isinstance(v, (int, float))}
+        except (OSError, ValueError):
+            pass
+
+    def record(self, ip, port, when=None):
+        self._seen[f"{ip}:{port}"] = time.time() if when is None else when
+
+    def recent(self, port, now=None):
+        """port 上仍在有效期内的地址，最近应答的在前"""
+        now = time.time() if now is None else now
+        hits = []
+        for key, seen in self._seen.items():
+            ip, _, p = key.rpartition(":")
+            if p == str(port) and now - seen <= self.ttl:
+                hits.append((seen, ip))
+        hits.sort(reverse=True)
+        return [ip for _, ip in hits]
+
+    def save(self):
+        now = time.time()
+        entries = sorted(((v, k) for k, v in self._seen.items() if now - v <= self.ttl), reverse=True)
+        self._seen = {k: v for v, k in entries[:self.max_entries]}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._seen, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def rank_hosts(cidr, exclude=(), neighbors=(), known=()):
+    """按可能性排列应优先探测的地址: 邻居表中且以前应答过 > 邻居表 > 以前应答过
+
+    known 为以前应答过的地址 (例如 HostHistory.recent(port))。只返回网段内的地址；
+    传给 scan(priority=...) 后，网段内其余地址按顺序排在后面。
+    """
+    network = ipaddress.ip_network(cidr, strict=False)
+    skip = set(exclude)
+
+    def usable(ip):
+        try:
+            return ip not in skip and ipaddress.ip_address(ip) in network
+        except ValueError:
+            return False
+
+    near = [ip for ip in dict.fromkeys(neighbors) if usable(ip)]
+    known = [ip for ip in dict.fromkeys(known) if usable(ip)]
+    known_set = set(known)
+    near_set = set(near)
+    priority = [ip for ip in near if ip in known_set]
+    priority += [ip for ip in near if ip not in known_set]
+    priority += [ip for ip in known if ip not in near_set]
+    return priority
+
+
+def iter_hosts(cidr, exclude=()):
+    """按顺序产出网段内的主机地址 (字符串)，跳过 exclude 中的地址"""
+    network = ipaddress.ip_network(cidr, strict=False)
+    skip = set(exclude)
+    # /32 或 /31 时 hosts() 的行为不统一，单独处理
+    hosts = network.hosts() if network.num_addresses > 2 else iter(network)
+    for addr in hosts:
+        ip = str(addr)
+        if ip not in skip:
+            yield ip
+
+
+async def probe(ip, port, timeouts=DEFAULT_TIMEOUTS):
+    """尝试 TCP 连接一次目标，成功返回建连耗时 (秒)，失败返回 None
+
+    只有超时才会用下一个超时值重试；对方直接拒绝 (RST) 时立即放弃。
+    """
+    for timeout in timeouts:
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except asyncio.TimeoutError:
+            continue
+        except OSError:
+            return None
+        latency = time.perf_counter() - start
+        writer.close()
+        return latency
+    return None
+
+
+async def scan_async(cidr, port, concurrency=DEFAULT_CONCURRENCY, timeouts=DEFAULT_TIMEOUTS,
+                     on_found=None, exclude=(), stop_event=None, priority=(), max_results=None):
+    """并发扫描 cidr 网段内开放 port 的主机
+
+    priority 中的地址 (例如 rank_hosts 的结果) 最先探测，其余按地址顺序。
+    on_found(result) 在每发现一台设备时立即调用 (在事件循环线程中)。
+    stop_event 为 threading.Event，置位后尽快结束扫描；找到 max_results 台后也提前结束。
+    返回按建连耗时排序的 ScanResult 列表。
+    """
+    first = list(dict.fromkeys(priority))
+    hosts = itertools.chain(first, iter_hosts(cidr, set(exclude) | set(first)))
+    results = []
+    done = asyncio.Event()
+
+    async def worker():
+        # 固定数量的 worker 从同一个迭代器取地址，大网段也不会一次性创建海量任务
+        for ip in hosts:
+            if done.is_set() or (stop_event is not None and stop_event.is_set()):
+                return
+            latency = await probe(ip, port, timeouts)
+            if latency is not None and not done.is_set():
+                result = ScanResult(ip, port, latency)
+                results.append(result)
+                if on_found:
+                    on_found(result)
+                if max_results and len(results) >= max_results:
+                    done.set()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    finished = asyncio.ensure_future(asyncio.gather(*workers))
+    stopper = asyncio.ensure_future(done.wait())
+    try:
+        # 找够数量时不必等其余正在超时的探测
+        await asyncio.wait([finished, stopper], return_when=asyncio.FIRST_COMPLETED)
+        if finished.done():
+            finished.result() # 传递 worker 中的异常
+    finally:
+        stopper.cancel()
+        for w in workers:
+            w.cancel()
+
+    results.sort(key=lambda r: r.latency)
+    return results
+
+
+def scan(cidr, port, concurrency=DEFAULT_CONCURRENCY, timeouts=DEFAULT_TIMEOUTS,
+         on_found=None, exclude=(), stop_event=None, priority=(), max_results=None):
+    """scan_async 的同步封装，在调用线程中运行一个临时事件循环"""
+    return asyncio.run(scan_async(cidr, port, concurrency, timeouts, on_found, exclude, stop_event,
+                                  priority, max_results))
@@ -0,0 +1,204 @@
+"""UDP 广播设备发现
+
+主机在每个本地 IPv4 接口上向所在子网的广播地址发一个探测包，从机回复自己的身份、控制端口、
+芯片数与固件版本；在一个短的收集窗口内 (默认 0.5 s) 收齐应答。一个探测包取代对整个网段
+几百次 TCP 建连，也不会给网络上的其他主机带来连接请求。没有任何应答时 (例如固件还不支持)
+由调用方回退到 device_scanner 的 TCP 扫描。
+
+报文 (UDP，默认端口 DISCOVERY_PORT，小端):
+    探测  "WFDQ" | 版本 u8 | 随机数 u32
+    应答  "WFDR" | 版本 u8 | 随机数 u32 (原样返回探测中的值) | UTF-8 JSON
+JSON 字段: id (设备标识), port (控制用 TCP 端口), chips (595 数量), fw (固件版本)；
+代替其他设备应答时 (例如 slave_simulator 的模拟板) 另外给出 ip。
+
+DiscoveryResponder 是应答端的 asyncio 实现，slave_simulator 用它在没有硬件时测试发现流程。
+"""
+import asyncio
+import json
+import random
+import struct
+import time
+from collections import namedtuple
+
+import device_scanner
+
+# ================= 配置 =================
+DISCOVERY_PORT = 8089
+DEFAULT_WINDOW = 0.5            # 收集应答的时间 (秒)
+DEFAULT_REPEATS = 2             # 探测包发送次数 (UDP 可能丢包，重复的应答会去重)
+LIMITED_BROADCAST = "255.255.255.255"
+
+VERSION = 1
+PROBE_MAGIC = b"WFDQ"
+REPLY_MAGIC = b"WFDR"
+HEADER = struct.Struct("<4sBI")
+
+# ip/port: 设备控制地址, device_id: 设备标识, chips: 芯片数 (未知为 None),
+# firmware: 固件版本, latency: 从发出探测到收到应答的时间 (秒)
+DeviceInfo = namedtuple("DeviceInfo", ["ip", "port", "device_id", "chips", "firmware", "latency"])
+
+
+def build_probe(nonce):
+    return HEADER.pack(PROBE_MAGIC, VERSION, nonce)
+
+
+def parse_probe(data):
+    """探测包 -> 随机数；不是探测包时返回 None"""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, nonce = HEADER.unpack_from(data)
+    if magic != PROBE_MAGIC or version != VERSION:
+        return None
+    return nonce
+
+
+def build_reply(nonce, info):
+    return HEADER.pack(REPLY_MAGIC, VERSION, nonce) + json.dumps(info, separators=(",", ":")).encode("utf-8")
+
+
+def parse_reply(data, nonce):
+    """应答包 -> 字典；格式不对或不是对本次探测的应答时返回 None"""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, reply_nonce = HEADER.unpack_from(data)
+    if magic != REPLY_MAGIC or version != VERSION or reply_nonce != nonce:
+        return None
+    try:
+        info = json.loads(bytes(data[HEADER.size:]).decode("utf-8"))
+    except ValueError:
+        return None
+    return info if isinstance(info, dict) else None
+
+
+def default_targets(interfaces=None):
+    """[(本地绑定地址, 广播地址)]：每个接口各发一次；取不到接口时用受限广播
+
+    interfaces 默认为 device_scanner.local_interfaces()。
+    """
+    if interfaces is None:
+        interfaces = device_scanner.local_interfaces()
+    targets = [(i.ip, device_scanner.broadcast_address(i)) for i in interfaces]
+    return targets or [("0.0.0.0", LIMITED_BROADCAST)]
+
+
+class _ProbeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc):
+        pass # 例如目标不可达的 ICMP，发现过程不关心
+
+
+async def discover_async(window=DEFAULT_WINDOW, port=DISCOVERY_PORT, targets=None, default_port=8080,
+                         repeats=DEFAULT_REPEATS, on_found=None, stop_event=None):
+    """广播探测并在 window 秒内收集应答，返回按应答时间排序的 DeviceInfo 列表
+
+    targets 为 [(本地绑定地址, 目标地址)]，默认 default_targets()；目标可以是单播地址。
+    应答中没有 port 时使用 default_port。on_found(device) 在每发现一台设备时立即调用
+    (在事件循环线程中)；stop_event 为 threading.Event，置位后提前结束。
+    """
+    loop = asyncio.get_running_loop()
+    nonce = random.getrandbits(32)
+    probe_packet = build_probe(nonce)
+    found = {}
+    start = time.perf_counter()
+
+    def on_datagram(data, addr):
+        info = parse_reply(data, nonce)
+        if info is None:
+            return
+        try:
+            ip = str(info.get("ip") or addr[0])
+            tcp_port = int(info.get("port", default_port))
+            chips = int(info["chips"]) if "chips" in info else None
+        except (TypeError, ValueError):
+            return
+        key = (ip, tcp_port)
+        if key in found:
+            return
+        device = DeviceInfo(ip, tcp_port, str(info.get("id", "")), chips, str(info.get("fw", "")),
+                            time.perf_counter() - start)
+        found[key] = device
+        if on_found:
+            on_found(device)
+
+    endpoints = []
+    for bind_ip, dest in targets or default_targets():
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _ProbeProtocol(on_datagram), local_addr=(bind_ip, 0), allow_broadcast=True)
+        except OSError:
+            continue # 接口已关闭或地址不可绑定
+        endpoints.append((transport, (dest, port)))
+
+    try:
+        deadline = loop.time() + window
+        for n in range(max(1, repeats)):
+            for transport, address in endpoints:
+                try:
+                    transport.sendto(probe_packet, address)
+                except OSError:
+                    pass
+            # 重复探测均匀分布在窗口的前半段，后半段只收应答
+            resend_at = loop.time() + window / 2 / max(1, repeats)
+            while loop.time() < (resend_at if n < repeats - 1 else deadline):
+                if stop_event is not None and stop_event.is_set():
+                    return sorted(found.values(), key=lambda d: d.latency)
+                await asyncio.sleep(0.02)
+    finally:
+        for transport, _ in endpoints:
+            transport.close()
+    return sorted(found.values(), key=lambda d: d.latency)
+
+
+def discover(window=DEFAULT_WINDOW, port=DISCOVERY_PORT, targets=None, default_port=8080,
+             repeats=DEFAULT_REPEATS, on_found=None, stop_event=None):
+    """discover_async 的同步封装，在调用线程中运行一个临时事件循环"""
+    return asyncio.run(discover_async(window, port, targets, default_port, repeats, on_found, stop_event))
+
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    """应答端：收到探测包时为 get_devices() 返回的每台设备回复一个应答
+
+    get_devices() 返回 [info 字典]，字段见模块说明。用 start() 在当前事件循环上监听。
+    """
+
+    def __init__(self, get_devices):
+        self.get_devices = get_devices
+        self.transport = None
+        self.probes = 0
+        self.replies = 0
+
+    @classmethod
+    async def start(cls, get_devices, host="0.0.0.0", port=DISCOVERY_PORT):
+        loop = asyncio.get_running_loop()
+        _, responder = await loop.create_datagram_endpoint(
+            lambda: cls(get_devices), local_addr=(host, port), allow_broadcast=True)
+        return responder
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info("sockname")[1]
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        nonce = parse_probe(data)
+        if nonce is None:
+            return
+        self.probes += 1
+        for info in self.get_devices():
+            self.transport.sendto(build_reply(nonce, info), addr)
+            self.replies += 1
+
+    def error_received(self, exc):
+        pass
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
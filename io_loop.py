@@ -0,0 +1,69 @@
+"""后台 I/O 事件循环
+
+在一个守护线程中运行 asyncio 事件循环，所有 socket 和定时器都挂在这个循环上，
+其他线程 (包括 Tk 主线程) 通过 submit / call_soon 把工作投递进来。
+"""
+import asyncio
+import threading
+
+
+class IoLoop:
+    def __init__(self, name="io-loop"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """启动后台线程，返回时事件循环已经在运行"""
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            # 取消残留任务，避免关闭时出现 "Task was destroyed but it is pending"
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def stop(self, timeout=2.0):
+        if self._thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self._ready.clear()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """从任意线程提交协程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """从任意线程投递一个普通回调到事件循环"""
+        if self.in_loop_thread():
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果 (不要在事件循环线程中调用)"""
+        return self.submit(coro).result(timeout)
@@ -0,0 +1,204 @@
+"""自适应心跳与事件驱动看门狗
+
+取代每秒轮询一次、固定 2 秒探测 / 6 秒判定掉线的看门狗：
+- 只在链路空闲 (一段时间内既没有发送也没有收到数据) 时才发送 4 字节的保活帧，
+  正常数据帧本身已经能证明链路存活，不会产生额外流量；
+- 探测间隔与掉线判定时间由实测 RTT 与抖动计算，网络好时可以在 1 秒左右发现掉线；
+- 定时器只在下一个截止时间醒来，没有固定周期的轮询。给出 io_loop 时定时器挂在该 IoLoop 上，
+  不再单独占用一个线程。
+"""
+import threading
+import time
+
+# ================= 配置 =================
+MIN_PROBE_INTERVAL = 0.25
+MAX_PROBE_INTERVAL = 2.0
+MIN_DEAD_TIMEOUT = 1.0
+MAX_DEAD_TIMEOUT = 6.0
+PROBE_RTT_FACTOR = 20       # 空闲超过 20 倍 RTT 才探测
+PROBES_BEFORE_DEAD = 3      # 掉线判定前至少留出 3 次探测的重传时间
+
+# _check 的结果
+PROBE = "probe"
+DEAD = "dead"
+
+
+class LivenessMonitor:
+    """send_probe() 发送一个保活帧并返回其字节数，返回 None 表示当前没有可以发送的探测帧
+    (这时顺延掉线判定，只依赖 TCP 断开)；on_dead(silence) 在判定掉线时调用一次
+
+    rtt 为 send_pipeline.RttEstimator (读取其 srtt / rttvar / rto)，为 None 时使用上限值。
+    io_loop 为 io_loop.IoLoop 时 send_probe 与 on_dead 在该事件循环线程中调用，否则在自己的线程中。
+    """
+
+    def __init__(self, send_probe, on_dead, rtt=None,
+                 min_interval=MIN_PROBE_INTERVAL, max_interval=MAX_PROBE_INTERVAL,
+                 min_timeout=MIN_DEAD_TIMEOUT, max_timeout=MAX_DEAD_TIMEOUT, io_loop=None):
+        self.send_probe = send_probe
+        self.on_dead = on_dead
+        self.rtt = rtt
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        self.io = io_loop
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._timer = None
+        self._generation = 0            # 每次 start 加一，作废上一次连接遗留的定时器
+        self.started_at = 0.0
+        self.last_rx = 0.0
+        self.last_tx = 0.0
+        self.first_probe = 0.0          # 最后一次收到数据之后发出的第一个探测
+
+        # 统计指标
+        self.probes_sent = 0
+        self.probe_bytes = 0
+        self.detection_time = None     # 判定掉线时距最后一次收到数据的时间 (秒)
+
+    # ---------- 参数计算 ----------
+
+    def probe_interval(self):
+        if self.rtt is None or self.rtt.srtt is None:
+            return self.max_interval
+        interval = PROBE_RTT_FACTOR * (self.rtt.srtt + 4 * self.rtt.rttvar)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def dead_timeout(self):
+        if self.rtt is None or self.rtt.srtt is None:
+            return self.max_timeout
+        # 用未退避的 RTO：掉线期间重传会让 rtt.rto 不断翻倍，不能让它拖慢掉线判定
+        rto = max(self.rtt.min_rto, self.rtt.srtt + 4 * self.rtt.rttvar)
+        timeout = self.probe_interval() + PROBES_BEFORE_DEAD * rto
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    # ---------- 事件 (任意线程) ----------
+
+    def on_rx(self):
+        """收到任何数据 (包括 NAK) 都说明链路存活"""
+        self.last_rx = time.monotonic()
+
+    def on_tx(self):
+        """有数据发出：空闲计时重新开始，推迟下一次探测"""
+        self.last_tx = time.monotonic()
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+            self._generation += 1
+            self.started_at = self.last_rx = self.last_tx = time.monotonic()
+            self.first_probe = 0.0
+            self.detection_time = None
+        if self.io is not None:
+            self.io.call_soon(self._tick, self._generation)
+            return self
+        self._thread = threading.Thread(target=self._run, name="liveness", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self.io is not None:
+            self.io.call_soon(self._cancel_timer)
+            return
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+        self._thread = None
+
+    def stats(self):
+        elapsed = max(1e-9, time.monotonic() - self.started_at) if self.started_at else None
+        return {
+            "probe_interval_ms": self.probe_interval() * 1000,
+            "dead_timeout_ms": self.dead_timeout() * 1000,
+            "probes_sent": self.probes_sent,
+            "probe_bytes": self.probe_bytes,
+            "keepalive_bps": self.probe_bytes / elapsed if elapsed else 0.0,
+            "detection_time_ms": None if self.detection_time is None else self.detection_time * 1000,
+        }
+
+    def _check(self, now):
+        """返回 (动作, 等待时间)：DEAD 判定掉线，PROBE 应发送探测，None 时睡到下一个截止时间
+
+        只有最后一次收到数据之后确实发出过数据 (探测或数据帧) 时才判定掉线。测得 RTT 后判定时间
+        会变短，定时器可能已经睡过了新的截止时间，这时要先探测，并给探测留出重传时间。
+        """
+        timeout = self.dead_timeout()
+        interval = self.probe_interval()
+        next_dead = self.last_rx + timeout
+        if self.first_probe > self.last_rx:
+            next_dead = max(next_dead, self.first_probe + timeout - interval)
+        if now > next_dead and self.last_tx > self.last_rx:
+            return DEAD, 0.0
+        idle = now - max(self.last_rx, self.last_tx)
+        if idle >= interval:
+            return PROBE, 0.0
+        next_probe = max(self.last_rx, self.last_tx) + interval
+        return None, max(0.001, min(next_probe, next_dead) - now)
+
+    def _probe(self):
+        size = self.send_probe()
+        now = time.monotonic()
+        self.last_tx = now
+        if size is None:
+            # 无法探测就无从判断链路是否存活，不能因为设备没有应答而判定掉线
+            self.last_rx = now
+            return
+        if self.first_probe <= self.last_rx:
+            self.first_probe = now
+        self.probes_sent += 1
+        self.probe_bytes += size
+
+    def _run(self):
+        dead = False
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                action, wait = self._check(now)
+                if action == DEAD:
+                    self.detection_time = now - self.last_rx
+                    self._running = False
+                    dead = True
+                    break
+                if action == PROBE:
+                    self._cond.release()
+                    try:
+                        self._probe()
+                    finally:
+                        self._cond.acquire()
+                    continue
+                # 睡到下一次探测或掉线判定的截止时间
+                self._cond.wait(wait)
+        if dead:
+            self.on_dead(self.detection_time)
+
+    # ---------- IoLoop 定时器 (事件循环线程) ----------
+
+    def _tick(self, generation):
+        if generation != self._generation:
+            return
+        self._timer = None
+        if not self._running:
+            return
+        now = time.monotonic()
+        action, wait = self._check(now)
+        if action == DEAD:
+            self.detection_time = now - self.last_rx
+            self._running = False
+            self.on_dead(self.detection_time)
+            return
+        if action == PROBE:
+            self._probe()
+        self._timer = self.io.loop.call_later(wait, self._tick, generation)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,225 @@
+"""有界、批量刷新的通讯日志
+
+任意线程调用 log(message, level) 只是把一条记录追加到队列 (deque.append / SimpleQueue.put
+在 CPython 中都是原子的，不需要加锁，也不需要 root.after)：
+- 界面：主线程上的 after 定时器每隔 flush_interval 把队列中的记录一次性插入 tk.Text，
+  只保留最后 max_lines 行，低于显示级别的记录 (例如心跳、ACK) 不显示；
+- 文件：后台线程把全部记录批量写入日志文件，超过 max_bytes 时轮转 (log.txt -> log.txt.1 ...)。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# ================= 配置 =================
+DEFAULT_MAX_LINES = 1000        # 界面上最多保留的行数
+DEFAULT_FLUSH_INTERVAL = 0.1    # 界面刷新间隔 (秒)
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# 日志级别与标准库 logging 相同
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+
+def format_record(record):
+    """界面上显示的格式 (与旧版一致，警告及以上标出级别)"""
+    ts, level, message = record
+    stamp = time.strftime("%H:%M:%S", time.localtime(ts))
+    if level >= WARNING:
+        return f"{stamp} [{logging.getLevelName(level)}] {message}"
+    return f"{stamp} - {message}"
+
+
+class RotatingFileSink:
+    """后台线程批量写文件，按大小轮转"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, level=DEBUG):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.level = level
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = None
+        self.written = 0
+        self.rotations = 0
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="log-file", daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, record):
+        if record[1] >= self.level:
+            self._queue.put(record)
+
+    def close(self, timeout=2.0):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 把已经排队的记录一起取出，一次写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                ts, level, message = record
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+                lines.append(f"{stamp}.{int(ts % 1 * 1000):03d} {logging.getLevelName(level):<7} {message}\n")
+            try:
+                if lines:
+                    self._write("".join(lines))
+                    self.written += len(lines)
+            except OSError:
+                pass # 磁盘满或文件被占用时不影响界面
+            if stop:
+                self._file.close()
+                return
+
+    def _write(self, text):
+        if self.max_bytes and self._file.tell() + len(text.encode("utf-8")) > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self.rotations += 1
+
+
+class LogPipeline:
+    """log() 可在任意线程调用；attach() 之后由主线程定时刷新到 tk.Text"""
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 level=INFO, file_sink=None):
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self.level = level                      # 界面显示级别
+        self.file_sink = file_sink
+        # 界面跟不上时只保留最新的记录 (完整历史在文件中)
+        self._pending = deque(maxlen=max_lines)
+        self._root = None
+        self._widget = None
+        self._lines = 0                         # 文本框当前行数
+        self._after_id = None
+
+        # 统计
+        self.records = 0
+        self.flushes = 0
+        self.flush_time = 0.0
+
+    def log(self, message, level=INFO):
+        record = (time.time(), level, message)
+        self.records += 1
+        if level >= self.level:
+            self._pending.append(record)
+        if self.file_sink is not None:
+            self.file_sink.put(record)
+
+    def set_level(self, level):
+        self.level = level
+
+    # ---------- 界面 (主线程) ----------
+
+    def attach(self, root, widget, schedule=True):
+        """schedule 为 False 时不启动自己的 after 定时器，由调用方定时调用 flush()"""
+        self._root = root
+        self._widget = widget
+        if schedule:
+            self._schedule()
+
+    def _schedule(self):
+        self._after_id = self._root.after(int(self.flush_interval * 1000), self._tick)
+
+    def _tick(self):
+        self.flush()
+        self._schedule()
+
+    def flush(self):
+        """把排队的记录一次插入文本框，并删除超出 max_lines 的旧行"""
+        if self._widget is None or not self._pending:
+            return 0
+        start = time.perf_counter()
+        records = []
+        while True:
+            try:
+                records.append(self._pending.popleft())
+            except IndexError:
+                break
+        lines = [format_record(r) for r in records if r[1] >= self.level]
+        if not lines:
+            return 0
+        text = "\n".join(lines) + "\n"
+        count = text.count("\n")
+        if count > self.max_lines:
+            # 这一批本身就超过上限，只插入最后 max_lines 行
+            text = "\n".join(text.split("\n")[-self.max_lines - 1:])
+            count = self.max_lines
+
+        widget = self._widget
+        widget.config(state="normal")
+        widget.insert("end", text)
+        self._lines += count
+        excess = self._lines - self.max_lines
+        if excess > 0:
+            widget.delete("1.0", f"{excess + 1}.0")
+            self._lines -= excess
+        widget.see("end")
+        widget.config(state="disabled")
+
+        self.flushes += 1
+        self.flush_time += time.perf_counter() - start
+        return len(lines)
+
+    def clear(self):
+        if self._widget is not None:
+            self._widget.config(state="normal")
+            self._widget.delete("1.0", "end")
+            self._widget.config(state="disabled")
+        self._lines = 0
+
+    def close(self):
+        if self._after_id is not None and self._root is not None:
+            try:
+                self._root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        if self.file_sink is not None:
+            self.file_sink.close()
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "flushes": self.flushes,
+            "avg_flush_ms": self.flush_time / self.flushes * 1000 if self.flushes else 0.0,
+            "pending": len(self._pending),
+            "lines": self._lines,
+        }
@@ -0,0 +1,265 @@
+"""用单个 Canvas 绘制的输出控制矩阵
+
+每片 595 一行：芯片编号、8 个位格子、全开 / 全关 两个按钮。与每位一个 Checkbutton + IntVar
+的做法不同：
+- 状态只有一个整数位掩码，由 set_mask() 给出，连续多次调用合并为一次重绘 (after_idle)；
+- 只为可见的行创建画布元素，滚动时把这组行槽位移动到新位置并改写内容，
+  芯片数再多，画布上的元素数量也只与窗口高度有关；
+- 点击由坐标换算出芯片与位 (hit_test)，不为每一格绑定回调。
+"""
+import time
+import tkinter as tk
+from tkinter import ttk
+
+# ================= 配置 =================
+ROW_HEIGHT = 30
+LABEL_WIDTH = 80
+CELL_WIDTH = 56
+CELL_PAD = 3
+BUTTON_GAP = 16
+BUTTON_WIDTH = 44
+SCROLL_UNITS = 3                # 滚轮每格滚动的行数
+
+BACKGROUND = "#ffffff"
+COLOR_ON = "#4caf50"
+COLOR_OFF = "#eeeeee"
+COLOR_OUTLINE = "#9e9e9e"
+COLOR_BUTTON = "#e3e3e3"
+TEXT_ON = "#ffffff"
+TEXT_OFF = "#333333"
+
+HIT_BIT = "bit"
+HIT_CHIP = "chip"
+
+
+class _RowSlot:
+    """一组可复用的画布元素，显示某一行"""
+
+    __slots__ = ("tag", "label", "cells", "texts", "row", "y", "value", "hidden")
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.label = None
+        self.cells = []
+        self.texts = []
+        self.row = None
+        self.y = 0
+        self.value = None
+        self.hidden = False
+
+
+class OutputMatrix:
+    """输出矩阵控件；只在 Tk 主线程中调用
+
+    on_toggle(chip, bit): 点击某一位；on_chip(chip, value): 点击 全开 (1) / 全关 (0)。
+    控件本身不修改位掩码，由调用方更新状态后再 set_mask()。
+    """
+
+    def __init__(self, parent, num_chips, bits_per_chip=8, on_toggle=None, on_chip=None):
+        self.bits_per_chip = bits_per_chip
+        self.on_toggle = on_toggle
+        self.on_chip = on_chip
+        self.num_chips = 0
+        self.mask = 0
+        self.offset = 0                 # 滚动位置 (像素)
+        self._slots = []
+        self._pending = None
+
+        self._buttons_x = LABEL_WIDTH + bits_per_chip * CELL_WIDTH + BUTTON_GAP
+        width = self._buttons_x + 2 * BUTTON_WIDTH + CELL_PAD
+
+        self.frame = ttk.Frame(parent)
+        self.canvas = tk.Canvas(self.frame, width=width, highlightthickness=0, background=BACKGROUND)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.yview)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Enter>", lambda e: self.canvas.focus_set())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.yview("scroll", -SCROLL_UNITS, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.yview("scroll", SCROLL_UNITS, "units"))
+
+        # 统计
+        self.renders = 0
+        self.render_time = 0.0
+
+        self.set_num_chips(num_chips)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # ---------- 状态 ----------
+
+    def set_num_chips(self, num_chips):
+        self.num_chips = num_chips
+        self.mask &= (1 << num_chips * self.bits_per_chip) - 1
+        for slot in self._slots:
+            slot.row = None             # 强制所有槽位重画
+        self._clamp_offset()
+        self.schedule()
+
+    def set_mask(self, mask):
+        """更新显示的状态；同一轮事件中的多次调用只重绘一次"""
+        self.mask = mask
+        self.schedule()
+
+    def schedule(self):
+        if self._pending is None:
+            self._pending = self.canvas.after_idle(self._render)
+
+    def refresh(self):
+        """立即重绘 (取消已排队的重绘)"""
+        if self._pending is not None:
+            self.canvas.after_cancel(self._pending)
+        self._render()
+
+    # ---------- 滚动 ----------
+
+    def _viewport(self):
+        return max(self.canvas.winfo_height(), 1)
+
+    def _content_height(self):
+        return self.num_chips * ROW_HEIGHT
+
+    def _clamp_offset(self):
+        limit = max(0, self._content_height() - self._viewport())
+        self.offset = min(max(0, self.offset), limit)
+
+    def yview(self, *args):
+        """Scrollbar 的 command 接口: ("moveto", 比例) / ("scroll", 数量, "units" | "pages")"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self._content_height())
+        elif args[0] == "scroll":
+            step = ROW_HEIGHT if args[2] == "units" else self._viewport()
+            self.offset += int(args[1]) * step
+        self._clamp_offset()
+        self.refresh()
+
+    def see(self, chip):
+        """滚动到让第 chip 行可见"""
+        top = chip * ROW_HEIGHT
+        if top < self.offset:
+            self.offset = top
+        elif top + ROW_HEIGHT > self.offset + self._viewport():
+            self.offset = top + ROW_HEIGHT - self._viewport()
+        self._clamp_offset()
+        self.refresh()
+
+    def _on_wheel(self, event):
+        # Windows 每格 delta 为 ±120，macOS 为较小的整数
+        steps = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        if steps:
+            self.yview("scroll", -steps * SCROLL_UNITS, "units")
+
+    # ---------- 绘制 ----------
+
+    def _new_slot(self, index):
+        c = self.canvas
+        slot = _RowSlot(f"slot{index}")
+        tags = (slot.tag,)
+        y = CELL_PAD
+        h = ROW_HEIGHT - CELL_PAD
+        slot.label = c.create_text(CELL_PAD + 2, y + h / 2, anchor="w", text="", fill=TEXT_OFF, tags=tags)
+        for bit in range(self.bits_per_chip):
+            x = LABEL_WIDTH + bit * CELL_WIDTH
+            slot.cells.append(c.create_rectangle(x, y, x + CELL_WIDTH - CELL_PAD, y + h,
+                                                 fill=COLOR_OFF, outline=COLOR_OUTLINE, tags=tags))
+            slot.texts.append(c.create_text(x + (CELL_WIDTH - CELL_PAD) / 2, y + h / 2,
+                                            text=f"Bit {bit}", fill=TEXT_OFF, tags=tags))
+        for i, text in enumerate(("全开", "全关")):
+            x = self._buttons_x + i * BUTTON_WIDTH
+            c.create_rectangle(x, y, x + BUTTON_WIDTH - CELL_PAD, y + h,
+                               fill=COLOR_BUTTON, outline=COLOR_OUTLINE, tags=tags)
+            c.create_text(x + (BUTTON_WIDTH - CELL_PAD) / 2, y + h / 2, text=text, fill=TEXT_OFF, tags=tags)
+        return slot
+
+    def _render(self):
+        self._pending = None
+        start = time.perf_counter()
+        c = self.canvas
+        height = self._viewport()
+        self._clamp_offset()
+        needed = min(height // ROW_HEIGHT + 2, self.num_chips)
+        while len(self._slots) < needed:
+            self._slots.append(self._new_slot(len(self._slots)))
+
+        bits = self.bits_per_chip
+        byte_mask = (1 << bits) - 1
+        first = int(self.offset // ROW_HEIGHT)
+        for i, slot in enumerate(self._slots):
+            row = first + i
+            if row >= self.num_chips:
+                if not slot.hidden:
+                    c.itemconfigure(slot.tag, state="hidden")
+                    slot.hidden = True
+                continue
+            if slot.hidden:
+                c.itemconfigure(slot.tag, state="normal")
+                slot.hidden = False
+            y = row * ROW_HEIGHT - self.offset
+            if y != slot.y:
+                c.move(slot.tag, 0, y - slot.y)
+                slot.y = y
+            if row != slot.row:
+                c.itemconfigure(slot.label, text=f"芯片 #{row + 1}")
+                slot.row = row
+                slot.value = None
+            value = self.mask >> (row * bits) & byte_mask
+            if value != slot.value:
+                # 只改变化了的格子
+                changed = byte_mask if slot.value is None else value ^ slot.value
+                for bit in range(bits):
+                    if changed >> bit & 1:
+                        on = value >> bit & 1
+                        c.itemconfigure(slot.cells[bit], fill=COLOR_ON if on else COLOR_OFF)
+                        c.itemconfigure(slot.texts[bit], fill=TEXT_ON if on else TEXT_OFF)
+                slot.value = value
+
+        total = self._content_height()
+        if total > 0:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.renders += 1
+        self.render_time += time.perf_counter() - start
+
+    # ---------- 点击 ----------
+
+    def hit_test(self, x, y):
+        """画布坐标 -> (HIT_BIT, 芯片, 位) / (HIT_CHIP, 芯片, 1 或 0) / None"""
+        row = int((y + self.offset) // ROW_HEIGHT)
+        if not 0 <= row < self.num_chips:
+            return None
+        if (y + self.offset) % ROW_HEIGHT < CELL_PAD:
+            return None
+        if LABEL_WIDTH <= x < LABEL_WIDTH + self.bits_per_chip * CELL_WIDTH:
+            col, rem = divmod(x - LABEL_WIDTH, CELL_WIDTH)
+            if rem < CELL_WIDTH - CELL_PAD:
+                return (HIT_BIT, row, int(col))
+        elif self._buttons_x <= x < self._buttons_x + 2 * BUTTON_WIDTH:
+            col, rem = divmod(x - self._buttons_x, BUTTON_WIDTH)
+            if rem < BUTTON_WIDTH - CELL_PAD:
+                return (HIT_CHIP, row, 1 if col == 0 else 0)
+        return None
+
+    def _on_click(self, event):
+        hit = self.hit_test(event.x, event.y)
+        if hit is None:
+            return
+        kind, chip, value = hit
+        if kind == HIT_BIT and self.on_toggle is not None:
+            self.on_toggle(chip, value)
+        elif kind == HIT_CHIP and self.on_chip is not None:
+            self.on_chip(chip, value)
+
+    def stats(self):
+        return {
+            "renders": self.renders,
+            "avg_render_ms": self.render_time / self.renders * 1000 if self.renders else 0.0,
+            "items": len(self.canvas.find_all()),
+            "slots": len(self._slots),
+        }
@@ -0,0 +1,200 @@
+"""输出状态存储
+
+全部输出的唯一来源：一个整数位掩码加一个单调递增的版本号。
+- 所有修改都在锁内一次完成 (set_mask / update / toggle / modify)，批量修改与单个位的修改
+  代价相同，后台线程读到的状态不会是半新半旧的；
+- snapshot() 返回不可变的 (版本, 位掩码, 位数)，后台线程可随意持有，不需要经过 Tk；
+- subscribe(callback) 订阅变化，回调收到 Change (新版本、新状态、变化了哪些位、来源)，
+  按版本顺序在修改状态的线程中调用；
+- 撤销 / 重做历史只保存每次修改的 XOR 差值 (变化了哪些位) 和这些位修改前的值 (两个整数)，
+  条数有上限，再长的链也不用为每一步保存完整状态。撤销就是把那一步变化了的位恢复为修改前的值；
+  中间夹着不计入历史的修改 (序列回放、烧录切换) 时，只影响那一步涉及的位，那些位已经是原值的
+  记录 (撤销后状态不变) 直接丢弃，继续撤销更早的一步。
+"""
+import threading
+from collections import deque, namedtuple
+
+# ================= 配置 =================
+DEFAULT_HISTORY = 256           # 撤销历史最多保存的步数
+
+# 修改来源 (Change.source)，订阅方据此决定要不要刷新界面、要不要发送
+SOURCE_USER = "user"
+SOURCE_UNDO = "undo"
+SOURCE_REDO = "redo"
+SOURCE_SEQUENCE = "sequence"
+SOURCE_PROGRAM = "program"
+SOURCE_RESIZE = "resize"
+SOURCE_API = "api"
+
+Snapshot = namedtuple("Snapshot", ["version", "mask", "num_bits"])
+# changed: 新旧状态的 XOR，置位的就是这次变化了的位
+Change = namedtuple("Change", ["version", "mask", "changed", "source"])
+
+
+class OutputState:
+    """可在任意线程调用；修改方法返回 Change，状态没有变化时返回 None (版本号也不增加)"""
+
+    def __init__(self, num_bits, mask=0, history=DEFAULT_HISTORY):
+        self._lock = threading.Lock()
+        # 通知按版本顺序进行；可重入，订阅回调中可以再次修改状态
+        self._notify_lock = threading.RLock()
+        self._num_bits = num_bits
+        self._full = (1 << num_bits) - 1
+        self._mask = mask & self._full
+        self._version = 0
+        self._undo = deque(maxlen=history)
+        self._redo = []
+        self._subscribers = []
+
+        # 统计
+        self.changes = 0
+        self.notifications = 0
+        self.errors = 0
+
+    # ---------- 读取 ----------
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def num_bits(self):
+        return self._num_bits
+
+    def snapshot(self):
+        with self._lock:
+            return Snapshot(self._version, self._mask, self._num_bits)
+
+    def bit(self, index):
+        return self._mask >> index & 1
+
+    # ---------- 修改 ----------
+
+    def set_mask(self, mask, source=SOURCE_USER, record=True):
+        """整体替换为 mask (超出位数的位被忽略)；record 为假时不计入撤销历史"""
+        return self._apply(lambda old: mask, source, record)
+
+    def update(self, set_bits=0, clear_bits=0, toggle_bits=0, source=SOURCE_USER, record=True):
+        """一次原子修改：先置位 set_bits，再清除 clear_bits，最后翻转 toggle_bits"""
+        return self._apply(lambda old: (old | set_bits) & ~clear_bits ^ toggle_bits, source, record)
+
+    def set_bit(self, index, value, source=SOURCE_USER, record=True):
+        bit = 1 << index
+        if value:
+            return self.update(set_bits=bit, source=source, record=record)
+        return self.update(clear_bits=bit, source=source, record=record)
+
+    def toggle(self, index, source=SOURCE_USER, record=True):
+        return self.update(toggle_bits=1 << index, source=source, record=record)
+
+    def modify(self, func, source=SOURCE_USER, record=True):
+        """在锁内调用 func(旧状态) 得到新状态，用于读-改-写必须原子完成的修改"""
+        return self._apply(func, source, record)
+
+    def resize(self, num_bits):
+        """修改位数 (链长)：超出的位被清除，撤销历史作废"""
+        with self._notify_lock:
+            with self._lock:
+                self._num_bits = num_bits
+                self._full = (1 << num_bits) - 1
+                self._undo.clear()
+                self._redo.clear()
+                change = self._commit(self._mask & self._full, SOURCE_RESIZE)
+            self._notify(change)
+        return change
+
+    # ---------- 撤销 / 重做 ----------
+
+    def undo(self):
+        """撤销最近一次 (撤销后状态会变化的) 记录的修改，没有可撤销的修改时返回 None"""
+        return self._step(self._undo, self._redo, SOURCE_UNDO)
+
+    def redo(self):
+        return self._step(self._redo, self._undo, SOURCE_REDO)
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear_history(self):
+        with self._lock:
+            self._undo.clear()
+            self._redo.clear()
+
+    # ---------- 订阅 ----------
+
+    def subscribe(self, callback):
+        """callback(change) 在修改状态的线程中调用；返回值传给 unsubscribe()"""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [c for c in self._subscribers if c is not callback]
+
+    def stats(self):
+        return {
+            "version": self._version,
+            "changes": self.changes,
+            "notifications": self.notifications,
+            "errors": self.errors,
+            "subscribers": len(self._subscribers),
+            "undo_depth": len(self._undo),
+            "redo_depth": len(self._redo),
+        }
+
+    # ---------- 内部 ----------
+
+    def _commit(self, mask, source):
+        """在 self._lock 内调用：写入新状态，返回 Change；没有变化时返回 None"""
+        changed = self._mask ^ mask
+        if not changed:
+            return None
+        self._mask = mask
+        self._version += 1
+        self.changes += 1
+        return Change(self._version, mask, changed, source)
+
+    def _apply(self, func, source, record):
+        with self._notify_lock:
+            with self._lock:
+                old = self._mask
+                change = self._commit(func(old) & self._full, source)
+                if change is not None and record:
+                    self._undo.append((change.changed, old & change.changed))
+                    self._redo.clear()
+            self._notify(change)
+        return change
+
+    def _step(self, src, dst, source):
+        """从 src 取出一步恢复 (changed 位恢复为 value)，并把恢复前的值存入 dst"""
+        with self._notify_lock:
+            with self._lock:
+                change = None
+                while src and change is None:
+                    changed, value = src.pop()
+                    current = self._mask & changed
+                    # 这些位已被不计入历史的修改恢复时，这一步不产生变化，丢弃后继续取下一步
+                    change = self._commit(self._mask & ~changed | value, source)
+                    if change is not None:
+                        dst.append((changed, current))
+            self._notify(change)
+        return change
+
+    def _notify(self, change):
+        if change is None:
+            return
+        for callback in self._subscribers:
+            self.notifications += 1
+            try:
+                callback(change)
+            except Exception:
+                # 一个订阅方出错不影响其他订阅方
+                self.errors += 1
@@ -0,0 +1,574 @@
+"""外部烧录程序 (APT ISP2) 自动化
+
+AutomationSession 只在第一次触发 (或句柄失效) 时查找程序、主窗口、“自动编程至芯片”按钮和
+消息记录控件，之后直接复用缓存的控件，每次触发前只做一次廉价的有效性检查。
+
+点击按钮后由 ResultDetector 等待具体的条件，结果一确定就返回，不再固定等待：
+- 出现 "未检测到烧录器" 等报错弹窗 -> 失败
+- 新增的日志中出现最终结论行 ("编程成功，用时 ..." / "编程失败，错误代码 ...") -> 成功 / 失败
+- 有新日志但一段时间内不再变化 -> 按全部新日志中的关键字判断 (有失败关键字即失败)，
+  没有关键字时视为已执行 (与旧版一致)；"擦除成功" 等中间步骤的关键字不会提前得出结论
+只读取点击之后新增的日志，并解析成 ProgramResult (是否成功、错误代码、烧录用时)。
+
+具体的界面操作放在后端里:
+- PywinautoBackend: 通过 pywinauto 操作真正的 APT ISP2 (仅 Windows)；pywinauto (及其 comtypes 等依赖)
+  导入很慢，推迟到第一次触发或 warm_up() 时才导入，不影响界面启动
+- FakeProgrammerBackend: 模拟烧录程序，用于在 Linux 上测试和做性能对比
+"""
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+
+# ================= 配置 =================
+APP_TITLE_RE = ".*APT ISP2.*"
+BUTTON_TITLE = "自动编程至芯片"
+BUTTON_TITLE_RE = ".*自动编程.*"
+LOG_TAB_TITLE = "消息记录"
+POPUP_KEYWORDS = ("未检测到烧录器", "连接后重试")
+
+CONNECT_TIMEOUT = 5.0
+RESULT_TIMEOUT = 30.0       # 点击后最长等待结果的时间
+LOG_POLL_INTERVAL = 0.05    # 读取新日志的间隔
+POPUP_POLL_INTERVAL = 0.2   # 枚举弹窗较慢，间隔长一些
+LOG_QUIET_TIME = 1.0        # 有新日志但没有关键字时，日志停止变化多久视为结束
+
+# 最终结论行，点击后出现即可得出结果；擦除、校验等中间步骤的 成功 / 失败 不算结论
+FINAL_RE = re.compile(r"(?:编程|烧录|program(?:ming)?)\s*(成功|失败|pass(?:ed)?|fail(?:ed)?|ok\b)", re.IGNORECASE)
+# 结果关键字 (先匹配失败)，日志停止变化后才据此判断；错误代码与烧录用时从日志中提取
+FAIL_RE = re.compile(r"失败|错误|超时|error|fail", re.IGNORECASE)
+PASS_RE = re.compile(r"成功|pass|\bok\b", re.IGNORECASE)
+ERROR_CODE_RE = re.compile(r"(?:错误(?:代码|码)?|error(?:\s*code)?)\s*[:：=]?\s*(0x[0-9a-f]+|\d+)", re.IGNORECASE)
+DURATION_RE = re.compile(r"(?:用时|耗时|time)\s*[:：=]?\s*(\d+(?:\.\d+)?)\s*(ms|毫秒|s|秒)?", re.IGNORECASE)
+
+
+_pywinauto_lock = threading.Lock()
+_pywinauto = {}         # 导入结果: "Application" (未安装时为 None) 与 "import_time" (秒)
+
+
+def load_pywinauto():
+    """按需导入 pywinauto，返回 Application 类 (未安装或非 Windows 时返回 None)；只导入一次"""
+    with _pywinauto_lock:
+        if "Application" not in _pywinauto:
+            start = time.perf_counter()
+            try:
+                from pywinauto import Application
+            except ImportError:
+                # 非 Windows 或未安装 pywinauto 时仍可使用模拟后端
+                Application = None
+            _pywinauto["Application"] = Application
+            _pywinauto["import_time"] = time.perf_counter() - start
+        return _pywinauto["Application"]
+
+
+class ProgrammerError(Exception):
+    """找不到烧录程序或其控件"""
+
+
+# passed: 是否成功, code: 错误代码 (没有时为 None), duration: 日志中报告的烧录用时 (秒, 没有时为 None),
+# elapsed: 点击到得出结果的耗时 (秒), reason: 结论说明, log: 本次新增的日志
+_ProgramResult = namedtuple("ProgramResult", ["passed", "code", "duration", "elapsed", "reason", "log"])
+
+
+class ProgramResult(_ProgramResult):
+    __slots__ = ()
+
+    def __str__(self):
+        if self.code is not None:
+            return f"{self.reason} (错误代码 {self.code})"
+        return self.reason
+
+
+def parse_result(text):
+    """从新增日志中解析结果，返回 (是否成功, 错误代码, 烧录用时秒)；没有结论时是否成功为 None"""
+    passed = None
+    if FAIL_RE.search(text):
+        passed = False
+    elif PASS_RE.search(text):
+        passed = True
+
+    code = None
+    m = ERROR_CODE_RE.search(text)
+    if m:
+        code = m.group(1)
+        passed = False
+
+    duration = None
+    m = DURATION_RE.search(text)
+    if m:
+        duration = float(m.group(1))
+        if (m.group(2) or "").lower() in ("ms", "毫秒"):
+            duration /= 1000.0
+    return passed, code, duration
+
+
+def final_verdict(text):
+    """日志中最后一个最终结论行：成功为 True，失败为 False，还没有时为 None"""
+    verdict = None
+    for m in FINAL_RE.finditer(text):
+        verdict = m.group(1).lower() in ("成功", "pass", "passed", "ok")
+    return verdict
+
+
+class ProgrammerBackend:
+    """后端接口：除 warm_up 外，所有方法都在烧录任务线程中调用"""
+
+    def warm_up(self):
+        """提前完成与具体窗口无关的耗时准备 (例如导入自动化库)，在后台线程中调用"""
+
+    def connect(self, timeout):
+        """查找程序并缓存主窗口、按钮和日志控件；找不到时抛出 ProgrammerError"""
+        raise NotImplementedError
+
+    def is_valid(self):
+        """缓存的控件是否仍然可用 (必须足够廉价，每次触发前都会调用)"""
+        raise NotImplementedError
+
+    def click_program(self):
+        raise NotImplementedError
+
+    def find_error_popup(self):
+        """查找报错弹窗；找到时尽量关闭它并返回弹窗文本，否则返回 None"""
+        raise NotImplementedError
+
+    def log_mark(self):
+        """返回消息记录当前末尾的位置，之后 read_log_since 只返回这之后的内容"""
+        raise NotImplementedError
+
+    def read_log_since(self, mark):
+        """返回 (mark 之后新增的文本, 新的 mark)"""
+        raise NotImplementedError
+
+    def reset(self):
+        """丢弃缓存的控件，下次触发时重新查找"""
+
+
+class PywinautoBackend(ProgrammerBackend):
+    def __init__(self):
+        self.app = None
+        self.window = None
+        self.button = None
+        self.log_ctrl = None
+        self._by_line = False       # 日志控件支持按行读取 (Edit)
+        self._partial = ""          # 上次读到的最后一行 (可能尚未写完)
+
+    def warm_up(self):
+        load_pywinauto()
+
+    def connect(self, timeout):
+        Application = load_pywinauto()
+        if Application is None:
+            raise ProgrammerError("未安装 pywinauto，无法控制烧录程序")
+
+        # 1. 连接到应用程序 (超时重试)
+        app = None
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < timeout:
+            try:
+                # 优先尝试 uia
+                app = Application(backend="uia").connect(title_re=APP_TITLE_RE, timeout=0.5)
+                break
+            except Exception:
+                try:
+                    # 回退到 win32
+                    app = Application(backend="win32").connect(title_re=APP_TITLE_RE, timeout=0.5)
+                    break
+                except Exception:
+                    pass
+            time.sleep(0.5)
+        if app is None:
+            raise ProgrammerError(f"{timeout:g}秒内未找到烧录程序")
+
+        # 2. 找到窗口并解析成具体控件 (wrapper)，之后不再重复按标题搜索
+        window = app.window(title_re=APP_TITLE_RE).wrapper_object()
+
+        # 3. 按钮文本可能是 "自动编程至芯片"，找不到时模糊匹配
+        spec = window.child_window(title=BUTTON_TITLE, control_type="Button")
+        if not spec.exists():
+            spec = window.child_window(title_re=BUTTON_TITLE_RE, control_type="Button")
+        if not spec.exists():
+            raise ProgrammerError("未找到 '自动编程' 按钮")
+
+        self.app = app
+        self.window = window
+        self.button = spec.wrapper_object()
+        self._set_log_control(self._find_log_control())
+
+    def _find_log_control(self):
+        # "消息记录" 通常是一个 TabItem，如果没有被选中，内容有时候不可见
+        try:
+            tab_item = self.window.child_window(title=LOG_TAB_TITLE, control_type="TabItem")
+            if tab_item.exists():
+                tab_item.select()
+        except Exception:
+            pass # 可能没有 TabItem 结构，直接找 Edit
+
+        # 通常日志框是文本最长的那个 Edit / Document / Pane
+        best, best_len = None, -1
+        for control_type in ("Edit", "Document", "Pane"):
+            try:
+                controls = self.window.descendants(control_type=control_type)
+            except Exception:
+                continue
+            for ctrl in controls:
+                try:
+                    length = len(ctrl.window_text().strip())
+                except Exception:
+                    continue
+                if length > best_len:
+                    best, best_len = ctrl, length
+        return best
+
+    def _set_log_control(self, ctrl):
+        self.log_ctrl = ctrl
+        self._by_line = ctrl is not None and hasattr(ctrl, "line_count") and hasattr(ctrl, "get_line")
+        self._partial = ""
+
+    def _log_control(self):
+        if self.log_ctrl is None and self.window is not None:
+            self._set_log_control(self._find_log_control())
+        return self.log_ctrl
+
+    def is_valid(self):
+        if self.window is None or self.button is None:
+            return False
+        try:
+            return self.window.is_visible() and self.button.is_enabled()
+        except Exception:
+            return False
+
+    def click_program(self):
+        self.button.click()
+
+    def find_error_popup(self):
+        # 查找属于该应用程序的其他顶层窗口，看是否有文本包含 "未检测到烧录器"
+        for d in self.app.windows():
+            # 排除主窗口自己
+            if d.handle == self.window.handle:
+                continue
+            try:
+                texts = [c.window_text() for c in d.descendants(control_type="Text")]
+            except Exception:
+                continue
+            full_text = " ".join(texts)
+            if any(k in full_text for k in POPUP_KEYWORDS):
+                # 自动点击 "确定" 关闭它
+                try:
+                    ok_btn = d.child_window(title="确定", control_type="Button")
+                    if ok_btn.exists():
+                        ok_btn.click()
+                except Exception:
+                    pass
+                return full_text
+        return None
+
+    def log_mark(self):
+        ctrl = self._log_control()
+        self._partial = ""
+        if ctrl is None:
+            return 0
+        try:
+            if not self._by_line:
+                return len(ctrl.window_text())
+            # 最后一行可能还在写入：mark 指向它，并记住已有的内容
+            last = max(0, ctrl.line_count() - 1)
+            self._partial = ctrl.get_line(last)
+            return last
+        except Exception:
+            self._set_log_control(None)
+            return 0
+
+    def read_log_since(self, mark):
+        ctrl = self._log_control()
+        if ctrl is None:
+            return "", mark
+        try:
+            if not self._by_line:
+                text = ctrl.window_text()
+                if len(text) < mark:
+                    mark = 0 # 日志被清空
+                return text[mark:], len(text)
+
+            # Edit 控件按行读取，只取 mark 之后的行
+            count = ctrl.line_count()
+            if count <= mark:
+                # 日志被清空
+                self._partial = ""
+                return "", 0
+            lines = [ctrl.get_line(i) for i in range(mark, count)]
+        except Exception:
+            # 日志控件已失效 (例如界面重建)，下次重新查找
+            self._set_log_control(None)
+            raise
+        # 第一行就是上次读到的最后一行，只返回之后写入的部分
+        last = lines[-1]
+        if self._partial and lines[0].startswith(self._partial):
+            lines[0] = lines[0][len(self._partial):]
+        self._partial = last
+        return "\n".join(lines), count - 1
+
+    def reset(self):
+        self.app = self.window = self.button = None
+        self._set_log_control(None)
+
+
+class FakeProgrammerBackend(ProgrammerBackend):
+    """模拟的烧录程序
+
+    各项耗时模拟真实 UI 自动化的开销：connect_delay 为查找程序和控件，
+    validate_delay 为有效性检查，program_time 为一次烧录 (点击后在后台写入日志)；
+    fail_rate 概率在 popup_delay 后弹出 "未检测到烧录器"，error_rate 概率在日志中报告编程失败。
+    """
+
+    def __init__(self, connect_delay=0.8, validate_delay=0.002, program_time=0.05,
+                 fail_rate=0.0, error_rate=0.0, popup_delay=0.1, seed=None):
+        self.connect_delay = connect_delay
+        self.validate_delay = validate_delay
+        self.program_time = program_time
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.popup_delay = popup_delay
+        self.rng = random.Random(seed)
+        self.connected = False
+        self.alive = True               # 置为 False 模拟程序被关闭 (句柄失效)
+        self.connects = 0
+        self.log_text = ""
+        self.units = 0
+        self._popup = None
+        self._lock = threading.Lock()
+
+    def connect(self, timeout):
+        time.sleep(self.connect_delay)
+        if not self.alive:
+            raise ProgrammerError(f"{timeout:g}秒内未找到烧录程序")
+        self.connects += 1
+        self.connected = True
+
+    def is_valid(self):
+        time.sleep(self.validate_delay)
+        return self.connected and self.alive
+
+    def click_program(self):
+        if not (self.connected and self.alive):
+            raise ProgrammerError("控件已失效")
+        with self._lock:
+            self.units += 1
+            unit = self.units
+            popup = self.rng.random() < self.fail_rate
+            error = self.rng.random() < self.error_rate
+            code = self.rng.randrange(1, 256)
+        if popup:
+            threading.Timer(self.popup_delay, self._show_popup).start()
+            return
+        self._append(f"[{unit}] 开始编程...\r\n")
+        if error:
+            line = f"[{unit}] 编程失败，错误代码: 0x{code:02X}\r\n"
+        else:
+            line = f"[{unit}] 编程成功，用时 {self.program_time * 1000:.0f} ms\r\n"
+        threading.Timer(self.program_time, self._append, args=(line,)).start()
+
+    def _show_popup(self):
+        with self._lock:
+            self._popup = "未检测到烧录器，请连接后重试"
+
+    def _append(self, text):
+        with self._lock:
+            self.log_text += text
+
+    def find_error_popup(self):
+        with self._lock:
+            popup, self._popup = self._popup, None
+        return popup
+
+    def log_mark(self):
+        with self._lock:
+            return len(self.log_text)
+
+    def read_log_since(self, mark):
+        with self._lock:
+            return self.log_text[mark:], len(self.log_text)
+
+    def reset(self):
+        self.connected = False
+
+
+class ResultDetector:
+    """点击之后等待结果：弹窗、最终结论行或日志停止变化，先满足哪个就返回"""
+
+    def __init__(self, backend, timeout=RESULT_TIMEOUT, poll_interval=LOG_POLL_INTERVAL,
+                 popup_interval=POPUP_POLL_INTERVAL, quiet_time=LOG_QUIET_TIME):
+        self.backend = backend
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.popup_interval = popup_interval
+        self.quiet_time = quiet_time
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, mark):
+        """mark 为点击前的 log_mark()；返回 ProgramResult"""
+        self._cancel.clear()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        next_popup = start
+        last_change = None
+        chunks = []
+        while True:
+            now = time.monotonic()
+            if now >= next_popup:
+                try:
+                    popup = self.backend.find_error_popup()
+                except Exception:
+                    popup = None
+                if popup:
+                    return ProgramResult(False, None, None, time.monotonic() - start, popup, "".join(chunks))
+                next_popup = now + self.popup_interval
+
+            text, mark = self.backend.read_log_since(mark)
+            if text:
+                chunks.append(text)
+                last_change = time.monotonic()
+                log = "".join(chunks)
+                passed = final_verdict(log)
+                if passed is not None:
+                    return self._result(passed, log, last_change - start)
+
+            now = time.monotonic()
+            log = "".join(chunks)
+            if last_change is not None and now - last_change >= self.quiet_time:
+                # 没有最终结论行：日志已停止变化，按全部新日志中的关键字判断
+                passed = parse_result(log)[0]
+                if passed is None:
+                    # 按钮已点击且没有弹窗报错，视为烧录已执行
+                    return ProgramResult(True, None, None, now - start, "烧录已执行 (日志未给出结论)", log)
+                return self._result(passed, log, now - start)
+            if now >= deadline:
+                return ProgramResult(False, None, None, now - start, f"{self.timeout:g}秒内未等到烧录结果", log)
+            if self._cancel.wait(self.poll_interval):
+                return ProgramResult(False, None, None, time.monotonic() - start, "已取消", log)
+
+    @staticmethod
+    def _result(passed, log, elapsed):
+        _, code, duration = parse_result(log)
+        if passed:
+            return ProgramResult(True, None, duration, elapsed, "烧录成功", log)
+        return ProgramResult(False, code, duration, elapsed, "烧录失败", log)
+
+
+class AutomationSession:
+    """缓存烧录程序控件的自动化会话
+
+    log(message) 用于输出过程信息 (在调用线程中调用)；cache=False 时每次触发都重新查找控件，
+    与旧版行为一致，用于对比。
+    """
+
+    def __init__(self, backend, log=None, cache=True, connect_timeout=CONNECT_TIMEOUT,
+                 result_timeout=RESULT_TIMEOUT):
+        self.backend = backend
+        self.log = log or (lambda message: None)
+        self.cache = cache
+        self.connect_timeout = connect_timeout
+        self.detector = ResultDetector(backend, timeout=result_timeout)
+        self._ready = False
+
+        # 统计
+        self.triggers = 0
+        self.rediscoveries = 0
+        self.last_timing = {}
+        self.last_result = None
+        self.total_time = 0.0
+
+    def warm_up(self):
+        """在后台线程中预先导入自动化库，返回耗时 (秒)；失败不影响之后的触发"""
+        start = time.perf_counter()
+        try:
+            self.backend.warm_up()
+        except Exception as e:
+            self.log(f"提示: 预加载烧录自动化失败 ({e})")
+        return time.perf_counter() - start
+
+    def invalidate(self):
+        self._ready = False
+        self.backend.reset()
+
+    def ensure_ready(self):
+        """需要时 (首次或控件失效) 重新查找控件"""
+        if self._ready and self.cache and self.backend.is_valid():
+            return
+        if self._ready:
+            self.log("提示: 烧录程序控件已失效，重新查找...")
+        self._ready = False
+        self.backend.reset()
+        self.backend.connect(self.connect_timeout)
+        self.rediscoveries += 1
+        self._ready = True
+
+    def cancel(self):
+        """中止正在进行的结果等待 (任意线程)"""
+        self.detector.cancel()
+
+    def trigger(self):
+        """点击 '自动编程至芯片' 并等待结果，返回 (是否成功, ProgramResult 或错误说明)"""
+        self.triggers += 1
+        timing = {}
+        start = time.perf_counter()
+        try:
+            t = time.perf_counter()
+            try:
+                self.ensure_ready()
+            except ProgrammerError as e:
+                self.log(f"提示: 触发不成功 ({e})")
+                return False, str(e)
+            except Exception as e:
+                self.invalidate()
+                self.log(f"自动化错误: {e}")
+                return False, f"自动化错误: {e}"
+            timing["locate"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            try:
+                mark = self.backend.log_mark()
+                self.backend.click_program()
+            except Exception as e:
+                # 控件在检查之后失效，下次触发时重新查找
+                self.invalidate()
+                self.log(f"按钮操作错误: {e}")
+                return False, f"按钮操作错误: {e}"
+            timing["click"] = time.perf_counter() - t
+            self.log("成功点击 '自动编程至芯片'")
+
+            t = time.perf_counter()
+            try:
+                result = self.detector.wait(mark)
+            except Exception as e:
+                self.invalidate()
+                self.log(f"抓取日志出错: {e}")
+                return False, f"抓取日志出错: {e}"
+            timing["wait"] = time.perf_counter() - t
+            self.last_result = result
+            self._log_result(result)
+            return result.passed, result
+        finally:
+            timing["total"] = time.perf_counter() - start
+            self.last_timing = timing
+            self.total_time += timing["total"]
+
+    def _log_result(self, result):
+        if result.log.strip():
+            self.log(f"--- APT ISP2 消息记录 (新增) ---\n{result.log.rstrip()}\n-----------------------")
+        parts = [str(result), f"判定耗时 {result.elapsed * 1000:.0f} ms"]
+        if result.duration is not None:
+            parts.append(f"烧录用时 {result.duration:.2f}s")
+        prefix = "烧录结果: " if result.passed or result.code or result.log else "!!! 警告: "
+        self.log(prefix + ", ".join(parts))
+
+    def stats(self):
+        return {
+            "triggers": self.triggers,
+            "rediscoveries": self.rediscoveries,
+            "avg_trigger_s": self.total_time / self.triggers if self.triggers else 0.0,
+            "last_timing_s": dict(self.last_timing),
+        }
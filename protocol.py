@@ -0,0 +1,398 @@
+"""595 从机通讯协议 (与界面无关)
+
+帧格式: AA 55 CMD [DATA x N] CS
+    CMD 0x01 = 设置输出，DATA 为 6 个字节，每个字节对应一片 595 (Bit 0 为最低位)
+    CMD 0x02 = 保活探测，没有 DATA (AA 55 02 02，共 4 字节)
+    CMD 0x03 = 长链设置输出 (芯片数可变): AA 55 03 OFF_L OFF_H LEN_L LEN_H [DATA x LEN] CS
+               DATA 写入链上第 OFF 片开始的 LEN 片；OFF + LEN 等于链长的那一块到达时从机锁存输出，
+               超过一块能装下的长度时拆成多块按顺序发送
+    CS = (CMD + sum(DATA)) & 0xFF (CMD 0x03 的 DATA 包含 OFF/LEN 四个字节)
+从机应答: 单字节 06 (ACK) / 15 (NAK)，也可能上报与上面格式相同的状态帧。
+
+FrameEncoder 把帧直接写进预先分配好的缓冲区，重复发送时不再创建新的 bytearray；
+ChainEncoder 按运行时设置的芯片数选择 CMD 0x01 或 0x03 分块帧。
+脚本中可以直接使用本模块，不需要 Tk。
+"""
+import re
+import struct
+from collections import namedtuple
+
+# ================= 协议常量 =================
+HEAD1 = 0xAA
+HEAD2 = 0x55
+CMD_SET_OUTPUTS = 0x01
+CMD_PING = 0x02             # 保活探测，不带数据，从机只需回复 ACK
+CMD_SET_OUTPUTS_EXT = 0x03  # 长链设置输出，带偏移与长度字段
+
+NUM_CHIPS = 6
+BITS_PER_CHIP = 8
+NUM_BITS = NUM_CHIPS * BITS_PER_CHIP
+
+HEADER_LEN = 3                                   # AA 55 CMD
+FRAME_LEN = HEADER_LEN + NUM_CHIPS + 1           # 10 字节
+
+EXT_HEADER = struct.Struct("<HH")                # CMD 0x03 的 偏移 + 长度 (小端)
+MAX_CHIPS = 0xFFFF
+DEFAULT_MAX_CHUNK = 256                          # CMD 0x03 每块最多携带的芯片数据 (字节)
+VAR_LEN = -1                                     # FRAME_DATA_LEN 中表示 "长度由帧内字段给出"
+
+# 6 字节小端 = 低 4 字节 + 高 2 字节，pack_into 可以一次写完
+_PACK_6 = struct.Struct("<IH")
+
+
+def calculate_checksum(cmd, data):
+    """CS = (CMD + 所有数据字节之和) & 0xFF"""
+    return (cmd + sum(data)) & 0xFF
+
+
+def bits_to_mask(bits):
+    """把 0/1 序列 (下标即全局 Bit 编号) 转成整数位掩码"""
+    mask = 0
+    for i, b in enumerate(bits):
+        if b:
+            mask |= 1 << i
+    return mask
+
+
+def mask_to_bytes(mask, num_chips=NUM_CHIPS):
+    """位掩码 -> 每片 595 一个字节 (芯片 #1 在最前)"""
+    return mask.to_bytes(num_chips, "little")
+
+
+def build_frame(mask, num_chips=NUM_CHIPS):
+    """构建一帧并返回新的 bytes (偶尔调用时使用；高频路径请用 FrameEncoder)"""
+    data = mask_to_bytes(mask, num_chips)
+    return bytes((HEAD1, HEAD2, CMD_SET_OUTPUTS)) + data + bytes((calculate_checksum(CMD_SET_OUTPUTS, data),))
+
+
+# 保活探测帧是固定内容，直接预先构建
+PING_FRAME = bytes((HEAD1, HEAD2, CMD_PING, calculate_checksum(CMD_PING, b"")))
+
+
+class FrameEncoder:
+    """在固定缓冲区中编码 "设置输出" 帧
+
+    encode_* 返回指向内部缓冲区的 memoryview，下次编码会覆盖其内容，
+    因此调用方应在下次编码前发送完毕 (socket.sendall 可以直接接收 memoryview)。
+    同一个编码器不要在多个线程中同时使用。
+    """
+
+    def __init__(self, num_chips=NUM_CHIPS, cmd=CMD_SET_OUTPUTS):
+        self.num_chips = num_chips
+        self.cmd = cmd
+        self.frame_len = HEADER_LEN + num_chips + 1
+        self.buf = bytearray(self.frame_len)
+        self.buf[0:HEADER_LEN] = bytes((HEAD1, HEAD2, cmd))
+        self.view = memoryview(self.buf)
+        self._data = self.view[HEADER_LEN:HEADER_LEN + num_chips]
+        self._cs_index = self.frame_len - 1
+        self._mask_limit = 1 << (num_chips * BITS_PER_CHIP)
+        self._header = bytes(self.buf[0:HEADER_LEN])
+        self._batch = bytearray()
+        self._batch_struct = None       # (批量大小, struct.Struct)
+
+    def encode_mask(self, mask):
+        """按整数位掩码编码，返回整帧的 memoryview (非 6 片时 to_bytes 会产生一个临时 bytes)"""
+        if not 0 <= mask < self._mask_limit:
+            raise ValueError(f"位掩码超出 {self.num_chips * BITS_PER_CHIP} 位范围")
+        if self.num_chips == NUM_CHIPS:
+            _PACK_6.pack_into(self.buf, HEADER_LEN, mask & 0xFFFFFFFF, mask >> 32)
+        else:
+            self._data[:] = mask.to_bytes(self.num_chips, "little")
+        self.buf[self._cs_index] = (self.cmd + sum(self._data)) & 0xFF
+        return self.view
+
+    def encode_bytes(self, data):
+        """按字节缓冲区编码 (长度必须等于芯片数)，返回整帧的 memoryview"""
+        if len(data) != self.num_chips:
+            raise ValueError(f"数据长度应为 {self.num_chips} 字节，实际为 {len(data)}")
+        self._data[:] = data
+        self.buf[self._cs_index] = (self.cmd + sum(self._data)) & 0xFF
+        return self.view
+
+    def data(self):
+        """最近一次编码的数据区 (不含帧头和校验)"""
+        return self._data
+
+    def encode_batch(self, states):
+        """把一串状态 (整数掩码或字节缓冲区) 编码成一段连续的缓冲区
+
+        返回 memoryview，长度为 len(states) * frame_len；内部缓冲区会被复用，
+        只有批量变大时才重新分配。每帧只在 Python 里算出数据与校验和，整批由一个
+        预编译的 struct 一次写入 (同一批量大小复用同一个 Struct)。
+        """
+        count = len(states)
+        size = count * self.frame_len
+        if len(self._batch) < size:
+            self._batch = bytearray(size)
+        if self._batch_struct is None or self._batch_struct[0] != count:
+            fmt = "<" + f"3s{self.num_chips}sB" * count
+            self._batch_struct = (count, struct.Struct(fmt))
+        header = self._header
+        n = self.num_chips
+        cmd = self.cmd
+        args = []
+        append = args.append
+        for state in states:
+            if isinstance(state, int):
+                try:
+                    data = state.to_bytes(n, "little")
+                except OverflowError:
+                    raise ValueError(f"位掩码超出 {n * BITS_PER_CHIP} 位范围") from None
+            else:
+                data = bytes(state)
+                if len(data) != n:
+                    raise ValueError(f"数据长度应为 {n} 字节，实际为 {len(data)}")
+            append(header)
+            append(data)
+            append((cmd + sum(data)) & 0xFF)
+        self._batch_struct[1].pack_into(self._batch, 0, *args)
+        return memoryview(self._batch)[:size]
+
+
+class ChainEncoder:
+    """任意芯片数的 "设置输出" 编码器
+
+    链长等于 NUM_CHIPS 时发送旧格式 CMD 0x01 (兼容现有固件)，否则发送 CMD 0x03，
+    每块最多 max_chunk 片。所有块在构造时预先分配在一个缓冲区里，encode_* 每次返回
+    同一个帧列表 (各元素为指向缓冲区的 memoryview)，只改写数据与校验字节，
+    耗时与芯片数成正比。encode_mask 把整数转成字节时仍会产生一个与链长相同的临时 bytes
+    (int.to_bytes 不能直接写入已有的缓冲区)；调用方手里已经是字节数据时用 encode_bytes，
+    不产生任何临时对象。与 FrameEncoder 一样，下次编码前应发送完毕，不要跨线程共用。
+    """
+
+    def __init__(self, num_chips=NUM_CHIPS, max_chunk=DEFAULT_MAX_CHUNK, legacy=True):
+        if not 1 <= num_chips <= MAX_CHIPS:
+            raise ValueError(f"芯片数应在 1–{MAX_CHIPS} 之间")
+        if not 1 <= max_chunk <= MAX_CHIPS:
+            raise ValueError(f"分块长度应在 1–{MAX_CHIPS} 之间")
+        self.num_chips = num_chips
+        self.num_bits = num_chips * BITS_PER_CHIP
+        self.extended = not (legacy and num_chips == NUM_CHIPS)
+        self._mask_limit = 1 << self.num_bits
+        self._legacy = None
+        # 每块: (数据区 memoryview, 在链上的起止位置, 校验字节位置, 帧头部分的校验和)
+        self._chunks = []
+        if not self.extended:
+            self._legacy = FrameEncoder(num_chips)
+            self.buf = self._legacy.buf
+            self.frames = [self._legacy.view]
+            self._chunks.append((self._legacy.data(), 0, num_chips, FRAME_LEN - 1, CMD_SET_OUTPUTS))
+            return
+
+        count = -(-num_chips // max_chunk)
+        overhead = HEADER_LEN + EXT_HEADER.size + 1
+        self.buf = bytearray(num_chips + count * overhead)
+        view = memoryview(self.buf)
+        self.frames = []
+        pos = 0
+        for offset in range(0, num_chips, max_chunk):
+            length = min(max_chunk, num_chips - offset)
+            data_start = pos + HEADER_LEN + EXT_HEADER.size
+            end = data_start + length
+            self.buf[pos:pos + HEADER_LEN] = bytes((HEAD1, HEAD2, CMD_SET_OUTPUTS_EXT))
+            EXT_HEADER.pack_into(self.buf, pos + HEADER_LEN, offset, length)
+            base = CMD_SET_OUTPUTS_EXT + sum(self.buf[pos + HEADER_LEN:data_start])
+            self._chunks.append((view[data_start:end], offset, offset + length, end, base))
+            self.frames.append(view[pos:end + 1])
+            pos = end + 1
+
+    @property
+    def frame_bytes(self):
+        """一次完整更新在线路上的字节数"""
+        return len(self.buf)
+
+    def encode_mask(self, mask):
+        """按整数位掩码编码，返回帧列表 (按顺序全部发送才算一次完整更新)"""
+        if not 0 <= mask < self._mask_limit:
+            raise ValueError(f"位掩码超出 {self.num_bits} 位范围")
+        if self._legacy is not None:
+            self._legacy.encode_mask(mask)
+            return self.frames
+        return self.encode_bytes(mask.to_bytes(self.num_chips, "little"))
+
+    def encode_bytes(self, data):
+        """按字节缓冲区编码 (长度必须等于芯片数)，返回帧列表"""
+        if len(data) != self.num_chips:
+            raise ValueError(f"数据长度应为 {self.num_chips} 字节，实际为 {len(data)}")
+        if self._legacy is not None:
+            self._legacy.encode_bytes(data)
+            return self.frames
+        buf = self.buf
+        src = memoryview(data)          # 切片不复制数据
+        for chunk, start, end, cs_index, base in self._chunks:
+            chunk[:] = src[start:end]
+            buf[cs_index] = (base + sum(chunk)) & 0xFF
+        return self.frames
+
+    def data(self):
+        """最近一次编码的全部芯片数据 (新的 bytes，只用于显示)"""
+        return b"".join(chunk for chunk, *_ in self._chunks)
+
+
+def parse_chain_chunk(data):
+    """CMD 0x03 帧的 DATA -> (偏移, 芯片数据)"""
+    offset, length = EXT_HEADER.unpack_from(data)
+    return offset, data[EXT_HEADER.size:EXT_HEADER.size + length]
+
+
+# ================= 接收解析 =================
+ACK = 0x06
+NAK = 0x15
+
+# 事件类型
+EVT_ACK = "ack"
+EVT_NAK = "nak"
+EVT_STATUS = "status"       # 从机上报的完整帧 (AA 55 CMD DATA CS)
+EVT_UNKNOWN = "unknown"     # 无法识别的字节、未知命令或校验失败的帧
+
+# kind: 事件类型, cmd: 帧命令字 (非帧事件为 None), data: 帧数据或无法识别的原始字节
+Event = namedtuple("Event", ["kind", "cmd", "data"])
+
+_ACK_EVENT = Event(EVT_ACK, None, None)
+_NAK_EVENT = Event(EVT_NAK, None, None)
+
+# 各命令字对应的数据长度 (VAR_LEN: 帧头后跟 偏移 + 长度 字段)
+FRAME_DATA_LEN = {
+    CMD_SET_OUTPUTS: NUM_CHIPS,
+    CMD_PING: 0,
+    CMD_SET_OUTPUTS_EXT: VAR_LEN,
+}
+
+# 需要逐个处理的字节；其余字节可以整段跳过
+_INTERESTING = re.compile(rb"[\x06\x15\xaa]")
+
+
+class FrameParser:
+    """增量帧解析器
+
+    数据读入固定大小的缓冲区 (读写指针，写满时把剩余数据整体前移，不会扩容)，
+    在 AA 55 帧头处重新同步，解析出 ACK / NAK / 状态帧 / 未知数据 事件。
+    TCP 把 ACK 或帧拆开、合并都不影响计数。解析过程中不做任何字符串格式化。
+    """
+
+    def __init__(self, capacity=4096, data_len=None):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.data_len = dict(FRAME_DATA_LEN if data_len is None else data_len)
+
+        # 统计计数
+        self.acks = 0
+        self.naks = 0
+        self.frames = 0
+        self.bad_frames = 0
+        self.unknown_bytes = 0
+        self.rx_bytes = 0
+
+    def reset(self):
+        self.read_pos = self.write_pos = 0
+
+    def _make_room(self):
+        if self.read_pos == self.write_pos:
+            self.read_pos = self.write_pos = 0
+        elif self.read_pos > 0:
+            remaining = self.write_pos - self.read_pos
+            self.buf[0:remaining] = self.view[self.read_pos:self.write_pos]
+            self.read_pos, self.write_pos = 0, remaining
+
+    def recv_from(self, sock):
+        """直接从 socket 读入缓冲区空闲部分 (recv_into)，返回读到的字节数，0 表示对方关闭"""
+        n = sock.recv_into(self.free_space())
+        self.commit(n)
+        return n
+
+    def free_space(self):
+        """缓冲区空闲部分的 memoryview (写满时先把未解析的数据前移)，供 recv_into /
+        asyncio.BufferedProtocol.get_buffer 直接写入；写入后调用 commit(n)"""
+        if self.write_pos == self.capacity:
+            self._make_room()
+        return self.view[self.write_pos:]
+
+    def commit(self, n):
+        self.write_pos += n
+        self.rx_bytes += n
+
+    def feed(self, data):
+        """把已读到的数据 (例如 asyncio 的 read 结果) 拷入缓冲区并解析，返回事件列表"""
+        events = []
+        data = memoryview(data)
+        while data:
+            if self.write_pos == self.capacity:
+                self._make_room()
+            n = min(len(data), self.capacity - self.write_pos)
+            self.buf[self.write_pos:self.write_pos + n] = data[:n]
+            self.write_pos += n
+            self.rx_bytes += n
+            data = data[n:]
+            events.extend(self.parse())
+        return events
+
+    def parse(self):
+        """解析缓冲区中已有的数据，返回事件列表；不完整的帧留到下次"""
+        buf = self.buf
+        r = self.read_pos
+        w = self.write_pos
+        events = []
+        append = events.append
+        while r < w:
+            b = buf[r]
+            if b == ACK:
+                append(_ACK_EVENT)
+                self.acks += 1
+                r += 1
+            elif b == NAK:
+                append(_NAK_EVENT)
+                self.naks += 1
+                r += 1
+            elif b == HEAD1:
+                if w - r < HEADER_LEN:
+                    if w - r == 2 and buf[r + 1] != HEAD2:
+                        r = self._skip_unknown(r, r + 1, events)
+                        continue
+                    break
+                if buf[r + 1] != HEAD2:
+                    r = self._skip_unknown(r, r + 1, events)
+                    continue
+                cmd = buf[r + 2]
+                n = self.data_len.get(cmd)
+                if n is None:
+                    # 未知命令字：丢弃帧头，从下一个字节重新同步
+                    self.bad_frames += 1
+                    r = self._skip_unknown(r, r + HEADER_LEN, events)
+                    continue
+                if n == VAR_LEN:
+                    if w - r < HEADER_LEN + EXT_HEADER.size:
+                        break
+                    n = EXT_HEADER.size + (buf[r + 5] | buf[r + 6] << 8)
+                    if HEADER_LEN + n + 1 > self.capacity:
+                        # 长度字段超过缓冲区，不可能是合法帧
+                        self.bad_frames += 1
+                        r = self._skip_unknown(r, r + 1, events)
+                        continue
+                end = r + HEADER_LEN + n
+                if end >= w:
+                    break
+                data = bytes(buf[r + HEADER_LEN:end])
+                if buf[end] != (cmd + sum(data)) & 0xFF:
+                    # 校验失败：只跳过 AA，帧内可能还藏着真正的 ACK 或帧头
+                    self.bad_frames += 1
+                    r = self._skip_unknown(r, r + 1, events)
+                    continue
+                append(Event(EVT_STATUS, cmd, data))
+                self.frames += 1
+                r = end + 1
+            else:
+                m = _INTERESTING.search(buf, r, w)
+                r = self._skip_unknown(r, m.start() if m else w, events)
+        if r == w:
+            r = w = 0
+        self.read_pos, self.write_pos = r, w
+        return events
+
+    def _skip_unknown(self, start, end, events):
+        events.append(Event(EVT_UNKNOWN, None, bytes(self.buf[start:end])))
+        self.unknown_bytes += end - start
+        return end
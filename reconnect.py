@@ -0,0 +1,218 @@
+"""掉线自动重连
+
+链路中断 (接收出错、对方关闭连接、心跳超时、发送失败) 后不再弹窗等操作员处理，而是交给
+ReconnectManager 在 IoLoop 上按指数退避重试 (不单独占用线程)：第 n 次重试前等待
+min(max_delay, base_delay * factor ** n) 的一半到全部之间的随机时间。随机抖动使多台主机
+同时掉线 (例如 AP 重启) 时不会在同一时刻一起重连；第一次重试几乎立即进行，短暂的 Wi-Fi
+抖动可以在一两百毫秒内恢复。
+
+连接恢复后回调 on_recovered(outage, attempts)，由调用方重新同步输出状态；每次中断的时长
+(从发现掉线到重新连上) 都计入统计。恢复后不到 stable_time 秒又掉线 (例如设备接受连接后立即
+断开) 时，退避从上次的位置继续增长，不会以最短间隔反复重连。
+"""
+import asyncio
+import random
+import threading
+import time
+
+# ================= 配置 =================
+DEFAULT_BASE_DELAY = 0.1
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_FACTOR = 2.0
+DEFAULT_STABLE_TIME = 1.0       # 恢复后保持这么久才算稳定，之后的掉线重新从最短间隔开始
+
+
+class Backoff:
+    """带随机抖动的指数退避：delay() 返回下一次重试前的等待时间，reset() 从头开始"""
+
+    def __init__(self, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 factor=DEFAULT_FACTOR, rng=None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.rng = rng or random.Random()
+        self.attempt = 0
+
+    def reset(self):
+        self.attempt = 0
+
+    def ceiling(self):
+        """本次等待时间的上限"""
+        return min(self.max_delay, self.base_delay * self.factor ** self.attempt)
+
+    def delay(self):
+        ceiling = self.ceiling()
+        self.attempt += 1
+        return self.rng.uniform(ceiling / 2, ceiling)
+
+
+class ReconnectManager:
+    """掉线后在 io_loop 上反复 await connect() 直到成功
+
+    connect 为协程函数，成功返回真值，失败返回假值或抛出异常；重连被取消时它会被 cancel。
+    on_attempt(attempt, delay, error): 第 attempt 次重试失败，delay 秒后再试；
+    on_recovered(outage, attempts): 重连成功，outage 为中断时长 (秒)；
+    on_gave_up(outage, attempts): 超过 max_attempts (0 为不限) 后放弃。
+    回调都在事件循环线程中执行，界面层需自行转回主线程。
+    """
+
+    def __init__(self, io_loop, connect, on_attempt=None, on_recovered=None, on_gave_up=None,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, factor=DEFAULT_FACTOR,
+                 max_attempts=0, stable_time=DEFAULT_STABLE_TIME, rng=None):
+        self.io = io_loop
+        self.connect = connect
+        self.on_attempt = on_attempt
+        self.on_recovered = on_recovered
+        self.on_gave_up = on_gave_up
+        self.max_attempts = max_attempts
+        self.stable_time = stable_time
+        self.backoff = Backoff(base_delay, max_delay, factor, rng)
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._task = None
+        self._lost_at = None            # 本次中断开始的时刻；None 表示链路正常
+        self._generation = 0            # 每次 link_lost / cancel 加一，用于作废过期的重连结果
+        self._next_delay = None         # 上次失败时已经算好的下一次等待时间
+        self._recovered_at = None
+        self.reason = None
+        self.attempts = 0               # 本次中断已尝试的次数
+
+        # 统计
+        self.outages = 0
+        self.recovered = 0
+        self.gave_up = 0
+        self.total_attempts = 0
+        self.total_outage = 0.0
+        self.last_outage = None
+        self.max_outage = 0.0
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        with self._lock:
+            self._running = True
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._lost_at = None
+            self._generation += 1
+        if self.io.running:
+            self.io.call_soon(self._cancel_task)
+
+    # ---------- 事件 (任意线程) ----------
+
+    def link_lost(self, reason=None):
+        """报告链路中断，开始重连；已在重连中时忽略"""
+        with self._lock:
+            if not self._running or self._lost_at is not None:
+                return False
+            self._lost_at = time.monotonic()
+            self._generation += 1
+            self.reason = reason
+            self.attempts = 0
+            self.outages += 1
+            if self._recovered_at is None or self._lost_at - self._recovered_at >= self.stable_time:
+                self.backoff.reset()
+            self._next_delay = None
+        self.io.call_soon(self._ensure_task)
+        return True
+
+    def cancel(self):
+        """放弃本次重连 (例如操作员主动断开)；正在进行的 connect() 会被 cancel"""
+        with self._lock:
+            if self._lost_at is None:
+                return False
+            self._lost_at = None
+            self._generation += 1
+        self.io.call_soon(self._cancel_task)
+        return True
+
+    @property
+    def active(self):
+        """是否正在重连"""
+        return self._lost_at is not None
+
+    def outage(self):
+        """本次中断已经持续的时间 (秒)，未中断时为 None"""
+        lost_at = self._lost_at
+        return None if lost_at is None else time.monotonic() - lost_at
+
+    def stats(self):
+        return {
+            "outages": self.outages,
+            "recovered": self.recovered,
+            "gave_up": self.gave_up,
+            "attempts": self.total_attempts,
+            "reconnecting": self.active,
+            "last_outage_ms": None if self.last_outage is None else self.last_outage * 1000,
+            "max_outage_ms": self.max_outage * 1000,
+            "avg_outage_ms": self.total_outage / self.recovered * 1000 if self.recovered else 0.0,
+        }
+
+    # ---------- 重连任务 (事件循环线程) ----------
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def _cancel_task(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+
+    def _emit(self, callback, *args):
+        if callback is not None:
+            try:
+                callback(*args)
+            except Exception:
+                pass
+
+    async def _run(self):
+        while True:
+            with self._lock:
+                if not self._running or self._lost_at is None:
+                    return
+                generation = self._generation
+                delay, self._next_delay = self._next_delay, None
+                if delay is None:
+                    delay = self.backoff.delay()
+            await asyncio.sleep(delay)
+            with self._lock:
+                if self._generation != generation:
+                    continue # 等待期间被取消或再次掉线
+                self.attempts += 1
+                self.total_attempts += 1
+                attempt = self.attempts
+
+            error = None
+            try:
+                ok = await self.connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ok = False
+                error = e
+
+            with self._lock:
+                if self._generation != generation:
+                    continue
+                outage = time.monotonic() - self._lost_at
+                if ok:
+                    self._lost_at = None
+                    self._recovered_at = time.monotonic()
+                    self.recovered += 1
+                    self.total_outage += outage
+                    self.last_outage = outage
+                    self.max_outage = max(self.max_outage, outage)
+                    callback, args = self.on_recovered, (outage, attempt)
+                elif self.max_attempts and attempt >= self.max_attempts:
+                    self._lost_at = None
+                    self.gave_up += 1
+                    callback, args = self.on_gave_up, (outage, attempt)
+                else:
+                    self._next_delay = self.backoff.delay()
+                    callback, args = self.on_attempt, (attempt, self._next_delay, error)
+            self._emit(callback, *args)
@@ -0,0 +1,335 @@
+"""流水线发送：在途窗口、ACK 对应与超时重传
+
+从机对每个合法帧按顺序回复一个 ACK (06)，帧本身不带序号，因此 ACK 按发送顺序对应到在途帧。
+提交的单位是一次完整的更新：一帧 CMD 0x01，或长链的全部 CMD 0x03 分块 (按顺序发送，
+链尾块到达时从机才锁存)。分块单独看不是幂等的，所以一次更新的所有分块都得到 ACK 才算确认，
+超时或 NAK 时整个更新从第一块开始重发。每次更新都是完整的输出状态 (幂等)：某帧丢失时，
+后续 ACK 会被记到更早的帧上，ACK 的缺口总是落在最后的在途更新上，它一定超时并被完整重发，
+继电器的最终状态与界面保持一致 (被记错的中间更新已被后面的完整状态覆盖)。
+
+超时时间 (RTO) 按 Jacobson/Karels 算法由实测 RTT 计算，重传帧的 RTT 不参与估计 (Karn 算法)。
+给出 io_loop 时超时检测是该 IoLoop 上的一个定时器 (loop.call_later)，不单独占用线程，
+多条链路共用一个事件循环时线程数不随链路数增加。
+"""
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+# ================= 配置 =================
+DEFAULT_WINDOW = 8          # 最多同时在途的帧数 (分块更新超过窗口时单独在途)
+DEFAULT_MAX_RETRIES = 3     # 每次更新最多重传次数
+INITIAL_RTO = 0.5
+MIN_RTO = 0.05
+MAX_RTO = 3.0
+
+# seq: 提交序号, delivered: 是否收到 ACK (分块更新为全部分块), attempts: 发送次数, rtt: 确认耗时 (秒),
+# context: 提交时附带的上下文 (例如输出位掩码)
+FrameResult = namedtuple("FrameResult", ["seq", "delivered", "attempts", "rtt", "context"])
+
+
+class RttEstimator:
+    """RFC 6298 风格的 RTT / RTO 估计"""
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.samples = 0
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+    def backoff(self):
+        """超时后 RTO 翻倍"""
+        self.rto = min(self.max_rto, self.rto * 2)
+
+
+class _Pending:
+    __slots__ = ("seq", "frames", "acked", "context", "future", "first_sent", "sent_at", "attempts")
+
+    def __init__(self, seq, frames, context):
+        self.seq = seq
+        self.frames = frames            # 一次更新的全部帧 (按顺序发送)
+        self.acked = 0                  # 本次发送中已收到 ACK 的帧数
+        self.context = context
+        self.future = Future()
+        self.first_sent = 0.0
+        self.sent_at = 0.0
+        self.attempts = 0
+
+
+class SendPipeline:
+    """transmit(payload) 负责把字节写到连接上，失败时抛出异常
+
+    on_result(FrameResult) 在每次更新有结果 (确认或最终失败) 时回调，调用线程不固定。
+    io_loop 为 io_loop.IoLoop 时超时重传在该事件循环线程中进行，否则在流水线自己的线程中。
+    """
+
+    def __init__(self, transmit, window=DEFAULT_WINDOW, max_retries=DEFAULT_MAX_RETRIES,
+                 rtt=None, on_result=None, on_error=None, io_loop=None):
+        self.transmit = transmit
+        self.io = io_loop
+        self.window = window
+        self.max_retries = max_retries
+        self.rtt = rtt or RttEstimator()
+        self.on_result = on_result
+        self.on_error = on_error
+
+        self._lock = threading.Condition()
+        self._tx_lock = threading.Lock()      # 保证线路上的发送顺序与在途队列一致
+        self._in_flight = deque()
+        self._outstanding = 0                  # 在途更新中尚未收到 ACK 的帧数
+        self._queue = deque()
+        self._next_seq = 0
+        self._running = False
+        self._thread = None
+        self._timer = None                     # IoLoop 上的超时定时器 (只在事件循环线程中修改)
+        self._armed = False                    # 已安排定时器或正在投递安排
+
+        # 统计计数
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retransmits = 0
+        self.naks = 0
+        self.stray_acks = 0                    # 没有在途帧时收到的 ACK
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+        if self.io is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="send-pipeline", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self.io is not None:
+            if self.io.running:
+                self.io.call_soon(self._cancel_timer)
+        elif self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        self.reset()
+
+    def reset(self):
+        """丢弃所有在途与排队的帧，全部报告为失败"""
+        with self._lock:
+            dropped = list(self._in_flight) + list(self._queue)
+            self._in_flight.clear()
+            self._outstanding = 0
+            self._queue.clear()
+        for p in dropped:
+            self._finish(p, False, None)
+
+    # ---------- 提交与确认 (任意线程) ----------
+
+    def submit(self, payload, context=None):
+        """提交一次更新，返回 Future，结果为 FrameResult；窗口已满时排队
+
+        payload 为一帧，或一次更新的分块帧列表 (ChainEncoder.encode_mask 的结果)，
+        分块作为一个整体确认与重传。
+        """
+        if isinstance(payload, (list, tuple)):
+            frames = [bytes(frame) for frame in payload]
+        else:
+            frames = [bytes(payload)]
+        with self._lock:
+            p = _Pending(self._next_seq, frames, context)
+            self._next_seq += 1
+            self.submitted += 1
+            self._queue.append(p)
+        self._pump()
+        return p.future
+
+    def on_ack(self, count=1):
+        now = time.monotonic()
+        done = []
+        with self._lock:
+            for _ in range(count):
+                if not self._in_flight:
+                    self.stray_acks += 1
+                    continue
+                p = self._in_flight[0]
+                p.acked += 1
+                self._outstanding -= 1
+                if p.acked < len(p.frames):
+                    continue
+                self._in_flight.popleft()
+                rtt = now - p.sent_at
+                if p.attempts == 1:
+                    self.rtt.sample(rtt)
+                done.append((p, now - p.first_sent))
+            self._lock.notify()
+        for p, rtt in done:
+            self._finish(p, True, rtt)
+        self._pump()
+
+    def on_nak(self, count=1):
+        """NAK 表示最早的在途帧被拒绝：立即按原顺序重传所有在途帧
+
+        只重传被拒绝的那一帧会让旧状态晚于新状态到达从机，因此与超时一样走 go-back-N。
+        """
+        with self._lock:
+            self.naks += count
+        self._go_back_n(timeout=False)
+        self._pump()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "retransmits": self.retransmits,
+                "naks": self.naks,
+                "stray_acks": self.stray_acks,
+                "in_flight": self._outstanding,
+                "queued": len(self._queue),
+                "srtt_ms": None if self.rtt.srtt is None else self.rtt.srtt * 1000,
+                "rto_ms": self.rtt.rto * 1000,
+            }
+
+    # ---------- 内部 ----------
+
+    def _finish(self, p, delivered, rtt):
+        with self._lock:
+            if delivered:
+                self.delivered += 1
+            else:
+                self.failed += 1
+        result = FrameResult(p.seq, delivered, p.attempts, rtt, p.context)
+        if not p.future.done():
+            p.future.set_result(result)
+        if self.on_result:
+            try:
+                self.on_result(result)
+            except Exception:
+                pass
+
+    def _send(self, p):
+        """在持有 _tx_lock 时调用：登记为在途并按顺序写出全部帧"""
+        now = time.monotonic()
+        with self._lock:
+            p.attempts += 1
+            p.sent_at = now
+            if p.attempts == 1:
+                p.first_sent = now
+            p.acked = 0
+            self._outstanding += len(p.frames)
+            self._in_flight.append(p)
+            self._lock.notify()
+            arm = self.io is not None and self._running and not self._armed
+            if arm:
+                self._armed = True
+        if arm:
+            self.io.call_soon(self._on_timer)
+        try:
+            for frame in p.frames:
+                self.transmit(frame)
+        except Exception as e:
+            self.reset()
+            if self.on_error:
+                self.on_error(e)
+            return False
+        return True
+
+    def _pump(self):
+        """窗口有空位时把排队的更新发出去；比窗口还大的分块更新等在途的全部确认后单独发送"""
+        with self._tx_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        return
+                    if self._in_flight and self._outstanding + len(self._queue[0].frames) > self.window:
+                        return
+                    p = self._queue.popleft()
+                if not self._send(p):
+                    return
+
+    def _go_back_n(self, timeout):
+        """把所有在途更新按原顺序完整重发 (包括已收到部分 ACK 的分块)；超过重传次数的报告失败
+
+        timeout 为 True 时先确认最早的在途帧确实已经超时 (期间可能刚收到 ACK)，并把 RTO 翻倍。
+        """
+        with self._tx_lock:
+            with self._lock:
+                if timeout:
+                    if not self._in_flight:
+                        return
+                    if time.monotonic() < self._in_flight[0].sent_at + self.rtt.rto:
+                        return
+                    self.rtt.backoff()
+                retry = list(self._in_flight)
+                self._in_flight.clear()
+                self._outstanding = 0
+            for i, p in enumerate(retry):
+                if p.attempts > self.max_retries:
+                    self._finish(p, False, None)
+                    continue
+                with self._lock:
+                    self.retransmits += 1
+                if not self._send(p):
+                    # reset() 只结束在途与排队的帧，还没来得及重发的帧在这里报告失败
+                    for rest in retry[i + 1:]:
+                        self._finish(rest, False, None)
+                    return
+
+    def _run(self):
+        """超时检测：最早的在途帧超过 RTO 未确认时，按 go-back-N 重传所有在途帧"""
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                if not self._in_flight:
+                    self._lock.wait()
+                    continue
+                deadline = self._in_flight[0].sent_at + self.rtt.rto
+                now = time.monotonic()
+                if now < deadline:
+                    self._lock.wait(deadline - now)
+                    continue
+            self._go_back_n(timeout=True)
+            self._pump()
+
+    # ---------- IoLoop 定时器 (事件循环线程) ----------
+
+    def _on_timer(self):
+        """与 _run 相同的超时检测；最早的在途帧还没到期时按它的截止时间重新定时"""
+        self._timer = None
+        while True:
+            with self._lock:
+                if not self._running or not self._in_flight:
+                    self._armed = False
+                    return
+                deadline = self._in_flight[0].sent_at + self.rtt.rto
+                now = time.monotonic()
+                if now < deadline:
+                    self._timer = self.io.loop.call_later(deadline - now, self._on_timer)
+                    return
+            self._go_back_n(timeout=True)
+            self._pump()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._lock:
+            self._armed = False
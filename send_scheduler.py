@@ -0,0 +1,213 @@
+"""合并发送调度器
+
+连续的勾选变化在一个时间窗口内合并为一帧，只发送最新状态；
+与设备最后一次 ACK 确认的状态相同的帧直接丢弃；发送频率不超过 max_rate。
+调用 request() 不会阻塞：给出 io_loop 时由该 IoLoop 上的定时器 (loop.call_later) 发送，
+否则在调度器自己的一个后台线程中发送。
+"""
+import threading
+import time
+
+# ================= 配置 =================
+DEFAULT_WINDOW = 0.010      # 合并窗口 10 ms
+DEFAULT_MAX_RATE = 50.0     # 每秒最多 50 帧
+
+
+class SendScheduler:
+    """send_func(mask) 负责真正的编码与发送，成功返回 True
+
+    io_loop 为 io_loop.IoLoop 时 send_func 在该事件循环线程中调用，否则在调度器自己的线程中。
+    """
+
+    def __init__(self, send_func, window=DEFAULT_WINDOW, max_rate=DEFAULT_MAX_RATE, io_loop=None):
+        self.send_func = send_func
+        self.window = window
+        self.max_rate = max_rate
+        self.io = io_loop
+
+        self._cond = threading.Condition()
+        self._pending = None            # 待发送的最新状态，None 表示没有
+        self._first_request = 0.0       # 本轮合并窗口的起点
+        self._last_send = 0.0
+        self._delayed = False
+        self._in_flight = 0             # 已发送、尚未有结果的帧数
+        self._acked = None              # 设备最后一次确认的状态
+        self._running = False
+        self._thread = None
+        self._timer = None              # IoLoop 上的定时器 (只在事件循环线程中修改)
+        self._armed = False             # 已安排定时器或正在投递安排
+
+        # 统计计数
+        self.requests = 0               # request() 调用次数
+        self.frames_sent = 0            # 实际发出的帧数
+        self.coalesced = 0              # 被合并掉的请求数
+        self.deduped = 0                # 与已确认状态相同而丢弃的帧数
+        self.rate_limited = 0           # 因帧率限制而推迟的次数
+
+    def configure(self, window=None, max_rate=None):
+        with self._cond:
+            if window is not None:
+                self.window = max(0.0, window)
+            if max_rate is not None:
+                self.max_rate = max(0.0, max_rate)
+            self._cond.notify()
+        self._wake()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        if self.io is not None:
+            self._wake()
+            return self
+        self._thread = threading.Thread(target=self._run, name="send-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self.io is not None:
+            if self.io.running:
+                self.io.call_soon(self._cancel_timer)
+            return
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def reset(self):
+        """连接断开或重新建立时调用：清空待发送与 ACK 记录"""
+        with self._cond:
+            self._pending = None
+            self._in_flight = 0
+            self._acked = None
+
+    def request(self, mask):
+        """登记一个新状态，稍后与窗口内的其他变化一起发送"""
+        with self._cond:
+            self.requests += 1
+            if self._pending is not None:
+                self.coalesced += 1
+            else:
+                self._first_request = time.monotonic()
+                self._delayed = False
+            self._pending = mask
+            self._cond.notify()
+        self._wake()
+
+    def mark_sent(self, mask):
+        """调度器之外直接发送的帧 (心跳、强制同步) 也要登记，以便对应后续的确认结果"""
+        with self._cond:
+            self._in_flight += 1
+            self._last_send = time.monotonic()
+            # 直接发送的正好是待发送的状态，这一轮就不用再发了
+            if self._pending == mask:
+                self._pending = None
+
+    def on_result(self, mask, delivered):
+        """某帧有了结果：delivered 为 True 表示设备已 ACK 该状态"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if delivered:
+                self._acked = mask
+
+    @property
+    def acked_mask(self):
+        return self._acked
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "frames_sent": self.frames_sent,
+                "coalesced": self.coalesced,
+                "deduped": self.deduped,
+                "rate_limited": self.rate_limited,
+                "saved": self.requests - self.frames_sent,
+            }
+
+    def _due(self, now):
+        """持有锁时调用：返回 (要发送的状态, 等待秒数)
+
+        没有待发送的状态时为 (None, None)；还要等待合并窗口或帧率限制时为 (None, 秒数)。
+        """
+        if self._pending is None:
+            return None, None
+        # 等到合并窗口结束，且距上一帧不少于 1 / max_rate
+        deadline = self._first_request + self.window
+        if self.max_rate > 0:
+            rate_deadline = self._last_send + 1.0 / self.max_rate
+            if rate_deadline > deadline:
+                if not self._delayed:
+                    self._delayed = True
+                    self.rate_limited += 1
+                deadline = rate_deadline
+        if now < deadline:
+            return None, deadline - now
+
+        mask, self._pending = self._pending, None
+        # 已确认的状态与最新状态相同，且没有在途帧会改变它，则无需发送
+        if mask == self._acked and not self._in_flight:
+            self.deduped += 1
+            return None, None
+        return mask, 0.0
+
+    def _sent(self, ok):
+        """持有锁时调用：登记一次 send_func 的结果"""
+        if ok:
+            self.frames_sent += 1
+            self._in_flight += 1
+            self._last_send = time.monotonic()
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                mask, wait = self._due(time.monotonic())
+                if mask is None:
+                    self._cond.wait(wait)
+                    continue
+                self._cond.release()
+                try:
+                    ok = self.send_func(mask)
+                finally:
+                    self._cond.acquire()
+                self._sent(ok)
+
+    # ---------- IoLoop 定时器 (事件循环线程) ----------
+
+    def _wake(self):
+        """有新的待发送状态或参数变化 (任意线程)：没有安排定时器时投递一次安排"""
+        if self.io is None:
+            return
+        with self._cond:
+            if self._armed or not self._running or self._pending is None:
+                return
+            self._armed = True
+        self.io.call_soon(self._tick)
+
+    def _tick(self):
+        self._timer = None
+        while True:
+            with self._cond:
+                if not self._running:
+                    self._armed = False
+                    return
+                mask, wait = self._due(time.monotonic())
+                if mask is None:
+                    if wait is None:
+                        self._armed = False
+                        return
+                    self._timer = self.io.loop.call_later(wait, self._tick)
+                    return
+            ok = self.send_func(mask)
+            with self._cond:
+                self._sent(ok)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._cond:
+            self._armed = False
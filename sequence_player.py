@@ -0,0 +1,254 @@
+"""定时输出序列回放
+
+序列由若干 (时间偏移秒, 48 位输出状态) 步组成，可以从 CSV / JSON 加载，也可以用循环、流水灯等生成。
+回放在独立线程中按单调时钟调度：每一步的目标时间都由序列起点加偏移量算出 (不累计误差)，
+临近目标时间时改为忙等，可以稳定运行在 10 ms 以下的步进间隔。
+每一步通过 send(mask) 发送 (与 send_data 相同的帧格式)，并记录实际时间误差。
+
+CSV 格式 (首行可以是表头):
+    offset_ms,state
+    0,0x000000000001
+    20,0x000000000003
+JSON 格式:
+    {"steps": [{"t": 0.0, "state": "0x01"}, {"t": 0.02, "state": 3}]}
+    或直接 [[0.0, 1], [0.02, 3]] (时间单位为秒)
+"""
+import csv
+import json
+import threading
+import time
+from collections import namedtuple
+
+import protocol
+
+# ================= 配置 =================
+SPIN_THRESHOLD = 0.002      # 距离目标时间不足 2 ms 时改为忙等
+LATE_THRESHOLD = 0.001      # 实际发送晚于目标超过 1 ms 记为迟到
+
+# offset: 相对序列起点的时间 (秒), mask: 输出状态位掩码
+Step = namedtuple("Step", ["offset", "mask"])
+
+
+def _parse_state(value):
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().replace("_", "")
+    if text.lower().startswith("0b"):
+        return int(text, 2)
+    return int(text, 0)
+
+
+def _check(steps, num_bits):
+    limit = 1 << num_bits
+    last = 0.0
+    for step in steps:
+        if step.offset < last:
+            raise ValueError(f"时间偏移必须递增: {step.offset} < {last}")
+        if not 0 <= step.mask < limit:
+            raise ValueError(f"输出状态超出 {num_bits} 位: {step.mask:#x}")
+        last = step.offset
+    return steps
+
+
+def load_csv(path, num_bits=protocol.NUM_BITS):
+    """读取 offset_ms,state 两列的 CSV"""
+    steps = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            try:
+                offset_ms = float(row[0])
+            except ValueError:
+                continue # 表头
+            steps.append(Step(offset_ms / 1000.0, _parse_state(row[1])))
+    return _check(steps, num_bits)
+
+
+def load_json(path, num_bits=protocol.NUM_BITS):
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    return parse_steps(doc["steps"] if isinstance(doc, dict) else doc, num_bits)
+
+
+def parse_steps(items, num_bits=protocol.NUM_BITS):
+    """把已解析的 JSON 步骤列表转换为 Step (格式与 JSON 文件相同)"""
+    steps = []
+    for item in items:
+        if isinstance(item, dict):
+            steps.append(Step(float(item["t"]), _parse_state(item["state"])))
+        else:
+            steps.append(Step(float(item[0]), _parse_state(item[1])))
+    return _check(steps, num_bits)
+
+
+def load(path, num_bits=protocol.NUM_BITS):
+    """按扩展名选择 CSV 或 JSON"""
+    if path.lower().endswith(".json"):
+        return load_json(path, num_bits)
+    return load_csv(path, num_bits)
+
+
+def save_csv(steps, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["offset_ms", "state"])
+        for step in steps:
+            writer.writerow([f"{step.offset * 1000:g}", f"{step.mask:#x}"])
+
+
+# ---------- 序列生成 ----------
+
+def chase(interval, num_bits=protocol.NUM_BITS, width=1, start=0.0):
+    """流水灯：width 个连续位依次移过全部输出"""
+    block = (1 << width) - 1
+    full = (1 << num_bits) - 1
+    return [Step(start + i * interval, (block << i) & full) for i in range(num_bits)]
+
+
+def ramp(interval, num_bits=protocol.NUM_BITS, start=0.0, down=False):
+    """逐位点亮 (down=True 时逐位熄灭)"""
+    full = (1 << num_bits) - 1
+    steps = [Step(start + i * interval, (1 << (i + 1)) - 1) for i in range(num_bits)]
+    if down:
+        steps = [Step(s.offset, full & ~s.mask) for s in steps]
+    return steps
+
+
+def toggle(interval, mask, count, start=0.0):
+    """在 mask 与全关之间交替 count 次"""
+    return [Step(start + i * interval, mask if i % 2 == 0 else 0) for i in range(count)]
+
+
+def repeat(steps, times, period=None):
+    """把一段序列重复 times 次；period 默认为最后一步偏移加上平均步进"""
+    if not steps:
+        return []
+    if period is None:
+        span = steps[-1].offset - steps[0].offset
+        period = span + (span / (len(steps) - 1) if len(steps) > 1 else 0.0)
+    out = []
+    for n in range(times):
+        out.extend(Step(s.offset + n * period, s.mask) for s in steps)
+    return out
+
+
+# ---------- 回放 ----------
+
+class PlaybackReport:
+    """回放结果：每一步的时间误差 (实际发送时刻 - 目标时刻，秒)；error 为中途停止回放的异常"""
+
+    def __init__(self, errors, sent, skipped, cancelled, duration, error=None):
+        self.errors = errors
+        self.sent = sent
+        self.skipped = skipped
+        self.cancelled = cancelled
+        self.duration = duration
+        self.error = error
+
+    @property
+    def late_steps(self):
+        return sum(1 for e in self.errors if e > LATE_THRESHOLD)
+
+    def summary(self):
+        if not self.errors:
+            summary = {"steps": 0, "sent": self.sent, "skipped": self.skipped, "cancelled": self.cancelled}
+            if self.error is not None:
+                summary["error"] = str(self.error)
+            return summary
+        ordered = sorted(self.errors)
+        n = len(ordered)
+        mean = sum(ordered) / n
+        jitter = (sum((e - mean) ** 2 for e in ordered) / n) ** 0.5
+        summary = {
+            "steps": n,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "late": self.late_steps,
+            "cancelled": self.cancelled,
+            "duration_s": self.duration,
+            "mean_error_ms": mean * 1000,
+            "p99_error_ms": ordered[min(n - 1, int(n * 0.99))] * 1000,
+            "max_error_ms": ordered[-1] * 1000,
+            "jitter_ms": jitter * 1000,
+        }
+        if self.error is not None:
+            summary["error"] = str(self.error)
+        return summary
+
+
+class SequencePlayer:
+    """send(mask) 发送一步的输出状态；on_done(report) 在回放结束时调用 (回放线程中)
+
+    skip_late: 某步已经晚于下一步的目标时间时直接跳过，保证后续步骤不被拖慢。
+    """
+
+    def __init__(self, send, on_done=None, skip_late=False):
+        self.send = send
+        self.on_done = on_done
+        self.skip_late = skip_late
+        self._cancel = threading.Event()
+        self._thread = None
+        self.report = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def play(self, steps):
+        """在后台线程中开始回放 (需要循环时先用 repeat() 展开)"""
+        if self.running:
+            raise RuntimeError("序列正在回放中")
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, args=(list(steps),),
+                                        name="sequence-player", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.report
+
+    def run(self, steps):
+        """在当前线程中同步回放，返回 PlaybackReport"""
+        self._cancel.clear()
+        self._run(list(steps))
+        return self.report
+
+    def _run(self, steps):
+        errors = []
+        sent = skipped = 0
+        error = None
+        clock = time.perf_counter
+        start = clock()
+        try:
+            for i, step in enumerate(steps):
+                # 目标时刻总是由起点 + 偏移算出，前面步骤的延迟不会累积到后面
+                target = start + step.offset
+                # 先用 Event.wait 粗等 (可以被取消)，最后 2 ms 忙等
+                remaining = target - clock()
+                if remaining > SPIN_THRESHOLD and self._cancel.wait(remaining - SPIN_THRESHOLD):
+                    break
+                while clock() < target:
+                    time.sleep(0) # 让出 GIL，忙等期间不卡住其他线程
+                if self._cancel.is_set():
+                    break
+
+                now = clock()
+                if self.skip_late and i + 1 < len(steps) and now > start + steps[i + 1].offset:
+                    skipped += 1
+                    continue
+                self.send(step.mask)
+                errors.append(now - target)
+                sent += 1
+        except Exception as e:
+            # send 出错时停止回放，错误放进结果里
+            error = e
+        finally:
+            # 无论如何都给出结果，等待回放结束的一方不会一直等下去
+            self.report = PlaybackReport(errors, sent, skipped, self._cancel.is_set(), clock() - start, error)
+            if self.on_done:
+                self.on_done(self.report)
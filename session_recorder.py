@@ -0,0 +1,317 @@
+"""通讯会话录制与回放
+
+录制: SessionRecorder 把每个发出的帧 (TX) 和每次收到的数据块 (RX) 连同单调时钟时间戳
+追加到一个紧凑的二进制文件。多个线程可以同时写入。
+读取: SessionReader 用 mmap 打开录制文件，建立记录偏移索引后可以按序号或时间定位，
+适合 GB 级的长时间录制。
+回放: replay() 按录制时的时间间隔 (可加速 / 减速) 把 TX 记录重新发给设备或本地替身。
+
+文件格式 (小端):
+    文件头  "WFRC" | 版本 u16 | 保留 u16 | 录制开始时间 (time.time()) f64
+    记录    时间戳 (相对开始, 纳秒) i64 | 方向 u8 | 长度 u32 | 数据
+方向: 1 = TX, 2 = RX, 3 = 标记 (UTF-8 文本，例如连接 / 断开)
+
+用法:
+    python session_recorder.py info  录制文件
+    python session_recorder.py dump  录制文件 [--start 0] [--count 50]
+    python session_recorder.py replay 录制文件 --host 127.0.0.1 --port 8080 [--speed 1.0]
+"""
+import argparse
+import bisect
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+import protocol
+from sequence_player import SPIN_THRESHOLD, PlaybackReport
+
+# ================= 配置 =================
+MAGIC = b"WFRC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHHd")
+RECORD_HEADER = struct.Struct("<qBI")
+WRITE_BUFFER = 64 * 1024
+
+DIR_TX = 1
+DIR_RX = 2
+DIR_MARK = 3
+DIR_NAMES = {DIR_TX: "TX", DIR_RX: "RX", DIR_MARK: "MARK"}
+
+# t: 相对录制开始的时间 (秒), direction: 方向, data: 数据 (bytes)
+Record = namedtuple("Record", ["t", "direction", "data"])
+
+
+class SessionRecorder:
+    """追加写入录制文件；record_tx / record_rx / mark 可在任意线程调用"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "wb", buffering=WRITE_BUFFER)
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time()))
+        self._start = time.monotonic_ns()
+        self._lock = threading.Lock()
+        self.records = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def _write(self, direction, data):
+        t = time.monotonic_ns() - self._start
+        with self._lock:
+            f = self._file
+            if f is None:
+                return
+            f.write(RECORD_HEADER.pack(t, direction, len(data)))
+            f.write(data)
+            self.records += 1
+            if direction == DIR_TX:
+                self.tx_bytes += len(data)
+            elif direction == DIR_RX:
+                self.rx_bytes += len(data)
+
+    def record_tx(self, data):
+        self._write(DIR_TX, data)
+
+    def record_rx(self, data):
+        self._write(DIR_RX, data)
+
+    def mark(self, text):
+        self._write(DIR_MARK, text.encode("utf-8"))
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SessionReader:
+    """mmap 只读访问录制文件；打开时扫描一遍记录头建立索引 (每条记录 16 字节内存)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"不是有效的录制文件: {path}")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.started_at = FILE_HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"不是有效的录制文件: {path}")
+        self._offsets = array("Q")
+        self._times = array("q")
+        self.truncated = False          # 文件末尾有不完整的记录 (例如录制时程序异常退出)
+        self._build_index(size)
+
+    def _build_index(self, size):
+        mm = self._mm
+        unpack = RECORD_HEADER.unpack_from
+        header = RECORD_HEADER.size
+        offsets = self._offsets
+        times = self._times
+        pos = FILE_HEADER.size
+        while pos + header <= size:
+            t, _, length = unpack(mm, pos)
+            if pos + header + length > size:
+                break
+            offsets.append(pos)
+            times.append(t)
+            pos += header + length
+        self.truncated = pos != size
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        pos = self._offsets[index]
+        t, direction, length = RECORD_HEADER.unpack_from(self._mm, pos)
+        start = pos + RECORD_HEADER.size
+        return Record(t / 1e9, direction, self._mm[start:start + length])
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def index_at(self, t):
+        """时间 t (秒) 及之后的第一条记录的序号"""
+        return bisect.bisect_left(self._times, int(t * 1e9))
+
+    def iter_records(self, start=0, stop=None, direction=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            record = self[i]
+            if direction is None or record.direction == direction:
+                yield record
+
+    @property
+    def duration(self):
+        return self._times[-1] / 1e9 if self._times else 0.0
+
+    def stats(self):
+        counts = dict.fromkeys(DIR_NAMES, 0)
+        sizes = dict.fromkeys(DIR_NAMES, 0)
+        for pos in self._offsets:
+            _, direction, length = RECORD_HEADER.unpack_from(self._mm, pos)
+            counts[direction] = counts.get(direction, 0) + 1
+            sizes[direction] = sizes.get(direction, 0) + length
+        return {
+            "records": len(self),
+            "tx_records": counts[DIR_TX],
+            "tx_bytes": sizes[DIR_TX],
+            "rx_records": counts[DIR_RX],
+            "rx_bytes": sizes[DIR_RX],
+            "marks": counts[DIR_MARK],
+            "duration_s": self.duration,
+            "truncated": self.truncated,
+        }
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+
+def replay(reader, send, speed=1.0, start=0, stop=None, direction=DIR_TX, cancel=None):
+    """按录制时的时间间隔把 direction 方向的记录交给 send(data)，返回 PlaybackReport
+
+    speed > 1 加速回放；cancel 为 threading.Event，置位后停止。调度方式与 sequence_player 相同：
+    目标时刻由起点 + 偏移算出，最后 2 ms 忙等。
+    """
+    cancel = cancel or threading.Event()
+    clock = time.perf_counter
+    errors = []
+    sent = 0
+    base = None
+    t0 = clock()
+    for record in reader.iter_records(start, stop, direction):
+        if base is None:
+            base = record.t
+        target = t0 + (record.t - base) / speed
+        remaining = target - clock()
+        if remaining > SPIN_THRESHOLD and cancel.wait(remaining - SPIN_THRESHOLD):
+            break
+        while clock() < target:
+            time.sleep(0)
+        if cancel.is_set():
+            break
+        now = clock()
+        send(record.data)
+        errors.append(now - target)
+        sent += 1
+    return PlaybackReport(errors, sent, 0, cancel.is_set(), clock() - t0)
+
+
+def _format_record(index, record):
+    name = DIR_NAMES.get(record.direction, str(record.direction))
+    if record.direction == DIR_MARK:
+        body = record.data.decode("utf-8", "replace")
+    else:
+        body = record.data.hex(" ").upper()
+    return f"{index:>8} {record.t:12.6f} {name:<4} {len(record.data):>5}  {body}"
+
+
+def _cmd_info(args):
+    with SessionReader(args.file) as reader:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(reader.started_at))
+        print(f"录制开始: {started}")
+        for key, value in reader.stats().items():
+            print(f"{key}: {value}")
+
+
+def _cmd_dump(args):
+    with SessionReader(args.file) as reader:
+        start = reader.index_at(args.time) if args.time is not None else args.start
+        for i in range(start, min(len(reader), start + args.count)):
+            print(_format_record(i, reader[i]))
+
+
+def _cmd_replay(args):
+    with SessionReader(args.file) as reader:
+        sock = socket.create_connection((args.host, args.port), timeout=5.0)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        parser = protocol.FrameParser()
+        done = threading.Event()
+
+        def receive():
+            # 只统计设备的应答，不做处理
+            sock.settimeout(0.5)
+            while not done.is_set():
+                try:
+                    if not parser.recv_from(sock):
+                        break
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                parser.parse()
+
+        rx = threading.Thread(target=receive, name="replay-rx", daemon=True)
+        rx.start()
+        print(f"回放 {args.file} -> {args.host}:{args.port} (速度 x{args.speed:g})")
+        try:
+            report = replay(reader, sock.sendall, speed=args.speed, start=args.start)
+        except KeyboardInterrupt:
+            report = None
+        time.sleep(0.5) # 等待最后的应答
+        done.set()
+        rx.join(1.0)
+        sock.close()
+    if report is not None:
+        for key, value in report.summary().items():
+            print(f"{key}: {value}")
+    print(f"收到 ACK {parser.acks}, NAK {parser.naks}, 接收 {parser.rx_bytes} 字节")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通讯会话录制文件工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("info", help="显示录制文件概况")
+    p.add_argument("file")
+    p.set_defaults(func=_cmd_info)
+
+    p = sub.add_parser("dump", help="逐条列出记录")
+    p.add_argument("file")
+    p.add_argument("--start", type=int, default=0, help="起始序号")
+    p.add_argument("--time", type=float, help="从该时间 (秒) 开始，优先于 --start")
+    p.add_argument("--count", type=int, default=50)
+    p.set_defaults(func=_cmd_dump)
+
+    p = sub.add_parser("replay", help="按录制时的节奏把 TX 记录发给设备")
+    p.add_argument("file")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--speed", type=float, default=1.0, help="回放速度倍数")
+    p.add_argument("--start", type=int, default=0, help="起始记录序号")
+    p.set_defaults(func=_cmd_replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""595 从机模拟器
+
+在本机 TCP 端口上模拟 WiFi 从机：解析 AA 55 01 帧并校验 CS，合法帧更新模拟的 48 位输出状态
+并回复 ACK (06)，校验失败回复 NAK (15)，保活帧 AA 55 02 02 只回复 ACK。
+长链 (--chips) 同时接受 AA 55 03 分块帧：每块写入影子寄存器，链尾那一块到达时锁存输出，
+偏移或长度超出链长的块回复 NAK。
+可以配置应答延迟、抖动、丢帧 (不回复)、慢 ACK 与主动断开连接，用来在没有硬件的机器上
+测试连接、ACK、看门狗、设备发现和多设备控制。
+
+所有模拟板共用一个 asyncio 事件循环，一个进程可以同时运行数百块板 (每块板一个监听端口，
+或者在 127.0.0.0/8 的不同地址上使用同一端口)。
+discovery_port 不为 None 时同时运行一个 UDP 发现应答器 (discovery.DiscoveryResponder)，
+收到一个广播探测就为每块在线的模拟板回复身份、端口、芯片数与固件版本。
+
+用法:
+    python slave_simulator.py --boards 1 --port 8080
+    python slave_simulator.py --boards 200 --port 9000 --latency 5 --jitter 2 --loss 0.01
+    python slave_simulator.py --boards 50 --hosts 127.0.1.1 --port 8080   # 50 个地址，同一端口
+    python slave_simulator.py --no-discovery                               # 不应答 UDP 发现 (模拟旧固件)
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import time
+
+import discovery
+import protocol
+from io_loop import IoLoop
+
+# ================= 配置 =================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+READ_SIZE = 4096
+FIRMWARE_VERSION = "sim-1.0"
+
+
+class SimConfig:
+    """模拟的链路与固件行为 (时间单位为秒，概率为 0–1)
+
+    latency / jitter: 收到帧到回复 ACK 的延迟及其随机抖动 (均匀分布 ±jitter)
+    loss:             收到合法帧后不回复 (模拟帧在无线链路上丢失)
+    slow_ack_rate / slow_ack_delay: 以一定概率额外延迟 slow_ack_delay 才回复
+    drop_rate:        每收到一帧就以该概率主动断开连接
+    drop_after:       每个连接收到这么多帧后断开 (0 表示不限)
+    ack_ping:         是否回复保活帧 (旧固件不认识 CMD 0x02 时可以关闭)
+    lose_frames:      按序号丢弃的数据帧 (每块板收到的第 n 个数据帧，从 1 开始)，用于构造确定的丢帧
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, slow_ack_rate=0.0, slow_ack_delay=0.5,
+                 drop_rate=0.0, drop_after=0, ack_ping=True, lose_frames=(), seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.slow_ack_rate = slow_ack_rate
+        self.slow_ack_delay = slow_ack_delay
+        self.drop_rate = drop_rate
+        self.drop_after = drop_after
+        self.ack_ping = ack_ping
+        self.lose_frames = frozenset(lose_frames)
+        self.seed = seed
+
+
+class SimulatedBoard:
+    """一块模拟从机，只在事件循环线程中访问"""
+
+    def __init__(self, host=DEFAULT_HOST, port=0, config=None, num_chips=protocol.NUM_CHIPS, rng=None):
+        self.host = host
+        self.port = port
+        self.config = config or SimConfig()
+        self.num_chips = num_chips
+        self.rng = rng or random.Random(self.config.seed)
+        self.state = 0                  # 模拟的输出状态 (位掩码)
+        self.shadow = bytearray(num_chips)  # CMD 0x03 分块写入的移位寄存器，链尾块到达时锁存到 state
+        self.device_id = None           # 默认由地址生成，见 identity()
+        self.enabled = True             # 置为 False 时拒绝新连接并断开现有连接 (模拟设备掉电)
+        self._server = None
+        self._writers = set()
+
+        # 统计
+        self.connections = 0
+        self.frames = 0
+        self.pings = 0
+        self.acks = 0
+        self.naks = 0
+        self.lost = 0
+        self.drops = 0
+        self.naks_range = 0             # 超出链长的分块
+        self.last_frame_at = None
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.disconnect_all()
+
+    def identity(self):
+        """UDP 发现应答的内容"""
+        return {
+            "id": self.device_id or f"SIM-{self.host}:{self.port}",
+            "ip": self.host,
+            "port": self.port,
+            "chips": self.num_chips,
+            "fw": FIRMWARE_VERSION,
+        }
+
+    def disconnect_all(self):
+        for writer in list(self._writers):
+            writer.transport.abort()
+        self._writers.clear()
+
+    def _lose(self, cfg):
+        """当前这个数据帧 (self.frames 已计入) 是否模拟为丢失"""
+        return self.frames in cfg.lose_frames or bool(cfg.loss and self.rng.random() < cfg.loss)
+
+    def _delay(self):
+        cfg = self.config
+        delay = cfg.latency
+        if cfg.jitter:
+            delay += self.rng.uniform(-cfg.jitter, cfg.jitter)
+        if cfg.slow_ack_rate and self.rng.random() < cfg.slow_ack_rate:
+            delay += cfg.slow_ack_delay
+        return max(0.0, delay)
+
+    async def _handle(self, reader, writer):
+        if not self.enabled:
+            writer.transport.abort()
+            return
+        self.connections += 1
+        self._writers.add(writer)
+        loop = asyncio.get_running_loop()
+        cfg = self.config
+        parser = protocol.FrameParser(data_len={
+            protocol.CMD_SET_OUTPUTS: self.num_chips,
+            protocol.CMD_PING: 0,
+            protocol.CMD_SET_OUTPUTS_EXT: protocol.VAR_LEN,
+        })
+        received = 0
+        # 应答按收到的顺序由一个发送任务发出，延迟只能让后面的应答更晚
+        replies_queue = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send_replies(writer, replies_queue))
+        next_reply = 0.0
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data or not self.enabled:
+                    break
+                bad_before = parser.bad_frames
+                replies = []
+                for event in parser.feed(data):
+                    if event.kind != protocol.EVT_STATUS:
+                        continue
+                    received += 1
+                    if event.cmd == protocol.CMD_SET_OUTPUTS:
+                        self.frames += 1
+                        self.last_frame_at = time.monotonic()
+                        if self._lose(cfg):
+                            self.lost += 1
+                            continue
+                        self.state = int.from_bytes(event.data, "little")
+                        replies.append(protocol.ACK)
+                    elif event.cmd == protocol.CMD_SET_OUTPUTS_EXT:
+                        self.frames += 1
+                        self.last_frame_at = time.monotonic()
+                        offset, chunk = protocol.parse_chain_chunk(event.data)
+                        end = offset + len(chunk)
+                        if end > self.num_chips:
+                            self.naks_range += 1
+                            replies.append(protocol.NAK)
+                            continue
+                        if self._lose(cfg):
+                            self.lost += 1
+                            continue
+                        self.shadow[offset:end] = chunk
+                        if end == self.num_chips:
+                            self.state = int.from_bytes(self.shadow, "little")
+                        replies.append(protocol.ACK)
+                    elif event.cmd == protocol.CMD_PING:
+                        self.pings += 1
+                        if cfg.ack_ping:
+                            replies.append(protocol.ACK)
+                # 校验失败的帧 (CS 与 calculate_checksum 不符) 回复 NAK
+                replies.extend([protocol.NAK] * (parser.bad_frames - bad_before))
+
+                if replies:
+                    next_reply = max(loop.time() + self._delay(), next_reply)
+                    replies_queue.put_nowait((next_reply, bytes(replies)))
+
+                if (cfg.drop_rate and self.rng.random() < cfg.drop_rate) or \
+                        (cfg.drop_after and received >= cfg.drop_after):
+                    self.drops += 1
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            sender.cancel()
+            self._writers.discard(writer)
+            writer.transport.abort()
+
+    async def _send_replies(self, writer, replies_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            at, payload = await replies_queue.get()
+            delay = at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if writer.is_closing():
+                return
+            writer.write(payload)
+            # 只统计真正发出的应答 (断开连接时尚未发出的不计)
+            nak_count = payload.count(protocol.NAK)
+            self.naks += nak_count
+            self.acks += len(payload) - nak_count
+
+    def stats(self):
+        return {
+            "address": f"{self.host}:{self.port}",
+            "state": f"{self.state:#0{self.num_chips * 2 + 2}x}",
+            "connections": self.connections,
+            "active": len(self._writers),
+            "frames": self.frames,
+            "pings": self.pings,
+            "acks": self.acks,
+            "naks": self.naks,
+            "naks_range": self.naks_range,
+            "lost": self.lost,
+            "drops": self.drops,
+        }
+
+
+class SimulatorFarm:
+    """在一个事件循环上运行多块模拟板
+
+    addresses 为 [(host, port), ...]；port 为 0 时由系统分配。可以在 asyncio 中直接
+    await start() / stop()，也可以用 start_background() 在后台 IoLoop 线程中运行 (测试与基准使用)。
+    """
+
+    def __init__(self, addresses, config=None, num_chips=protocol.NUM_CHIPS, discovery_port=None,
+                 discovery_host="0.0.0.0"):
+        self.config = config or SimConfig()
+        rng = random.Random(self.config.seed)
+        self.boards = [SimulatedBoard(host, port, self.config, num_chips, random.Random(rng.random()))
+                       for host, port in addresses]
+        self.discovery_port = discovery_port    # None 表示不应答 UDP 发现，0 表示由系统分配
+        self.discovery_host = discovery_host
+        self.responder = None
+        self.io = None
+
+    @classmethod
+    def on_ports(cls, count, base_port=0, host=DEFAULT_HOST, **kwargs):
+        """count 块板在同一地址的连续端口上 (base_port 为 0 时全部由系统分配)"""
+        return cls([(host, base_port + i if base_port else 0) for i in range(count)], **kwargs)
+
+    @classmethod
+    def on_hosts(cls, count, first_host="127.0.1.1", port=DEFAULT_PORT, **kwargs):
+        """count 块板在连续的回环地址上使用同一端口，用来测试网段扫描"""
+        start = ipaddress.IPv4Address(first_host)
+        return cls([(str(start + i), port) for i in range(count)], **kwargs)
+
+    @property
+    def addresses(self):
+        return [board.address for board in self.boards]
+
+    async def start(self):
+        await asyncio.gather(*(board.start() for board in self.boards))
+        if self.discovery_port is not None:
+            self.responder = await discovery.DiscoveryResponder.start(
+                lambda: [b.identity() for b in self.boards if b.enabled],
+                self.discovery_host, self.discovery_port)
+            self.discovery_port = self.responder.port
+        return self
+
+    async def stop(self):
+        if self.responder is not None:
+            self.responder.close()
+            self.responder = None
+        await asyncio.gather(*(board.stop() for board in self.boards))
+
+    def start_background(self):
+        """在后台线程的事件循环中启动，返回时所有端口已在监听"""
+        self.io = IoLoop("slave-simulator").start()
+        self.io.run(self.start(), timeout=30.0)
+        return self
+
+    def stop_background(self):
+        if self.io is None:
+            return
+        self.io.run(self.stop(), timeout=5.0)
+        self.io.stop()
+        self.io = None
+
+    def call(self, func, *args):
+        """在事件循环线程中执行 func (用于修改模拟板状态，例如模拟掉电)"""
+        if self.io is None:
+            return func(*args)
+
+        async def run():
+            return func(*args)
+        return self.io.run(run(), timeout=5.0)
+
+    def stats(self):
+        totals = dict.fromkeys(("connections", "frames", "pings", "acks", "naks", "lost", "drops"), 0)
+        for board in self.boards:
+            for key in totals:
+                totals[key] += getattr(board, key)
+        totals["boards"] = len(self.boards)
+        if self.responder is not None:
+            totals["discovery_probes"] = self.responder.probes
+        return totals
+
+
+async def _serve(args):
+    config = SimConfig(
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        loss=args.loss,
+        slow_ack_rate=args.slow_ack_rate,
+        slow_ack_delay=args.slow_ack_delay / 1000.0,
+        drop_rate=args.drop_rate,
+        drop_after=args.drop_after,
+        ack_ping=not args.no_ping_ack,
+        seed=args.seed,
+    )
+    discovery_port = None if args.no_discovery else args.discovery_port
+    if args.hosts:
+        farm = SimulatorFarm.on_hosts(args.boards, args.hosts, args.port, config=config, num_chips=args.chips,
+                                      discovery_port=discovery_port)
+    else:
+        farm = SimulatorFarm.on_ports(args.boards, args.port, args.host, config=config, num_chips=args.chips,
+                                      discovery_port=discovery_port)
+    await farm.start()
+    first, last = farm.boards[0], farm.boards[-1]
+    print(f"已启动 {len(farm.boards)} 块模拟板: {first.host}:{first.port} ... {last.host}:{last.port}")
+    if farm.responder is not None:
+        print(f"UDP 发现应答端口: {farm.discovery_port}")
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            stats = farm.stats()
+            print(f"{time.strftime('%H:%M:%S')} 连接 {stats['connections']}, 帧 {stats['frames']}, "
+                  f"保活 {stats['pings']}, ACK {stats['acks']}, NAK {stats['naks']}, "
+                  f"丢弃 {stats['lost']}, 断开 {stats['drops']}")
+            if args.boards == 1:
+                print(f"    输出状态: {farm.boards[0].stats()['state']}")
+    finally:
+        await farm.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="595 从机模拟器")
+    parser.add_argument("--boards", type=int, default=1, help="模拟板数量")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址 (按端口区分各板时)")
+    parser.add_argument("--hosts", metavar="FIRST_IP", help="各板使用从 FIRST_IP 开始的连续地址与同一端口")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="第一块板的端口 (0 为自动分配)")
+    parser.add_argument("--chips", type=int, default=protocol.NUM_CHIPS, help="每块板的 595 数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="应答延迟 (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="应答延迟抖动 (ms)")
+    parser.add_argument("--loss", type=float, default=0.0, help="丢帧概率 (不回复 ACK)")
+    parser.add_argument("--slow-ack-rate", type=float, default=0.0, help="慢 ACK 概率")
+    parser.add_argument("--slow-ack-delay", type=float, default=500.0, help="慢 ACK 额外延迟 (ms)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="每帧主动断开连接的概率")
+    parser.add_argument("--drop-after", type=int, default=0, help="每个连接收到 N 帧后断开")
+    parser.add_argument("--no-ping-ack", action="store_true", help="不回复保活帧 (模拟旧固件)")
+    parser.add_argument("--seed", type=int, help="随机数种子")
+    parser.add_argument("--discovery-port", type=int, default=discovery.DISCOVERY_PORT, help="UDP 发现应答端口")
+    parser.add_argument("--no-discovery", action="store_true", help="不应答 UDP 发现 (模拟旧固件)")
+    parser.add_argument("--report", type=float, default=5.0, help="统计输出间隔 (秒)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""测试公共设置：模块都在仓库根目录，直接导入"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+"""DeviceLink：连接时探测保活帧的应答，决定空闲时发送的保活帧"""
+import time
+
+import pytest
+
+import device_link
+import protocol
+import slave_simulator
+from device_link import DeviceLink
+from io_loop import IoLoop
+
+
+@pytest.fixture
+def io():
+    loop = IoLoop("test-io").start()
+    yield loop
+    loop.stop()
+
+
+def _connect(io, ack_ping):
+    farm = slave_simulator.SimulatorFarm.on_ports(
+        1, config=slave_simulator.SimConfig(ack_ping=ack_ping)).start_background()
+    events = []
+    link = DeviceLink(io, on_event=lambda event, detail: events.append(event), auto_reconnect=False)
+    link.connect(*farm.addresses[0]).result(2.0)
+    return farm, link, events
+
+
+@pytest.mark.parametrize("ack_ping", [True, False])
+def test_idle_link_stays_connected(io, ack_ping):
+    farm, link, events = _connect(io, ack_ping)
+    try:
+        assert link.ping_acked is ack_ping
+        mask = 0x0102030405
+        assert link.submit(protocol.FrameEncoder().encode_mask(mask)).result(1.0).delivered
+        frames = farm.boards[0].frames
+        # 连接时还没有 RTT，第一次定时在 2 秒后；之后掉线判定取下限 1 秒，保活帧必须得到应答
+        time.sleep(3.0)
+        assert link.connected
+        assert device_link.LOST not in events
+        assert link.liveness.probes_sent > 0
+        board = farm.boards[0]
+        if ack_ping:
+            assert board.pings > 1 and board.frames == frames
+        else:
+            # 不回复保活帧的固件：重发最近的状态帧作为保活，输出状态不变
+            assert board.frames > frames and board.state == mask
+    finally:
+        link.stop()
+        farm.stop_background()
+
+
+def test_no_probe_before_any_state_is_sent(io):
+    farm, link, events = _connect(io, ack_ping=False)
+    try:
+        # 没有提交过状态时没有可以安全重发的帧，不发探测，也不能判定掉线
+        time.sleep(3.0)
+        assert link.connected
+        assert link.liveness.probes_sent == 0
+        assert farm.boards[0].frames == 0
+    finally:
+        link.stop()
+        farm.stop_background()
+
+
+def test_silent_device_is_declared_dead(io):
+    farm, link, events = _connect(io, ack_ping=True)
+    try:
+        assert link.submit(protocol.PING_FRAME).result(1.0).delivered
+        farm.boards[0].config.ack_ping = False      # 设备不再应答，TCP 连接仍在
+        deadline = time.monotonic() + 5.0
+        while device_link.LOST not in events and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert device_link.LOST in events
+        assert not link.connected
+    finally:
+        link.stop()
+        farm.stop_background()
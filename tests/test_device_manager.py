@@ -0,0 +1,71 @@
+"""多设备连接管理：共享 IoLoop 上的多块模拟板，按设备发送、广播与状态"""
+import threading
+
+import pytest
+
+import device_manager
+import protocol
+import slave_simulator
+from device_manager import DeviceManager
+from io_loop import IoLoop
+
+BOARDS = 4
+
+
+@pytest.fixture
+def farm():
+    farm = slave_simulator.SimulatorFarm.on_ports(BOARDS).start_background()
+    yield farm
+    farm.stop_background()
+
+
+@pytest.fixture
+def manager(farm):
+    io = IoLoop("test-io").start()
+    manager = DeviceManager(io)
+    for i, address in enumerate(farm.addresses):
+        manager.add_device(i, address)
+    yield manager
+    manager.close()
+    io.stop()
+
+
+def _delivered(futures):
+    return [f.result(2.0).delivered for f in futures.values()]
+
+
+def test_send_many_and_broadcast(farm, manager):
+    threads = threading.active_count()
+    assert manager.connect_all().result(5.0) == {i: True for i in range(BOARDS)}
+    encoder = protocol.FrameEncoder()
+
+    updates = {i: bytes(encoder.encode_mask(0x10 + i)) for i in range(BOARDS)}
+    assert all(_delivered(manager.send_many(updates)))
+    assert [b.state for b in farm.boards] == [0x10 + i for i in range(BOARDS)]
+
+    assert all(_delivered(manager.broadcast(encoder.encode_mask(0xABCD))))
+    assert [b.state for b in farm.boards] == [0xABCD] * BOARDS
+    assert threading.active_count() == threads      # 设备数与连接数都不增加线程
+
+    status = manager.status()
+    assert [status[i]["state"] for i in range(BOARDS)] == [device_manager.CONNECTED] * BOARDS
+    assert all(status[i]["delivered"] == 2 for i in range(BOARDS))
+    assert status[0]["address"] == farm.addresses[0]
+
+
+def test_status_reports_each_device(farm, manager):
+    manager.connect(1).result(2.0)
+    manager.link(1).auto_reconnect = False
+    manager.connect(2).result(2.0)
+    farm.call(farm.boards[2].disconnect_all)
+    manager.disconnect(1).result(2.0)
+    states = {name: s["state"] for name, s in manager.status().items()}
+    assert states[0] == device_manager.DISCONNECTED          # 没有连接过
+    assert states[1] == device_manager.DISCONNECTED          # 主动断开
+    assert states[2] in (device_manager.RECONNECTING, device_manager.CONNECTED)   # 掉线后自动重连
+    assert states[3] == device_manager.DISCONNECTED
+
+
+def test_duplicate_device_name_is_rejected(manager):
+    with pytest.raises(ValueError):
+        manager.add_device(0)
@@ -0,0 +1,31 @@
+"""本机地址与网段：按接口列表选择，不向外网地址建立连接"""
+import device_scanner
+from device_scanner import Interface
+
+INTERFACES = [
+    Interface("docker0", "172.17.0.1", "255.255.0.0"),
+    Interface("eth1", "169.254.3.4", "255.255.0.0"),
+    Interface("wlan0", "192.168.4.20", "255.255.255.0"),
+]
+
+
+def _route_table(tmp_path, monkeypatch, default_iface):
+    table = tmp_path / "route"
+    table.write_text("Iface\tDestination\tGateway\n"
+                     f"{default_iface}\t00000000\t0104A8C0\n"
+                     "docker0\t000011AC\t00000000\n")
+    monkeypatch.setattr(device_scanner, "ROUTE_TABLE", str(table))
+
+
+def test_default_route_interface_is_preferred(tmp_path, monkeypatch):
+    _route_table(tmp_path, monkeypatch, "wlan0")
+    assert device_scanner.get_local_ip(INTERFACES) == "192.168.4.20"
+    # 大于 /24 的网段只扫描接口地址所在的 /24
+    assert device_scanner.local_networks(interfaces=INTERFACES) == [
+        "192.168.4.0/24", "172.17.0.0/24", "169.254.3.0/24"]
+
+
+def test_without_route_table_private_beats_link_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(device_scanner, "ROUTE_TABLE", str(tmp_path / "missing"))
+    assert device_scanner.get_local_ip(INTERFACES[1:]) == "192.168.4.20"
+    assert device_scanner.local_network(interfaces=INTERFACES[1:]) == "192.168.4.0/24"
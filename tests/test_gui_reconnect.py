@@ -0,0 +1,86 @@
+"""界面掉线处理：模拟从机断开连接后走 _on_link_lost，重连后恢复设备最后确认的输出状态
+
+需要图形界面 (没有显示器时跳过)。
+"""
+import json
+import time
+
+import pytest
+
+tk = pytest.importorskip("tkinter")
+
+import slave_simulator
+
+
+def _make_root():
+    try:
+        return tk.Tk()
+    except tk.TclError as e:
+        pytest.skip(f"没有图形界面: {e}")
+
+
+def _pump(root, predicate, timeout=5.0):
+    """运行 Tk 事件循环直到 predicate() 为真"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        root.update()
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def board():
+    farm = slave_simulator.SimulatorFarm.on_ports(1).start_background()
+    yield farm, farm.boards[0]
+    farm.stop_background()
+
+
+@pytest.fixture
+def app(board, tmp_path, monkeypatch):
+    import PC_control_wifi_gui_v0_1 as gui
+
+    farm, sim = board
+    state_file = tmp_path / "state.json"
+    state_file.write_text(json.dumps({
+        "ip": sim.host, "port": sim.port, "auto_connect": True, "auto_reconnect": True,
+        "auto_program": False, "control_api": False,
+    }), encoding="utf-8")
+    monkeypatch.setattr(gui, "STATE_FILE", str(state_file))
+    monkeypatch.setattr(gui, "HOST_HISTORY_FILE", str(tmp_path / "history.json"))
+    monkeypatch.setattr(gui, "LOG_FILE", str(tmp_path / "logs" / "wifi_control.log"))
+    monkeypatch.setattr(gui, "RECORD_DIR", str(tmp_path / "recordings"))
+    root = _make_root()
+    app = gui.WifiControlGUI(root)
+    yield app
+    app.on_close()
+
+
+def test_link_lost_reconnects_and_resyncs(app, board):
+    farm, sim = board
+    root = app.root
+    _pump(root, lambda: app.is_connected)
+
+    app.set_chip_bits(0, True)
+    _pump(root, lambda: sim.state == 0xFF and app.scheduler.acked_mask == 0xFF)
+
+    # 模拟掉电：断开现有连接并拒绝重连，界面应进入“重连中”
+    def power_off():
+        sim.enabled = False
+        sim.disconnect_all()
+    farm.call(power_off)
+    _pump(root, lambda: not app.is_connected)
+    assert app.ui.errors == 0
+    assert app._resync_mask == 0xFF
+    assert app.reconnector.active
+    assert app.btn_connect.cget("text") == "停止重连"
+    assert "正在重连" in app.status_lbl.cget("text")
+
+    # 掉线期间的改动在恢复后补发
+    app.set_chip_bits(1, True)
+    farm.call(setattr, sim, "enabled", True)
+    _pump(root, lambda: app.is_connected)
+    assert app._resync_mask is None
+    assert app.btn_connect.cget("text") == "断开连接"
+    _pump(root, lambda: sim.state == 0xFFFF)
+    assert app.ui.errors == 0
@@ -0,0 +1,115 @@
+"""自适应心跳：空闲时探测、有应答时保持、无应答时判定掉线，以及探测间隔随 RTT 变化"""
+import threading
+import time
+
+import pytest
+
+import liveness
+from io_loop import IoLoop
+from liveness import LivenessMonitor
+from send_pipeline import RttEstimator
+
+FAST = dict(min_interval=0.02, max_interval=0.05, min_timeout=0.1, max_timeout=0.3)
+
+
+@pytest.fixture
+def io():
+    loop = IoLoop("test-io").start()
+    yield loop
+    loop.stop()
+
+
+def _monitor(io, answer, **kwargs):
+    """answer 为 True 时每个探测都立即得到应答；为 None 时 send_probe 返回 None (无法探测)"""
+    dead = threading.Event()
+    monitor = None
+
+    def send_probe():
+        if answer is None:
+            return None
+        if answer:
+            monitor.on_rx()
+        return 4
+
+    monitor = LivenessMonitor(send_probe, lambda silence: dead.set(), io_loop=io, **FAST, **kwargs)
+    return monitor, dead
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_answered_probes_keep_the_link_alive(io, threaded):
+    monitor, dead = _monitor(None if threaded else io, answer=True)
+    monitor.start()
+    try:
+        assert not dead.wait(0.5)
+        assert monitor.probes_sent >= 5
+    finally:
+        monitor.stop()
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_unanswered_probes_declare_the_link_dead(io, threaded):
+    monitor, dead = _monitor(None if threaded else io, answer=False)
+    start = time.monotonic()
+    monitor.start()
+    try:
+        assert dead.wait(1.0)
+        assert time.monotonic() - start >= FAST["max_timeout"] - 0.01
+        assert monitor.probes_sent >= 1
+        assert monitor.detection_time >= FAST["max_timeout"]
+    finally:
+        monitor.stop()
+
+
+def test_no_probe_available_never_declares_dead(io):
+    monitor, dead = _monitor(io, answer=None)
+    monitor.start()
+    try:
+        assert not dead.wait(0.6)
+        assert monitor.probes_sent == 0
+    finally:
+        monitor.stop()
+
+
+def test_traffic_postpones_probes(io):
+    monitor, dead = _monitor(io, answer=True)
+    monitor.start()
+    try:
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            monitor.on_tx()
+            monitor.on_rx()
+            time.sleep(0.005)
+        assert monitor.probes_sent == 0
+    finally:
+        monitor.stop()
+
+
+def test_intervals_follow_the_measured_rtt():
+    rtt = RttEstimator()
+    monitor = LivenessMonitor(lambda: 4, lambda silence: None, rtt=rtt)
+    assert monitor.probe_interval() == liveness.MAX_PROBE_INTERVAL
+    assert monitor.dead_timeout() == liveness.MAX_DEAD_TIMEOUT
+    for _ in range(20):
+        rtt.sample(0.002)
+    assert monitor.probe_interval() == liveness.MIN_PROBE_INTERVAL
+    assert monitor.dead_timeout() == liveness.MIN_DEAD_TIMEOUT
+    for _ in range(5):
+        rtt.backoff()                               # 重传退避不影响掉线判定时间
+    assert monitor.dead_timeout() == liveness.MIN_DEAD_TIMEOUT
+
+
+def test_overslept_deadline_probes_before_declaring_dead():
+    # 连接时按上限定时，醒来时 RTT 已测得、判定时间变短：不能没发探测就判定掉线
+    monitor = LivenessMonitor(lambda: 4, lambda silence: None, min_interval=0.25, max_interval=0.25,
+                              min_timeout=1.0, max_timeout=1.0)
+    now = 100.0
+    monitor.last_rx = now - 2.0
+    monitor.last_tx = now - 1.5                     # 最后一次收到数据之后发过数据帧
+    monitor.first_probe = 0.0
+    assert monitor._check(now)[0] == liveness.DEAD
+    monitor.last_tx = now - 2.5                     # 之后没有发过任何数据：先探测
+    assert monitor._check(now)[0] == liveness.PROBE
+    monitor.last_tx = monitor.first_probe = now     # 刚发出探测：留出重传时间
+    action, wait = monitor._check(now)
+    assert action is None and wait == pytest.approx(0.25)
+    assert monitor._check(now + 0.8)[0] == liveness.DEAD
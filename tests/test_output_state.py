@@ -0,0 +1,38 @@
+"""输出状态存储的撤销 / 重做"""
+import output_state
+from output_state import OutputState
+
+
+def test_undo_redo_roundtrip():
+    state = OutputState(48)
+    state.set_bit(0, 1)
+    state.update(set_bits=0xF0)
+    assert state.undo().mask == 0x01
+    assert state.undo().mask == 0
+    assert state.undo() is None
+    assert state.redo().mask == 0x01
+    assert state.redo().mask == 0xF1
+
+
+def test_undo_skips_steps_already_reverted():
+    state = OutputState(48)
+    state.set_bit(3, 1)
+    state.set_bit(5, 1)
+    # 序列回放 (不计入历史) 已把 bit 5 清掉：撤销 bit 5 这一步没有作用，应直接撤销 bit 3
+    state.set_bit(5, 0, source=output_state.SOURCE_SEQUENCE, record=False)
+    change = state.undo()
+    assert change is not None
+    assert change.mask == 0
+    assert change.changed == 1 << 3
+    assert not state.can_undo()
+    assert state.redo().mask == 1 << 3
+    assert not state.can_redo()
+
+
+def test_undo_only_restores_bits_of_that_step():
+    state = OutputState(48)
+    state.set_mask(0x0F)
+    state.set_mask(0xF3, source=output_state.SOURCE_PROGRAM, record=False)
+    # 撤销只把那一步涉及的低 4 位恢复为修改前的值 (0)，不动烧录切换设置的高 4 位
+    assert state.undo().mask == 0xF0
+    assert state.undo() is None
@@ -0,0 +1,69 @@
+"""烧录结果检测：多阶段日志中以最终结论行为准，中间步骤的 成功 / 失败 不提前下结论"""
+import threading
+
+from programmer_automation import ProgrammerBackend, ResultDetector, parse_result, final_verdict
+
+
+class ScriptedLog(ProgrammerBackend):
+    """按 (延迟秒, 文本) 依次写入消息记录"""
+
+    def __init__(self, lines):
+        self.text = ""
+        self._lock = threading.Lock()
+        for delay, line in lines:
+            timer = threading.Timer(delay, self._append, args=(line,))
+            timer.daemon = True
+            timer.start()
+
+    def _append(self, line):
+        with self._lock:
+            self.text += line + "\r\n"
+
+    def find_error_popup(self):
+        return None
+
+    def read_log_since(self, mark):
+        with self._lock:
+            return self.text[mark:], len(self.text)
+
+
+def _detect(lines, quiet_time=0.3):
+    detector = ResultDetector(ScriptedLog(lines), timeout=5.0, poll_interval=0.01, quiet_time=quiet_time)
+    return detector.wait(0)
+
+
+def test_erase_ok_then_program_failed():
+    result = _detect([
+        (0.0, "开始编程..."),
+        (0.02, "擦除成功"),
+        (0.05, "写入完成"),
+        (0.1, "校验失败"),
+        (0.15, "编程失败，错误代码: 0x1F"),
+    ])
+    assert result.passed is False
+    assert result.code == "0x1F"
+    assert "编程失败" in result.log
+
+
+def test_stage_keywords_wait_for_final_line():
+    result = _detect([
+        (0.0, "擦除成功"),
+        (0.1, "写入成功"),
+        (0.2, "编程成功，用时 180 ms"),
+    ])
+    assert result.passed is True
+    assert result.duration == 0.18
+    assert "编程成功" in result.log
+
+
+def test_no_final_line_decides_after_quiet_period():
+    result = _detect([(0.0, "擦除成功"), (0.05, "校验失败")], quiet_time=0.2)
+    assert result.passed is False
+    assert result.elapsed >= 0.2
+
+
+def test_final_verdict():
+    assert final_verdict("擦除成功\r\n") is None
+    assert final_verdict("擦除成功\r\n编程失败，错误代码: 3\r\n") is False
+    assert final_verdict("Programming passed, time 1.2 s") is True
+    assert parse_result("编程成功，用时 1.5 s") == (True, None, 1.5)
@@ -0,0 +1,110 @@
+"""协议编码与增量解析：FrameParser、FrameEncoder、ChainEncoder"""
+import random
+
+import pytest
+
+import protocol
+from protocol import ChainEncoder, FrameEncoder, FrameParser
+
+
+def _kinds(events):
+    return [e.kind for e in events]
+
+
+def test_acks_split_and_merged_by_tcp_are_counted():
+    parser = FrameParser()
+    events = parser.feed(b"\x06\x06\x15") + parser.feed(b"\x06")
+    assert _kinds(events) == ["ack", "ack", "nak", "ack"]
+    assert (parser.acks, parser.naks) == (3, 1)
+
+
+def test_status_frame_split_across_reads():
+    frame = protocol.build_frame(0x0102030405)
+    parser = FrameParser()
+    assert parser.feed(frame[:4]) == []             # 不完整的帧留到下次
+    events = parser.feed(frame[4:] + b"\x06")
+    assert _kinds(events) == ["status", "ack"]
+    assert events[0].cmd == protocol.CMD_SET_OUTPUTS
+    assert events[0].data == protocol.mask_to_bytes(0x0102030405)
+
+
+def test_bad_checksum_resyncs_on_the_next_header():
+    good = protocol.build_frame(0xFF)
+    bad = bytearray(good)
+    bad[-1] ^= 0xFF
+    parser = FrameParser()
+    events = parser.feed(b"xyz" + bytes(bad) + good)
+    assert [e.kind for e in events if e.kind != "unknown"] == ["status"]
+    assert parser.bad_frames == 1
+    assert parser.frames == 1
+    assert parser.unknown_bytes > 0
+
+
+def test_ack_hidden_in_corrupt_frame_is_still_found():
+    # 校验失败时只跳过 AA，帧内的 06 仍按 ACK 计数
+    parser = FrameParser()
+    events = parser.feed(b"\xaa\x55\x01\x06\x00\x00\x00\x00\x00\x00")
+    assert "ack" in _kinds(events)
+
+
+def test_frame_encoder_matches_reference_and_rejects_out_of_range():
+    encoder = FrameEncoder()
+    for mask in (0, 1, 0xABCDEF, (1 << 48) - 1):
+        assert bytes(encoder.encode_mask(mask)) == protocol.build_frame(mask)
+    with pytest.raises(ValueError):
+        encoder.encode_mask(1 << 48)
+    with pytest.raises(ValueError):
+        encoder.encode_mask(-1)
+
+
+def test_encode_batch_equals_single_encodes():
+    rng = random.Random(1)
+    masks = [rng.getrandbits(48) for _ in range(64)]
+    mixed = [m if i % 2 else protocol.mask_to_bytes(m) for i, m in enumerate(masks)]
+    expected = b"".join(protocol.build_frame(m) for m in masks)
+    encoder = FrameEncoder()
+    assert bytes(encoder.encode_batch(masks)) == expected
+    assert bytes(encoder.encode_batch(mixed)) == expected
+    assert bytes(encoder.encode_batch(masks[:3])) == expected[:3 * protocol.FRAME_LEN]
+    with pytest.raises(ValueError):
+        encoder.encode_batch([b"\x00" * 5])
+
+
+def test_chain_encoder_uses_legacy_frame_for_six_chips():
+    encoder = ChainEncoder(protocol.NUM_CHIPS)
+    assert not encoder.extended
+    frames = encoder.encode_mask(0x123456)
+    assert [bytes(f) for f in frames] == [protocol.build_frame(0x123456)]
+
+
+def test_chain_encoder_chunks_round_trip_through_the_parser():
+    chips = 600
+    mask = random.Random(2).getrandbits(chips * 8)
+    encoder = ChainEncoder(chips)
+    frames = encoder.encode_mask(mask)
+    assert len(frames) == 3                         # 256 + 256 + 88 片
+    assert sum(len(f) for f in frames) == encoder.frame_bytes
+
+    parser = FrameParser()
+    events = parser.feed(b"".join(bytes(f) for f in frames))
+    assert _kinds(events) == ["status"] * 3
+    shadow = bytearray(chips)
+    offsets = []
+    for event in events:
+        assert event.cmd == protocol.CMD_SET_OUTPUTS_EXT
+        offset, chunk = protocol.parse_chain_chunk(event.data)
+        offsets.append(offset)
+        shadow[offset:offset + len(chunk)] = chunk
+    assert offsets == [0, 256, 512]
+    assert int.from_bytes(shadow, "little") == mask
+    assert encoder.data() == bytes(shadow)
+
+
+def test_chain_encoder_reuses_its_frames_and_checks_length():
+    encoder = ChainEncoder(300)
+    first = encoder.encode_mask(1)
+    assert encoder.encode_mask(2) is first          # 同一个帧列表，只改写数据与校验
+    with pytest.raises(ValueError):
+        encoder.encode_bytes(b"\x00" * 299)
+    with pytest.raises(ValueError):
+        encoder.encode_mask(1 << 300 * 8)
@@ -0,0 +1,146 @@
+"""掉线重连：指数退避、重试回调、放弃与取消，以及 DeviceLink 在模拟板断开后自动恢复"""
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+import device_link
+import protocol
+import slave_simulator
+from device_link import DeviceLink
+from io_loop import IoLoop
+from reconnect import Backoff, ReconnectManager
+
+
+@pytest.fixture
+def io():
+    loop = IoLoop("test-io").start()
+    yield loop
+    loop.stop()
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_backoff_grows_with_jitter_and_is_capped():
+    backoff = Backoff(base_delay=0.1, max_delay=1.0, factor=2.0, rng=random.Random(1))
+    ceilings = []
+    for _ in range(8):
+        ceiling = backoff.ceiling()
+        delay = backoff.delay()
+        assert ceiling / 2 <= delay <= ceiling
+        ceilings.append(ceiling)
+    assert ceilings[:5] == pytest.approx([0.1, 0.2, 0.4, 0.8, 1.0])
+    assert ceilings[-1] == 1.0
+    backoff.reset()
+    assert backoff.ceiling() == pytest.approx(0.1)
+
+
+def _manager(io, results, **kwargs):
+    """connect 依次返回 results 中的值 (异常则抛出)；返回 (manager, 记录回调的 dict)"""
+    calls = {"connect": 0, "attempts": [], "recovered": [], "gave_up": []}
+    done = threading.Event()
+    results = list(results)
+
+    async def connect():
+        calls["connect"] += 1
+        result = results.pop(0) if results else True
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def finished(key):
+        def callback(*args):
+            calls[key].append(args)
+            done.set()
+        return callback
+
+    manager = ReconnectManager(
+        io, connect,
+        on_attempt=lambda *args: calls["attempts"].append(args),
+        on_recovered=finished("recovered"),
+        on_gave_up=finished("gave_up"),
+        base_delay=0.01, max_delay=0.05, rng=random.Random(0), **kwargs,
+    ).start()
+    return manager, calls, done
+
+
+def test_retries_until_connect_succeeds(io):
+    manager, calls, done = _manager(io, [OSError("refused"), False, True])
+    assert manager.link_lost("test")
+    assert not manager.link_lost("again")          # 已在重连中
+    assert done.wait(2.0)
+    assert [attempt for attempt, delay, error in calls["attempts"]] == [1, 2]
+    assert isinstance(calls["attempts"][0][2], OSError) and calls["attempts"][1][2] is None
+    outage, attempts = calls["recovered"][0]
+    assert attempts == 3 and outage > 0
+    assert not manager.active
+    assert manager.stats()["recovered"] == 1 and manager.stats()["attempts"] == 3
+
+
+def test_gives_up_after_max_attempts(io):
+    manager, calls, done = _manager(io, [False] * 10, max_attempts=3)
+    manager.link_lost("test")
+    assert done.wait(2.0)
+    assert calls["connect"] == 3
+    assert calls["gave_up"][0][1] == 3 and not calls["recovered"]
+    assert not manager.active and manager.stats()["gave_up"] == 1
+
+
+def test_cancel_stops_reconnecting(io):
+    manager, calls, done = _manager(io, [False] * 1000)
+    manager.link_lost("test")
+    assert _wait(lambda: calls["connect"] >= 2)
+    assert manager.cancel()
+    assert not manager.active
+    time.sleep(0.05)
+    count = calls["connect"]
+    time.sleep(0.2)
+    assert calls["connect"] == count
+    assert not done.is_set()
+
+
+def test_connect_coroutine_is_cancelled_with_the_reconnect(io):
+    started = threading.Event()
+    cancelled = threading.Event()
+
+    async def connect():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    manager = ReconnectManager(io, connect, base_delay=0.01).start()
+    manager.link_lost("test")
+    assert started.wait(2.0)
+    manager.cancel()
+    assert cancelled.wait(2.0)
+
+
+def test_device_link_recovers_after_the_device_drops_the_connection(io):
+    farm = slave_simulator.SimulatorFarm.on_ports(1).start_background()
+    events = []
+    link = DeviceLink(io, on_event=lambda event, detail: events.append((event, detail)))
+    try:
+        link.connect(*farm.addresses[0]).result(2.0)
+        board = farm.boards[0]
+        farm.call(board.disconnect_all)
+        assert _wait(lambda: any(event == device_link.RECOVERED for event, _ in events))
+        kinds = [event for event, _ in events]
+        assert kinds.index(device_link.LOST) < kinds.index(device_link.RECOVERED)
+        assert link.connected and board.connections == 2
+        assert link.submit(protocol.build_frame(0x15)).result(1.0).delivered
+        assert board.state == 0x15
+    finally:
+        link.stop()
+        farm.stop_background()
@@ -0,0 +1,174 @@
+"""发送流水线：在途窗口、ACK 对应、go-back-N 重传与发送失败"""
+import threading
+import time
+
+import pytest
+
+import protocol
+import send_pipeline
+import slave_simulator
+from device_link import DeviceLink
+from io_loop import IoLoop
+from send_pipeline import RttEstimator, SendPipeline
+
+
+def _results(futures, timeout=1.0):
+    return [f.result(timeout) for f in futures]
+
+
+def test_transmit_failure_during_retransmit_finishes_every_frame():
+    sent = []
+
+    def transmit(payload):
+        sent.append(payload)
+        if len(sent) == 6:              # 4 帧首发之后，重传到第 2 帧时连接断开
+            raise OSError("连接已断开")
+
+    errors = []
+    pipeline = SendPipeline(transmit, on_error=errors.append)
+    futures = [pipeline.submit(bytes([i])) for i in range(4)]
+    pipeline.on_ack(1)
+    pipeline.on_nak(1)                  # 剩余 3 帧 go-back-N 重传
+    results = _results(futures)
+    assert [r.delivered for r in results] == [True, False, False, False]
+    assert len(errors) == 1
+    assert pipeline.stats()["in_flight"] == 0
+
+
+def test_chunked_update_is_resent_whole_when_a_chunk_is_lost():
+    # 600 片 = 3 个 CMD 0x03 分块；模拟板丢掉第一块，后两块的 ACK 会被记到前两块上
+    farm = slave_simulator.SimulatorFarm.on_ports(
+        1, config=slave_simulator.SimConfig(lose_frames={1}), num_chips=600).start_background()
+    io = IoLoop("test-io").start()
+    link = DeviceLink(io, auto_reconnect=False)
+    try:
+        link.connect(*farm.addresses[0]).result(2.0)
+        encoder = protocol.ChainEncoder(600)
+        mask = (1 << 600 * 8) - 1 ^ 0xA5
+        frames = encoder.encode_mask(mask)
+        assert len(frames) == 3
+        result = link.submit(frames, context=mask).result(5.0)
+        assert result.delivered
+        assert result.attempts == 2
+        assert farm.boards[0].state == mask
+        assert link.pipeline.stats()["in_flight"] == 0
+    finally:
+        link.stop()
+        io.stop()
+        farm.stop_background()
+
+
+def test_timeout_retransmit_runs_on_the_io_loop():
+    io = IoLoop("test-io").start()
+    sent = []
+    pipeline = SendPipeline(sent.append, io_loop=io).start()
+    try:
+        pipeline.rtt.rto = 0.05
+        future = pipeline.submit(b"\x01")
+        deadline = time.monotonic() + 1.0
+        while len(sent) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sent == [b"\x01", b"\x01"]          # 第一次没有 ACK，超时后重传
+        pipeline.on_ack(1)
+        result = future.result(1.0)
+        assert result.delivered and result.attempts == 2
+        assert not any(t.name == "send-pipeline" for t in threading.enumerate())
+    finally:
+        pipeline.stop()
+        io.stop()
+
+
+def test_window_limits_frames_in_flight():
+    sent = []
+    pipeline = SendPipeline(sent.append, window=3)
+    futures = [pipeline.submit(bytes([i])) for i in range(5)]
+    assert sent == [b"\x00", b"\x01", b"\x02"]
+    assert pipeline.stats()["queued"] == 2
+    pipeline.on_ack(1)                              # 腾出一个位置，下一帧立即发出
+    assert sent[-1] == b"\x03"
+    pipeline.on_ack(3)
+    assert sent[-1] == b"\x04"
+    pipeline.on_ack(1)
+    assert [r.delivered for r in _results(futures)] == [True] * 5
+    assert pipeline.stats()["in_flight"] == 0 and pipeline.stats()["stray_acks"] == 0
+
+
+def test_update_larger_than_window_is_sent_alone():
+    sent = []
+    pipeline = SendPipeline(sent.append, window=2)
+    small = pipeline.submit(b"a")
+    big = pipeline.submit([b"x", b"y", b"z"])
+    assert sent == [b"a"]                           # 分块更新要等在途的全部确认
+    pipeline.on_ack(1)
+    assert sent == [b"a", b"x", b"y", b"z"]
+    pipeline.on_ack(2)
+    assert not big.done()                           # 三块都 ACK 才算确认
+    pipeline.on_ack(1)
+    assert small.result(1.0).delivered and big.result(1.0).delivered
+
+
+def test_nak_resends_everything_in_flight_in_order():
+    sent = []
+    pipeline = SendPipeline(sent.append)
+    futures = [pipeline.submit(bytes([i])) for i in range(3)]
+    pipeline.on_nak(1)
+    assert sent == [b"\x00", b"\x01", b"\x02"] * 2  # go-back-N：按原顺序整体重发
+    pipeline.on_ack(3)
+    results = _results(futures)
+    assert [r.attempts for r in results] == [2, 2, 2]
+    assert pipeline.stats()["retransmits"] == 3 and pipeline.stats()["naks"] == 1
+
+
+def test_update_fails_after_max_retries():
+    pipeline = SendPipeline(lambda payload: None, max_retries=2)
+    future = pipeline.submit(b"\x01")
+    for _ in range(3):
+        pipeline.on_nak(1)
+    result = future.result(1.0)
+    assert not result.delivered and result.attempts == 3
+    assert pipeline.stats()["failed"] == 1
+
+
+def test_rto_follows_rtt_samples_and_backs_off():
+    rtt = RttEstimator()
+    assert rtt.rto == send_pipeline.INITIAL_RTO
+    for _ in range(20):
+        rtt.sample(0.010)
+    assert rtt.srtt == pytest.approx(0.010, rel=0.01)
+    assert rtt.rto == send_pipeline.MIN_RTO         # srtt + 4 * rttvar 低于下限
+    rtt.backoff()
+    assert rtt.rto == 2 * send_pipeline.MIN_RTO
+    for _ in range(10):
+        rtt.backoff()
+    assert rtt.rto == send_pipeline.MAX_RTO
+
+
+def test_retransmitted_frames_do_not_update_rtt():
+    pipeline = SendPipeline(lambda payload: None)
+    pipeline.submit(b"\x01")
+    pipeline.on_nak(1)
+    pipeline.on_ack(1)
+    assert pipeline.rtt.samples == 0                # Karn 算法
+    pipeline.submit(b"\x02")
+    pipeline.on_ack(1)
+    assert pipeline.rtt.samples == 1
+
+
+def test_lossy_link_ends_in_the_last_submitted_state():
+    # 模拟板随机丢掉 10% 的帧：ACK 会错位，但最后的在途更新一定超时重发，最终状态与最后一次提交一致
+    farm = slave_simulator.SimulatorFarm.on_ports(
+        1, config=slave_simulator.SimConfig(loss=0.1, seed=3)).start_background()
+    io = IoLoop("test-io").start()
+    link = DeviceLink(io, auto_reconnect=False)
+    try:
+        link.connect(*farm.addresses[0]).result(2.0)
+        encoder = protocol.FrameEncoder()
+        futures = [link.submit(encoder.encode_mask(mask), context=mask) for mask in range(1, 41)]
+        results = _results(futures, timeout=10.0)
+        assert results[-1].delivered
+        assert farm.boards[0].state == 40
+        assert link.pipeline.stats()["retransmits"] > 0
+    finally:
+        link.stop()
+        io.stop()
+        farm.stop_background()
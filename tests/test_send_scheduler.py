@@ -0,0 +1,34 @@
+"""合并发送调度器：在 IoLoop 上合并、限速与去重"""
+import threading
+import time
+
+from io_loop import IoLoop
+from send_scheduler import SendScheduler
+
+
+def test_requests_are_coalesced_on_the_io_loop():
+    io = IoLoop("test-io").start()
+    sent = []
+    sent_from = set()
+
+    def send(mask):
+        sent.append(mask)
+        sent_from.add(threading.current_thread().name)
+        return True
+
+    scheduler = SendScheduler(send, window=0.05, max_rate=0, io_loop=io).start()
+    try:
+        for mask in range(1, 6):
+            scheduler.request(mask)
+        time.sleep(0.2)
+        assert sent == [5]                          # 窗口内的 5 次变化合并为一帧，只发最新状态
+        assert sent_from == {"test-io"}
+        scheduler.on_result(5, True)
+        scheduler.request(5)                        # 与已确认状态相同，不再发送
+        time.sleep(0.2)
+        assert sent == [5]
+        assert scheduler.stats()["deduped"] == 1
+        assert not any(t.name == "send-scheduler" for t in threading.enumerate())
+    finally:
+        scheduler.stop()
+        io.stop()
@@ -0,0 +1,20 @@
+"""序列回放：发送出错时回放停止，但 on_done 照常收到带错误的结果"""
+from sequence_player import SequencePlayer, Step
+
+
+def test_send_error_still_reports():
+    reports = []
+
+    def send(mask):
+        if mask > 0xFF:
+            raise ValueError("位掩码超出 48 位范围")
+
+    player = SequencePlayer(send, on_done=reports.append)
+    player.play([Step(0.0, 0x01), Step(0.001, 1 << 60), Step(0.002, 0x02)])
+    report = player.wait(2.0)
+    assert not player.running
+    assert reports == [report]
+    assert isinstance(report.error, ValueError)
+    assert report.sent == 1
+    assert "位掩码" in report.summary()["error"]
+
@@ -0,0 +1,19 @@
+"""界面桥：回调出错时经日志记录调用栈，定时器继续运行"""
+from ui_bridge import UiBridge
+
+
+def _fail():
+    raise ValueError("坏数据")
+
+
+def test_callback_error_is_logged_with_traceback():
+    logged = []
+    done = []
+    bridge = UiBridge(root=None, log=logged.append)
+    bridge.post(_fail)
+    bridge.post(done.append, 1)
+    assert bridge.drain() == 2
+    assert done == [1]                  # 出错的回调不影响后面的回调
+    assert bridge.errors == 1
+    assert len(logged) == 1
+    assert "Traceback" in logged[0] and "ValueError: 坏数据" in logged[0] and "_fail" in logged[0]
@@ -0,0 +1,48 @@
+"""批处理模式：sync 遇到未确认的帧时以退出码 1 结束"""
+import pytest
+
+import slave_simulator
+import wifi_cli
+from wifi_cli import BatchSession, Command
+
+
+@pytest.fixture
+def session_on():
+    sessions = []
+
+    def make(config):
+        farm = slave_simulator.SimulatorFarm.on_ports(1, config=config).start_background()
+        session = BatchSession(farm.addresses, quiet=True)
+        sessions.append((session, farm))
+        session.connect()
+        return session
+
+    yield make
+    for session, farm in sessions:
+        session.close()
+        farm.stop_background()
+
+
+SCRIPT = [Command(1, "mask", (0x0F,)), Command(2, "sync", ()), Command(3, "mask", (0xF0,))]
+
+
+def test_sync_with_failed_frame_exits_failed(session_on):
+    session = session_on(slave_simulator.SimConfig(loss=1.0))
+    session.devices[0].link.pipeline.max_retries = 0
+    session.devices[0].link.pipeline.rtt.rto = 0.05
+    assert session.run(SCRIPT) == wifi_cli.EXIT_FAILED
+    assert "未得到确认" in session.error
+    assert session.commands == 2                # sync 失败后不再执行后面的命令
+
+
+def test_sync_timeout_exits_failed(session_on, monkeypatch):
+    monkeypatch.setattr(wifi_cli, "DRAIN_TIMEOUT", 0.1)
+    session = session_on(slave_simulator.SimConfig(latency=0.3))
+    assert session.run(SCRIPT) == wifi_cli.EXIT_FAILED
+    assert "0s 内仍未得到确认" in session.error
+
+
+def test_sync_after_acked_frames_succeeds(session_on):
+    session = session_on(slave_simulator.SimConfig())
+    assert session.run(SCRIPT) == wifi_cli.EXIT_OK
+    assert session.devices[0].delivered == 2
@@ -0,0 +1,145 @@
+"""后台线程与 Tk 主线程之间的桥
+
+后台线程 (I/O 事件循环、发送调度、烧录任务等) 不直接调用 Tk，也不各自 root.after：
+post(callback, *args) 只是把回调放进线程安全的队列，主线程上唯一的一个周期性 after
+定时器每隔 interval 取出并依次执行。定时任务 (例如日志刷新) 用 every() 挂在同一个定时器上。
+
+每次定时器触发时记录它比预定时刻晚了多少 (事件循环延迟)，以及回调从投递到执行的等待时间，
+用来判断界面线程有没有被阻塞。
+"""
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+# ================= 配置 =================
+DEFAULT_INTERVAL = 0.02         # 定时器周期 (秒)
+DEFAULT_BUDGET = 0.05           # 每次最多执行这么久的回调，剩下的留到下一次，避免界面卡顿
+LATENCY_SAMPLES = 1000          # 统计 P99 时保留的最近样本数
+
+
+class UiBridge:
+    """只在主线程中 start / stop；post() 可在任意线程调用
+
+    log(message) 记录回调中抛出的异常 (带调用栈)，为 None 时只计数。
+    """
+
+    def __init__(self, root, interval=DEFAULT_INTERVAL, budget=DEFAULT_BUDGET, log=None):
+        self.root = root
+        self.interval = interval
+        self.budget = budget
+        self.log = log
+        self._queue = queue.SimpleQueue()
+        self._periodic = []             # [周期, 下次执行时刻, 回调]
+        self._after_id = None
+        self._expected = None
+        self._main_thread = threading.current_thread()
+
+        # 统计
+        self.ticks = 0
+        self.posted = 0
+        self.executed = 0
+        self.errors = 0
+        self.max_backlog = 0
+        self._lags = deque(maxlen=LATENCY_SAMPLES)
+        self._delays = deque(maxlen=LATENCY_SAMPLES)
+
+    # ---------- 生命周期 (主线程) ----------
+
+    def start(self):
+        if self._after_id is None:
+            self._expected = time.monotonic() + self.interval
+            self._after_id = self.root.after(int(self.interval * 1000), self._tick)
+        return self
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.drain()
+
+    def every(self, period, callback):
+        """在桥的定时器上每隔 period 秒执行一次 callback (主线程)"""
+        self._periodic.append([period, time.monotonic() + period, callback])
+
+    # ---------- 投递 (任意线程) ----------
+
+    def post(self, callback, *args):
+        """把 callback(*args) 交给主线程执行"""
+        self.posted += 1
+        self._queue.put((time.monotonic(), callback, args))
+
+    def call(self, callback, *args):
+        """在主线程中时直接执行，否则投递"""
+        if threading.current_thread() is self._main_thread:
+            callback(*args)
+        else:
+            self.post(callback, *args)
+
+    # ---------- 定时器 ----------
+
+    def _tick(self):
+        now = time.monotonic()
+        self._lags.append(max(0.0, now - self._expected))
+        self.ticks += 1
+        self.drain(now + self.budget)
+        for task in self._periodic:
+            if now >= task[1]:
+                task[1] = now + task[0]
+                self._run(task[2], ())
+        self._expected = time.monotonic() + self.interval
+        self._after_id = self.root.after(int(self.interval * 1000), self._tick)
+
+    def drain(self, deadline=None):
+        """执行排队的回调，到 deadline 为止 (None 表示全部执行)；返回执行的个数"""
+        backlog = self._queue.qsize()
+        self.max_backlog = max(self.max_backlog, backlog)
+        count = 0
+        while True:
+            try:
+                posted_at, callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._delays.append(time.monotonic() - posted_at)
+            self._run(callback, args)
+            count += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return count
+
+    def _run(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            # 一个回调出错不能让定时器停下
+            self.errors += 1
+            if self.log:
+                self.log(f"界面回调出错: {callback!r}\n{traceback.format_exc().rstrip()}")
+        self.executed += 1
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return 0.0, 0.0, 0.0
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return sum(ordered) / len(ordered) * 1000, p99 * 1000, ordered[-1] * 1000
+
+    def stats(self):
+        lag_avg, lag_p99, lag_max = self._summary(list(self._lags))
+        delay_avg, delay_p99, delay_max = self._summary(list(self._delays))
+        return {
+            "ticks": self.ticks,
+            "posted": self.posted,
+            "executed": self.executed,
+            "errors": self.errors,
+            "backlog": self._queue.qsize(),
+            "max_backlog": self.max_backlog,
+            "lag_avg_ms": lag_avg,
+            "lag_p99_ms": lag_p99,
+            "lag_max_ms": lag_max,
+            "delay_avg_ms": delay_avg,
+            "delay_p99_ms": delay_p99,
+            "delay_max_ms": delay_max,
+        }
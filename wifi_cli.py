@@ -0,0 +1,526 @@
+"""无界面批处理模式
+
+不创建 Tk 窗口，连接一台或多台从机后按顺序执行命令文件或标准输入中的命令，可在测试服务器上
+或脚本中运行。只导入协议、连接与状态存储；烧录自动化只在脚本中出现 program 时才导入。
+
+每条修改输出的命令立即编码并提交到该设备的发送流水线，不等待上一帧的 ACK (在途帧数受流水线
+窗口限制)；wait 按脚本时间轴计时 (从上一次 wait 的目标时刻算起，命令本身的耗时不会累积成漂移)；
+sync 等待之前发出的帧全部得到确认。结束时输出每台设备的帧数、确认 / 失败 / 重传次数与 RTT。
+
+用法:
+    python wifi_cli.py -d 192.168.4.1 commands.txt
+    python wifi_cli.py -d 127.0.0.1:9000 -d 127.0.0.1:9001 --chips 12 - < commands.txt
+    python wifi_cli.py -d 192.168.4.1 -c "all off" -c "bit 12 on" -c "wait 50ms" -c "program"
+
+命令 (每行一条，# 之后为注释，芯片与位序号从 0 开始):
+    set <芯片> <值>          设置一片 595 的 8 路输出，例如 set 3 0xFF
+    bit <序号> on|off|toggle 设置单个输出
+    mask <位掩码>            整体设置全部输出
+    all on|off               全开 / 全关
+    wait <时长>              等待，例如 50ms、1.5s、200us，不带单位时为毫秒
+    sync                     等待之前发出的帧全部得到确认
+    device <序号>|all        之后的命令只发给 -d 指定的第几台设备 / 发给全部设备
+    program [<芯片> <位>]    等待确认与继电器吸合后触发烧录；给出目标时先只接通该路
+
+退出码: 0 全部成功；1 有帧未被确认或烧录失败；2 命令行或脚本错误；3 连接失败；4 执行中掉线。
+"""
+import time
+LAUNCHED_AT = time.perf_counter()   # 启动计时起点，放在其余 import 之前
+
+import argparse
+import concurrent.futures
+import json
+import sys
+import threading
+from collections import deque, namedtuple
+
+import device_link
+import output_state
+import protocol
+from batch_runner import DEFAULT_SETTLE
+from device_manager import DeviceManager
+from io_loop import IoLoop
+from sequence_player import SPIN_THRESHOLD
+
+# ================= 配置 =================
+DEFAULT_PORT = 8080
+DRAIN_TIMEOUT = 10.0            # 结束或 sync 时等待在途帧确认的最长时间 (秒)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CONNECT = 3
+EXIT_LINK_LOST = 4
+
+ALL = "all"
+
+# line: 脚本中的行号 (0 表示来自命令行 -c), op: 命令名, args: 解析后的参数
+Command = namedtuple("Command", ["line", "op", "args"])
+
+_SWITCH = {"on": 1, "1": 1, "off": 0, "0": 0, "toggle": None}
+_UNITS = (("ms", 1e-3), ("us", 1e-6), ("s", 1.0))
+
+
+class ScriptError(ValueError):
+    """脚本中的命令无法解析或参数超出范围"""
+
+
+class SyncError(RuntimeError):
+    """sync 时有帧超时没有结果或最终未被确认 (退出码 1)"""
+
+
+# ---------- 脚本解析 ----------
+
+def parse_duration(text):
+    """"50ms" / "1.5s" / "200us" / "20" (毫秒) -> 秒"""
+    text = text.strip().lower()
+    for suffix, scale in _UNITS:
+        if text.endswith(suffix):
+            value = float(text[:-len(suffix)])
+            break
+    else:
+        value, scale = float(text), 1e-3
+    if value < 0:
+        raise ValueError("时长不能为负数")
+    return value * scale
+
+
+def _parse_int(text):
+    return int(text.replace("_", ""), 0)
+
+
+def parse_command(text, num_chips, devices=1, line=0):
+    """解析一行命令，空行与注释返回 None；格式或范围错误时抛出 ScriptError"""
+    text = text.split("#", 1)[0].strip()
+    if not text:
+        return None
+    words = text.split()
+    op, args = words[0].lower(), words[1:]
+    num_bits = num_chips * protocol.BITS_PER_CHIP
+    try:
+        if op == "set" and len(args) == 2:
+            chip, value = _parse_int(args[0]), _parse_int(args[1])
+            if not 0 <= chip < num_chips:
+                raise ValueError(f"芯片序号超出范围 (0–{num_chips - 1})")
+            if not 0 <= value <= 0xFF:
+                raise ValueError("一片的输出值应在 0x00–0xFF 之间")
+            return Command(line, op, (chip, value))
+        if op == "bit" and len(args) == 2:
+            index = _parse_int(args[0])
+            if not 0 <= index < num_bits:
+                raise ValueError(f"位序号超出范围 (0–{num_bits - 1})")
+            if args[1].lower() not in _SWITCH:
+                raise ValueError("应为 on / off / toggle")
+            return Command(line, op, (index, _SWITCH[args[1].lower()]))
+        if op == "mask" and len(args) == 1:
+            mask = _parse_int(args[0])
+            if not 0 <= mask < 1 << num_bits:
+                raise ValueError(f"位掩码超出 {num_bits} 位")
+            return Command(line, op, (mask,))
+        if op == "all" and len(args) == 1 and args[0].lower() in ("on", "off"):
+            return Command(line, "mask", ((1 << num_bits) - 1 if args[0].lower() == "on" else 0,))
+        if op == "wait" and len(args) == 1:
+            return Command(line, op, (parse_duration(args[0]),))
+        if op == "sync" and not args:
+            return Command(line, op, ())
+        if op == "device" and len(args) == 1:
+            if args[0].lower() == ALL:
+                return Command(line, op, (ALL,))
+            index = int(args[0])
+            if not 0 <= index < devices:
+                raise ValueError(f"设备序号超出范围 (0–{devices - 1})")
+            return Command(line, op, (index,))
+        if op == "program" and len(args) in (0, 2):
+            if not args:
+                return Command(line, op, (None, None))
+            chip, bit = int(args[0]), int(args[1])
+            if not (0 <= chip < num_chips and 0 <= bit < protocol.BITS_PER_CHIP):
+                raise ValueError(f"目标超出范围: 芯片 {chip}, 位 {bit}")
+            return Command(line, op, (chip, bit))
+    except ValueError as e:
+        raise ScriptError(f"{_where(line)}: {text}: {e}") from None
+    raise ScriptError(f"{_where(line)}: 无法识别的命令: {text}")
+
+
+def _where(line):
+    return f"第 {line} 行" if line else "-c 命令"
+
+
+def read_script(lines, num_chips, devices=1, first_line=1):
+    """逐行解析 (可以是打开的文件或标准输入，读一行执行一行)"""
+    for number, text in enumerate(lines, first_line):
+        command = parse_command(text, num_chips, devices, number)
+        if command is not None:
+            yield command
+
+
+# ---------- 执行 ----------
+
+class _Device:
+    """一台从机：连接、输出状态与发送统计"""
+
+    def __init__(self, session, index, address):
+        self.index = index
+        self.address = address
+        self.name = f"{address[0]}:{address[1]}"
+        self.state = output_state.OutputState(session.num_bits)
+        self.encoder = protocol.ChainEncoder(session.num_chips)
+        self.link = session.manager.add_device(index, address, auto_reconnect=session.reconnect,
+                                               window=session.window)
+        self.session = session
+        self.lost = None                # 掉线原因 (未启用自动重连时)
+        self._lock = threading.Lock()
+        # 主线程执行命令，重连恢复后在事件循环线程中重发，两边共用编码缓冲区
+        self._send_lock = threading.Lock()
+        self._pending = deque()         # 尚未确认的状态帧 Future
+        self.updates = 0
+        self.delivered = 0
+        self.failed = 0
+        self.rtts = []
+
+    def send(self):
+        """把当前状态编码并提交到流水线 (不等待 ACK)"""
+        with self._send_lock:
+            mask = self.state.mask
+            # 多块时全部分块作为一次更新提交，全部 ACK 才算确认，超时时整体重发
+            future = self.link.submit(self.encoder.encode_mask(mask), context=mask)
+            self.updates += 1
+            pending = self._pending
+            pending.append(future)
+            while pending and pending[0].done():
+                pending.popleft()
+        future.add_done_callback(self._on_result)
+
+    def drain(self, timeout=None):
+        """等待已提交的帧全部有结果 (默认最多 DRAIN_TIMEOUT 秒)，返回 (超时仍没有结果的个数, 重传后仍未被确认的个数)"""
+        if timeout is None:
+            timeout = DRAIN_TIMEOUT
+        with self._send_lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        done, not_done = concurrent.futures.wait(pending, timeout)
+        # 直接看结果而不是 self.failed：等待返回时结果回调可能还没执行
+        failed = sum(1 for future in done if not future.result().delivered)
+        return len(not_done), failed
+
+    def _on_result(self, future):
+        result = future.result()
+        with self._lock:
+            if result.delivered:
+                self.delivered += 1
+                self.rtts.append(result.rtt)
+            else:
+                self.failed += 1
+
+    def _on_event(self, event, detail):
+        """DeviceLink 事件 (I/O 事件循环线程)"""
+        if event == device_link.LOST:
+            self.session.message(f"{self.name} 连接中断: {detail}")
+            if not self.link.auto_reconnect:
+                self.lost = detail
+        elif event == device_link.RECOVERED:
+            outage, attempts = detail
+            self.session.message(f"{self.name} 连接已恢复 (中断 {outage * 1000:.0f} ms, 重连 {attempts} 次)，重发当前状态")
+            self.send()
+
+    def stats(self):
+        with self._lock:
+            rtts = sorted(self.rtts)
+            delivered, failed = self.delivered, self.failed
+        pipeline = self.link.pipeline.stats()
+        result = {
+            "device": self.name,
+            "updates": self.updates,
+            "delivered": delivered,
+            "failed": failed,
+            "unconfirmed": self.updates - delivered - failed,
+            "retransmits": pipeline["retransmits"],
+            "naks": pipeline["naks"],
+            "tx_frames": self.link.tx_frames,
+            "tx_bytes": self.link.tx_bytes,
+            "reconnects": self.link.reconnector.recovered,
+        }
+        if rtts:
+            result.update(
+                rtt_avg_ms=sum(rtts) / len(rtts) * 1000,
+                rtt_p50_ms=rtts[len(rtts) // 2] * 1000,
+                rtt_p99_ms=rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))] * 1000,
+                rtt_max_ms=rtts[-1] * 1000,
+            )
+        return result
+
+
+class BatchSession:
+    """无界面执行命令：connect() -> run(commands) -> close()；run 返回退出码
+
+    programmer: 烧录后端名 ("pywinauto" 或 "fake")，第一次执行 program 时才导入自动化模块。
+    """
+
+    def __init__(self, addresses, num_chips=protocol.NUM_CHIPS, window=None, reconnect=False,
+                 programmer="pywinauto", settle=DEFAULT_SETTLE, out=None, quiet=False):
+        self.num_chips = num_chips
+        self.num_bits = num_chips * protocol.BITS_PER_CHIP
+        self.window = window
+        self.reconnect = reconnect
+        self.programmer_backend = programmer
+        self.settle = settle
+        self.out = out or sys.stderr
+        self.quiet = quiet
+        self.io = IoLoop("cli-io").start()
+        # 全部设备的连接共用一个事件循环，设备按 -d 的序号登记
+        self.manager = DeviceManager(self.io, on_event=self._on_device_event)
+        self.devices = [_Device(self, i, address) for i, address in enumerate(addresses)]
+        self.targets = self.devices
+        self.programmer = None
+
+        # 统计
+        self.commands = 0
+        self.programs = 0
+        self.program_failures = 0
+        self.waits_late = 0
+        self.max_wait_late = 0.0
+        self.connect_time = None
+        self.startup_time = None        # 进程启动到全部设备连上
+        self.run_time = None
+        self.error = None
+
+    def message(self, text):
+        if not self.quiet:
+            print(text, file=self.out, flush=True)
+
+    def connect(self, timeout=device_link.CONNECT_TIMEOUT + 1.0):
+        """并行连接全部设备，任何一台失败时抛出 OSError"""
+        start = time.perf_counter()
+        futures = [(d, self.manager.connect(d.index)) for d in self.devices]
+        for device, future in futures:
+            try:
+                future.result(timeout)
+            except (OSError, concurrent.futures.TimeoutError) as e:
+                raise OSError(f"无法连接 {device.name}: {e}") from None
+        self.connect_time = time.perf_counter() - start
+        self.startup_time = time.perf_counter() - LAUNCHED_AT
+        self.message(f"已连接 {len(self.devices)} 台设备 ({self.connect_time * 1000:.0f} ms)")
+
+    def close(self):
+        self.manager.close()
+        self.io.stop()
+
+    def _on_device_event(self, index, event, detail):
+        self.devices[index]._on_event(event, detail)
+
+    def run(self, commands):
+        start = time.perf_counter()
+        self._mark = start              # 上一次 wait 的目标时刻
+        code = EXIT_OK
+        try:
+            for command in commands:
+                self.commands += 1
+                self.execute(command)
+                lost = [d for d in self.devices if d.lost is not None]
+                if lost:
+                    self.error = f"{lost[0].name} 掉线: {lost[0].lost}"
+                    code = EXIT_LINK_LOST
+                    break
+        except ScriptError as e:
+            self.error = str(e)
+            code = EXIT_USAGE
+        except SyncError as e:
+            self.error = str(e)
+            code = EXIT_FAILED
+        drained = [d.drain() for d in self.devices]
+        if any(timed_out for timed_out, failed in drained) and code == EXIT_OK:
+            self.error = f"{DRAIN_TIMEOUT:.0f}s 内仍有帧未得到确认"
+        self.run_time = time.perf_counter() - start
+        if code == EXIT_OK and (self.program_failures or any(failed for timed_out, failed in drained)
+                                or any(d.failed or d.lost for d in self.devices) or self.error):
+            code = EXIT_FAILED
+        return code
+
+    def execute(self, command):
+        op, args = command.op, command.args
+        if op == "set":
+            chip, value = args
+            shift = chip * protocol.BITS_PER_CHIP
+            self._update(lambda old: old & ~(0xFF << shift) | value << shift)
+        elif op == "bit":
+            index, value = args
+            bit = 1 << index
+            if value is None:
+                self._update(lambda old: old ^ bit)
+            elif value:
+                self._update(lambda old: old | bit)
+            else:
+                self._update(lambda old: old & ~bit)
+        elif op == "mask":
+            mask = args[0]
+            self._update(lambda old: mask)
+        elif op == "wait":
+            self._wait(args[0])
+        elif op == "sync":
+            self._sync()
+        elif op == "device":
+            self.targets = self.devices if args[0] == ALL else [self.devices[args[0]]]
+        elif op == "program":
+            self._program(*args)
+
+    def _update(self, func):
+        for device in self.targets:
+            # 状态没有变化时不发送
+            if device.state.modify(func) is not None:
+                device.send()
+
+    def _wait(self, seconds):
+        target = self._mark + seconds
+        now = time.perf_counter()
+        if now > target:
+            # 命令本身已经超过了等待时间，从当前时刻重新开始计时
+            late = now - target
+            self.waits_late += 1
+            self.max_wait_late = max(self.max_wait_late, late)
+            self._mark = now
+            return
+        remaining = target - now
+        if remaining > SPIN_THRESHOLD:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        while time.perf_counter() < target:
+            pass
+        self._mark = target
+
+    def _sync(self):
+        for device in self.devices:
+            timed_out, failed = device.drain()
+            if timed_out:
+                raise SyncError(f"{device.name}: {timed_out} 帧 {DRAIN_TIMEOUT:.0f}s 内仍未得到确认")
+            if failed:
+                raise SyncError(f"{device.name}: {failed} 帧重传 {device.link.pipeline.max_retries} 次后仍未得到确认")
+        self._mark = time.perf_counter()
+
+    def _program(self, chip, bit):
+        if chip is not None:
+            mask = 1 << chip * protocol.BITS_PER_CHIP + bit
+            self._update(lambda old: mask)
+        self._sync()
+        time.sleep(self.settle)
+        if self.programmer is None:
+            self.programmer = self._load_programmer()
+        passed, detail = self.programmer.trigger()
+        self.programs += 1
+        target = "" if chip is None else f"芯片 {chip} 位 {bit} "
+        if passed:
+            self.message(f"烧录成功: {target}{detail}")
+        else:
+            self.program_failures += 1
+            self.message(f"烧录失败: {target}{detail}")
+        self._mark = time.perf_counter()
+
+    def _load_programmer(self):
+        start = time.perf_counter()
+        import programmer_automation
+        if self.programmer_backend == "fake":
+            backend = programmer_automation.FakeProgrammerBackend()
+        else:
+            backend = programmer_automation.PywinautoBackend()
+        session = programmer_automation.AutomationSession(backend, log=self.message)
+        session.warm_up()
+        self.message(f"烧录自动化已加载 ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return session
+
+    def stats(self):
+        return {
+            "commands": self.commands,
+            "startup_ms": None if self.startup_time is None else self.startup_time * 1000,
+            "connect_ms": None if self.connect_time is None else self.connect_time * 1000,
+            "run_s": self.run_time,
+            "programs": self.programs,
+            "program_failures": self.program_failures,
+            "waits_late": self.waits_late,
+            "max_wait_late_ms": self.max_wait_late * 1000,
+            "error": self.error,
+            "devices": [d.stats() for d in self.devices],
+        }
+
+
+def format_report(stats):
+    lines = [f"命令 {stats['commands']} 条, 用时 {stats['run_s'] or 0:.3f}s, "
+             f"连接 {stats['connect_ms'] or 0:.0f} ms, 启动到连接 {stats['startup_ms'] or 0:.0f} ms"]
+    if stats["programs"]:
+        lines.append(f"烧录 {stats['programs']} 次, 失败 {stats['program_failures']} 次")
+    if stats["waits_late"]:
+        lines.append(f"wait 超时 {stats['waits_late']} 次 (最多晚 {stats['max_wait_late_ms']:.1f} ms)")
+    for d in stats["devices"]:
+        line = (f"{d['device']}: 更新 {d['updates']} 次, 确认 {d['delivered']}, 失败 {d['failed']}, "
+                f"重传 {d['retransmits']}, NAK {d['naks']}, 发送 {d['tx_frames']} 帧 {d['tx_bytes']} 字节")
+        if "rtt_avg_ms" in d:
+            line += (f", RTT 平均 {d['rtt_avg_ms']:.2f} ms / P50 {d['rtt_p50_ms']:.2f} ms / "
+                     f"P99 {d['rtt_p99_ms']:.2f} ms / 最大 {d['rtt_max_ms']:.2f} ms")
+        lines.append(line)
+    if stats["error"]:
+        lines.append(f"错误: {stats['error']}")
+    return "\n".join(lines)
+
+
+def _parse_address(text):
+    host, _, port = text.rpartition(":")
+    if not host:
+        return text, DEFAULT_PORT
+    return host, int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="595 从机无界面批处理")
+    parser.add_argument("script", nargs="?", help="命令文件，- 为标准输入")
+    parser.add_argument("-d", "--device", action="append", required=True, metavar="IP[:PORT]",
+                        help=f"从机地址，可重复指定多台 (默认端口 {DEFAULT_PORT})")
+    parser.add_argument("-c", "--command", action="append", default=[], help="直接给出的命令，在脚本之前执行")
+    parser.add_argument("--chips", type=int, default=protocol.NUM_CHIPS, help="每台从机的 595 数量")
+    parser.add_argument("--window", type=int, help="发送流水线的在途帧数上限")
+    parser.add_argument("--reconnect", action="store_true", help="掉线后自动重连并重发当前状态 (默认直接失败)")
+    parser.add_argument("--programmer", choices=("pywinauto", "fake"), default="pywinauto",
+                        help="烧录后端 (fake 为模拟，用于测试)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE * 1000, help="烧录前继电器吸合等待 (ms)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出统计")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出过程信息")
+    args = parser.parse_args(argv)
+    if args.script is None and not args.command:
+        parser.error("需要命令文件、- (标准输入) 或 -c 命令")
+    if not 1 <= args.chips <= protocol.MAX_CHIPS:
+        parser.error(f"芯片数应在 1–{protocol.MAX_CHIPS} 之间")
+    try:
+        addresses = [_parse_address(text) for text in args.device]
+    except ValueError:
+        parser.error("设备地址格式应为 IP[:PORT]")
+
+    def commands():
+        yield from script
+        if args.script == "-":
+            yield from read_script(sys.stdin, args.chips, len(addresses))
+
+    # -c 命令与命令文件在连接之前整体检查，格式错误不会执行到一半；标准输入读一行执行一行
+    try:
+        script = [c for c in (parse_command(text, args.chips, len(addresses)) for text in args.command)
+                  if c is not None]
+        if args.script not in (None, "-"):
+            with open(args.script, encoding="utf-8") as f:
+                script.extend(read_script(f, args.chips, len(addresses)))
+    except (OSError, ScriptError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    session = BatchSession(addresses, args.chips, window=args.window, reconnect=args.reconnect,
+                           programmer=args.programmer, settle=args.settle / 1000.0, quiet=args.quiet)
+    try:
+        try:
+            session.connect()
+        except OSError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_CONNECT
+        code = session.run(commands())
+        stats = session.stats()
+    finally:
+        session.close()
+    print(json.dumps(stats, ensure_ascii=False, indent=2) if args.json else format_report(stats))
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())